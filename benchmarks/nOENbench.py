@@ -0,0 +1,415 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 by Eloi Martinez-Rabert.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+# doctest: +NORMALIZE_WHITESPACE
+# doctest: +SKIP
+
+"""
+Benchmark suite of nOEN with synthetic community datasets (runs offline).
+
+- :func:`synthData` for a synthetic community dataset (inocula and final abundances).
+
+- :func:`measure` for the run time and peak memory of a function.
+
+- :func:`runCase` for the benchmarks of one synthetic dataset.
+
+- :func:`checkParity` for the comparison of nOEN outcomes with the stored reference.
+
+- :func:`baselineOutcomes` for the nOEN outcomes of the baseline implementation (parity reference).
+
+- :func:`kernelParity` for the comparison of Knight's algorithm (D = 2) with the orthant counts of all pairs.
+
+- :func:`compareRuns` for the comparison of two benchmark runs (e.g., two commits).
+
+Usage (from `benchmarks` folder):
+    python nOENbench.py -output base.json
+    python nOENbench.py -output new.json -compare base.json
+    python nOENbench.py -suite full -updateReference
+
+"""
+
+import os
+os.environ.setdefault('MPLBACKEND', 'Agg')
+
+import sys
+import io
+import json
+import time
+import shutil
+import tarfile
+import platform
+import argparse
+import tempfile
+import subprocess
+import tracemalloc
+import contextlib
+
+import numpy as np
+import pandas as pd
+
+pathBench = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(pathBench, '..', 'src', 'nOEN'))
+
+from getData import loadData, createDict, writeResults, combResults, iterComb, rankData
+from stats import nOEN, formalism_Oh, multivarcorr, pairedOrthants, coeffBatch, countBatch
+from plotting import ecologicalGrid
+
+# Synthetic datasets: (name, observations, variables, tie fraction, zero fraction of inocula, infoInocula, dimensions)
+SUITES = {'quick': [('base', 30, 6, 0.0, 0.0, False, 0),
+                    ('ties', 30, 6, 0.5, 0.0, False, 0),
+                    ('inocula', 40, 8, 0.1, 0.4, True, [2, 3, 4])],
+          'full': [('base', 30, 6, 0.0, 0.0, False, 0),
+                   ('ties', 30, 6, 0.5, 0.0, False, 0),
+                   ('inocula', 40, 8, 0.1, 0.4, True, [2, 3, 4]),
+                   ('samples', 400, 6, 0.1, 0.0, False, 0),
+                   ('variables', 40, 12, 0.1, 0.2, True, [2, 3, 4])]}
+
+
+def synthData(numObs, numVar, ties = 0.0, zeros = 0.0, seed = 0):
+    """
+    - :input:`numObs` (int). Number of observations (samples).
+    - :input:`numVar` (int). Number of variables (species).
+    - :input:`ties` (float). Fraction of tied values of each variable (default: 0.0).
+    - :input:`zeros` (float). Fraction of absent species in the inocula (default: 0.0).
+    - :input:`seed` (int). Seed of the random generator (default: 0).
+    - :output:`di` (pd.DataFrame). Inocula (t_0; presence/absence).
+    - :output:`df` (pd.DataFrame). Final abundances (t_max).
+
+    Final abundances are log-normal with pairwise and triple-wise trends
+    between neighbouring species. Tied values are drawn from a few levels
+    and absent species in the inocula are also absent in the final community.
+
+    """
+    rng = np.random.default_rng(seed)
+    z = rng.standard_normal((numObs, numVar))
+    z[:, 1:] += 0.6 * z[:, :-1]
+    z[:, 2:] -= 0.4 * z[:, :-2] * np.sign(z[:, 1:-1])
+    final = np.exp(z)
+    isTie = rng.random((numObs, numVar)) < ties
+    levels = np.quantile(final, [0.2, 0.5, 0.8])
+    final[isTie] = levels[rng.integers(0, len(levels), np.count_nonzero(isTie))]
+    inocula = (rng.random((numObs, numVar)) >= zeros).astype(float)
+    final = np.round(final * inocula, decimals = 6)
+    varNames = ['S' + str(i) for i in range(1, numVar+1)]
+
+    return pd.DataFrame(inocula, columns = varNames), pd.DataFrame(final, columns = varNames)
+
+
+def measure(fn, repeats = 3, setup = None):
+    """
+    - :input:`fn` (function). Function to benchmark (without arguments).
+    - :input:`repeats` (int). Number of timed runs (default: 3).
+    - :input:`setup` (function). Function called before each run, not timed (default: None).
+    - :output:`result` (dict). Minimum and median run time (s) and peak memory (MB, Python allocations).
+
+    The peak memory is measured in a first (warm-up) run, since tracemalloc
+    slows down the timed runs. Messages printed by `fn` are discarded.
+
+    """
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    times = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        with contextlib.redirect_stdout(io.StringIO()):
+            t0 = time.perf_counter()
+            fn()
+            times.append(time.perf_counter() - t0)
+
+    return {'time_min': min(times), 'time_median': float(np.median(times)), 'peak_MB': peak / 2**20, 'repeats': repeats}
+
+
+def outcomes(rDict, Dim = 0):
+    """
+    - :input:`rDict` (dict). Dictionary with dataset and nOEN outcomes.
+    - :input:`Dim` (list). Dimensions tested (default: 0 -> 'All').
+    - :output:`out` (dict). Number of observations, delta and iota coefficients and p-values of each dimension.
+
+    """
+    out = {}
+    for d in (Dim if Dim else range(2, rDict['data']['numVar'] + 1)):
+        if 'D' + str(d) not in rDict['coeff']:
+            continue
+        numObs, rows = [], []
+        for iD in iterComb(rDict, d):
+            entry = combResults(rDict, d, iD)
+            if isinstance(entry['numObs'], list):
+                numObs.append(-1)
+                rows.append(np.full(4 * int(2**d/2), np.nan))
+                continue
+            r = entry['coeffInfo']
+            numObs.append(entry['numObs'])
+            rows.append(np.concatenate([np.ravel(r[key]) * np.ones(int(2**d/2)) for key in ('deltas', 'd_pval', 'iota', 'iota_pval')]))
+        out['D' + str(d) + '_numObs'] = np.array(numObs)
+        out['D' + str(d) + '_coeffs'] = np.array(rows)
+
+    return out
+
+
+def checkParity(name, out, update = False, atol = 1e-9):
+    """
+    - :input:`name` (str). Name of the synthetic dataset.
+    - :input:`out` (dict). Output of :func:`outcomes`.
+    - :input:`update` (bool). Save `out` as the new reference (default: False).
+    - :input:`atol` (float). Absolute tolerance (default: 1e-9).
+    - :output:`parity` (str). 'ok', 'mismatch', 'updated' or 'no reference'.
+
+    """
+    pathRef = os.path.join(pathBench, 'reference')
+    fullPathRef = os.path.join(pathRef, name + '.npz')
+    if update:
+        os.makedirs(pathRef, exist_ok = True)
+        np.savez_compressed(fullPathRef, **out)
+        return 'updated'
+    if not os.path.isfile(fullPathRef):
+        return 'no reference'
+    with np.load(fullPathRef) as ref:
+        if set(ref.files) != set(out):
+            return 'mismatch'
+        for key in ref.files:
+            if ref[key].shape != out[key].shape or not np.allclose(ref[key], out[key], rtol = 0, atol = atol, equal_nan = True):
+                return 'mismatch'
+
+    return 'ok'
+
+
+def baselineOutcomes(fileName, root, Dim = 0, infoInocula = False, commit = None):
+    """
+    - :input:`fileName` (str). Name of the synthetic dataset (Excel file in `root/Data`).
+    - :input:`root` (str). Scratch folder with `Data` and `Results` folders.
+    - :input:`Dim` (list). List with dimensions we want to test (default: 0 -> 'All').
+    - :input:`infoInocula` (bool). Select observations with inocula (default: False).
+    - :input:`commit` (str). Git commit of the baseline implementation (default: None -> First commit of the repository).
+    - :output:`out` (dict). Output of :func:`outcomes` with the outcomes of the baseline implementation.
+
+    `src/nOEN` of the baseline commit is extracted (git) in `root/baseline`
+    and run in another process, so the parity reference does not depend on
+    the implementation being benchmarked.
+
+    """
+    pathRepo = os.path.join(pathBench, '..')
+    if commit is None:
+        commit = subprocess.run(['git', 'rev-list', '--max-parents=0', 'HEAD'], cwd = pathRepo, capture_output = True, text = True, check = True).stdout.split()[-1]
+    pathBase = os.path.join(root, 'baseline')
+    if not os.path.isdir(pathBase):
+        for folder in ('Data', 'Results'):
+            os.makedirs(os.path.join(pathBase, folder))
+        archive = subprocess.run(['git', 'archive', commit, 'src'], cwd = pathRepo, capture_output = True, check = True).stdout
+        with tarfile.open(fileobj = io.BytesIO(archive)) as tar:
+            tar.extractall(pathBase, **({'filter': 'data'} if hasattr(tarfile, 'data_filter') else {}))
+    shutil.copy(os.path.join(root, 'Data', fileName + '.xlsx'), os.path.join(pathBase, 'Data'))
+    fullPathOut = os.path.join(pathBase, 'Results', fileName + '_baseline.npy')
+    script = ('import sys, json, numpy as np\n'
+              'from getData import loadData\n'
+              'from stats import nOEN\n'
+              'fileName, Dim, infoInocula, fullPathOut = sys.argv[1], json.loads(sys.argv[2]), sys.argv[3] == "True", sys.argv[4]\n'
+              'np.save(fullPathOut, nOEN(loadData(fileName), Dim, infoInocula))\n')
+    subprocess.run([sys.executable, '-c', script, fileName, json.dumps(Dim), str(bool(infoInocula)), fullPathOut],
+                   cwd = os.path.join(pathBase, 'src', 'nOEN'), capture_output = True, check = True)
+
+    return outcomes(np.load(fullPathOut, allow_pickle = True).item(), Dim)
+
+
+def kernelParity(numObs = 200, seed = 0):
+    """
+    - :input:`numObs` (int). Number of observations of each dataset (default: 200).
+    - :input:`seed` (int). Seed of the random generator (default: 0).
+    - :output:`parity` (dict). 'ok' or 'mismatch' for each dataset: untied, tied, fully tied (both variables or only one) and with missing values (NaN).
+
+    For D = 2, :func:`stats.multivarcorr` and the dense ranks of nOEN runs
+    (:func:`stats.countBatch`) count the pairs with Knight's algorithm
+    (:func:`stats.kendallCount`). Their outcomes must be equal to those of the
+    orthant counts of all pairs (:func:`stats.formalism_Oh`).
+
+    """
+    rng = np.random.default_rng(seed)
+    tied = rng.integers(0, 5, (numObs, 2)).astype(float)
+    withNaN = tied.copy()
+    withNaN[rng.random((numObs, 2)) < 0.1] = np.nan
+    datasets = {'untied': rng.standard_normal((numObs, 2)), 'tied': tied, 'fullyTied': np.ones((numObs, 2)),
+                'oneTied': np.column_stack([np.ones(numObs), rng.standard_normal(numObs)]), 'nan': withNaN}
+    paired_Oh = pairedOrthants(2)
+    parity = {}
+    for name, data in datasets.items():
+        # Orthant counts of all pairs
+        F, _, _, binomial_untied = formalism_Oh(2, numObs, data, paired_Oh, numObs*(numObs - 1)//2)
+        iota, iota_pval, deltas, d_pval = coeffBatch(2, F[np.newaxis, :], np.array([binomial_untied]), np.array([numObs]))
+        ref = (iota[0], iota_pval[0], deltas[0], d_pval[0])
+        # Knight's algorithm (values and dense ranks)
+        out = multivarcorr(2, data, numObs)[:4]
+        ranks, tiePtr, tieSize = rankData(data)
+        tiePairs = np.array([np.sum(t*(t - 1)//2) for t in np.split(tieSize.astype(np.int64), tiePtr[1:-1])])
+        F, binomial_untied, n = countBatch(2, ranks, np.array([[0, 1]]), tiePairs = tiePairs)
+        iota, iota_pval, deltas, d_pval = coeffBatch(2, F, binomial_untied, n)
+        outRanks = (iota[0], iota_pval[0], deltas[0], d_pval[0])
+        same = all(np.array_equal(np.asarray(a), np.asarray(b), equal_nan = True) for o in (out, outRanks) for a, b in zip(o, ref))
+        parity[name] = 'ok' if same else 'mismatch'
+
+    return parity
+
+
+def runCase(case, root, repeats = 3, workers = 1, update = False, baseline = None):
+    """
+    - :input:`case` (tuple). Synthetic dataset (see `SUITES`).
+    - :input:`root` (str). Scratch folder with `Data` and `Results` folders.
+    - :input:`repeats` (int). Number of timed runs (default: 3).
+    - :input:`workers` (int). Number of worker processes of nOEN (default: 1).
+    - :input:`update` (bool). Update the parity reference with the outcomes of the baseline implementation (see :func:`baselineOutcomes`) (default: False).
+    - :input:`baseline` (str). Git commit of the baseline implementation (default: None -> First commit of the repository).
+    - :output:`result` (dict). Benchmarks of each function.
+
+    """
+    name, numObs, numVar, ties, zeros, infoInocula, Dim = case
+    fileName = 'bench_' + name
+    pathData = os.path.join(root, 'Data')
+    pathResults = os.path.join(root, 'Results')
+    di, df = synthData(numObs, numVar, ties, zeros)
+    with pd.ExcelWriter(os.path.join(pathData, fileName + '.xlsx')) as writer:
+        di.to_excel(writer, sheet_name = 't_0', index = False)
+        df.to_excel(writer, sheet_name = 't_max', index = False)
+
+    def clean():
+        for f in os.listdir(pathResults):
+            if f.startswith(fileName):
+                fullPath = os.path.join(pathResults, f)
+                shutil.rmtree(fullPath) if os.path.isdir(fullPath) else os.remove(fullPath)
+        shutil.rmtree(os.path.join(pathData, '.nOENcache'), ignore_errors = True)
+
+    funcs = {}
+    # Reading data (parsing, no cache)
+    funcs['loadData'] = measure(lambda: loadData(fileName), repeats, clean)
+    # Kernels
+    data = df.to_numpy(dtype = float)
+    for D in (2, 3):
+        N = int(2**D/2)
+        paired_Oh = pairedOrthants(D)
+        funcs['formalism_Oh_D' + str(D)] = measure(lambda: formalism_Oh(N, numObs, data[:, :D], paired_Oh, numObs*(numObs - 1)//2), repeats)
+        funcs['multivarcorr_D' + str(D)] = measure(lambda: multivarcorr(D, data[:, :D], numObs), repeats)
+    # nOEN
+    rDict = {}
+    def runNOEN():
+        with contextlib.redirect_stdout(io.StringIO()):
+            dDict = loadData(fileName)
+        rDict['out'] = nOEN(dDict, Dim, infoInocula, workers)
+    funcs['nOEN'] = measure(runNOEN, repeats, clean)
+    if update:
+        checkParity(name, baselineOutcomes(fileName, root, Dim, infoInocula, baseline), True)
+    parity = checkParity(name, outcomes(rDict['out'], Dim))
+    with contextlib.redirect_stdout(io.StringIO()):
+        createDict('saveDict', rDict['out'], fileName)
+    # Outputs
+    fullPathExcel = os.path.join(pathResults, fileName + '_results.xlsx')
+    funcs['writeResults'] = measure(lambda: writeResults(fileName, Dim), repeats, lambda: os.path.isfile(fullPathExcel) and os.remove(fullPathExcel))
+    fullPathGrid = os.path.join(pathResults, fileName + '_ecologicalGrid')
+    vD = [d for d in (Dim if Dim else range(2, numVar+1)) if d <= 3]
+    funcs['ecologicalGrid'] = measure(lambda: ecologicalGrid(fileName, rDict['out'], vD), repeats, lambda: shutil.rmtree(fullPathGrid, ignore_errors = True))
+    clean()
+
+    return {'case': name, 'numObs': numObs, 'numVar': numVar, 'ties': ties, 'zeros': zeros, 'infoInocula': infoInocula,
+            'Dim': Dim, 'parity': parity, 'funcs': funcs}
+
+
+def compareRuns(base, new, threshold = 0.1):
+    """
+    - :input:`base` (dict). Benchmark run of reference (e.g., previous commit).
+    - :input:`new` (dict). Benchmark run to compare.
+    - :input:`threshold` (float). Relative slow-down flagged as regression (default: 0.1 -> 10%).
+    - :output:`regressions` (list). (case, function, ratio) of each regression.
+
+    """
+    baseCases = {c['case']: c for c in base['cases']}
+    regressions = []
+    print('\n>> Comparing `' + str(base['commit']) + '` (base) and `' + str(new['commit']) + '` (new)')
+    print(' > {:<12}{:<20}{:>12}{:>12}{:>9}{:>12}'.format('Case', 'Function', 'Base (s)', 'New (s)', 'Ratio', 'Peak (MB)'))
+    for c in new['cases']:
+        if c['case'] not in baseCases:
+            continue
+        for fn, r in c['funcs'].items():
+            b = baseCases[c['case']]['funcs'].get(fn)
+            if b is None:
+                continue
+            ratio = r['time_min'] / max(b['time_min'], 1e-12)
+            flag = ' <-' if ratio > 1 + threshold else ''
+            if flag:
+                regressions.append((c['case'], fn, ratio))
+            print(' > {:<12}{:<20}{:>12.4f}{:>12.4f}{:>9.2f}{:>12.1f}{}'.format(c['case'], fn, b['time_min'], r['time_min'], ratio, r['peak_MB'], flag))
+
+    return regressions
+
+
+def gitCommit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], cwd = pathBench, capture_output = True, text = True, check = True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description = 'Benchmark suite of nOEN with synthetic community datasets.')
+    parser.add_argument('-suite', dest = 'suite', default = 'quick', choices = list(SUITES), action = 'store',
+                        help = '[str] Synthetic datasets to benchmark (Default: quick).')
+    parser.add_argument('-cases', dest = 'cases', default = 0, nargs = '+', action = 'store',
+                        help = '[list] Names of the synthetic datasets of the suite to benchmark (Default: 0 -> \'All\').')
+    parser.add_argument('-repeats', dest = 'repeats', default = 3, type = int, action = 'store',
+                        help = '[int] Number of timed runs of each function (Default: 3).')
+    parser.add_argument('-workers', dest = 'workers', default = 1, type = int, action = 'store',
+                        help = '[int] Number of worker processes of nOEN (Default: 1).')
+    parser.add_argument('-output', dest = 'output', default = None, action = 'store',
+                        help = '[str] JSON file where results are saved (Default: None -> Not saved).')
+    parser.add_argument('-compare', dest = 'compare', default = None, action = 'store',
+                        help = '[str] JSON file of a previous run to compare with (Default: None).')
+    parser.add_argument('-threshold', dest = 'threshold', default = 0.1, type = float, action = 'store',
+                        help = '[float] Relative slow-down reported as regression with -compare (Default: 0.1).')
+    parser.add_argument('-updateReference', dest = 'update', default = False, action = 'store_true',
+                        help = '[bool] Save nOEN outcomes of the baseline implementation as the new parity reference (Default: False).')
+    parser.add_argument('-baseline', dest = 'baseline', default = None, action = 'store',
+                        help = '[str] Git commit of the baseline implementation used by -updateReference (Default: None -> First commit of the repository).')
+    args = parser.parse_args()
+
+    cases = [c for c in SUITES[args.suite] if args.cases == 0 or c[0] in args.cases]
+    run = {'commit': gitCommit(), 'date': time.strftime('%Y-%m-%d %H:%M:%S'), 'suite': args.suite, 'workers': args.workers,
+           'python': platform.python_version(), 'numpy': np.__version__, 'pandas': pd.__version__,
+           'platform': platform.platform(), 'cpus': os.cpu_count(), 'cases': []}
+    # Knight's algorithm (D = 2) against the orthant counts of all pairs
+    run['kernelParity'] = kernelParity()
+    print('>> Kernel parity (D = 2): ' + ', '.join(name + ' ' + p for name, p in run['kernelParity'].items()))
+    cwd = os.getcwd()
+    with tempfile.TemporaryDirectory(prefix = 'nOENbench_') as root:
+        # nOEN works with paths relative to `src/nOEN`
+        for folder in ('Data', 'Results', os.path.join('src', 'nOEN')):
+            os.makedirs(os.path.join(root, folder))
+        os.chdir(os.path.join(root, 'src', 'nOEN'))
+        try:
+            for case in cases:
+                print('>> Benchmarking `' + case[0] + '`...')
+                result = runCase(case, root, args.repeats, args.workers, args.update, args.baseline)
+                run['cases'].append(result)
+                for fn, r in result['funcs'].items():
+                    print(' > {:<20}{:>10.4f} s{:>10.1f} MB'.format(fn, r['time_min'], r['peak_MB']))
+                print(' > Parity: ' + result['parity'])
+        finally:
+            os.chdir(cwd)
+    if args.output is not None:
+        with open(args.output, 'w') as f:
+            json.dump(run, f, indent = 1)
+        print('>> Results saved in `' + args.output + '`.')
+    if args.compare is not None:
+        with open(args.compare) as f:
+            base = json.load(f)
+        regressions = compareRuns(base, run, args.threshold)
+        if regressions:
+            print('>> ' + str(len(regressions)) + ' regression(s) found.')
+    if 'mismatch' in run['kernelParity'].values():
+        print('!ParityError: Knight\'s algorithm (D = 2) differs from the orthant counts.')
+        sys.exit(1)
+    if any(c['parity'] == 'mismatch' for c in run['cases']):
+        print('!ParityError: nOEN outcomes differ from the stored reference.')
+        sys.exit(1)
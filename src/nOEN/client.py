@@ -0,0 +1,113 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 by Eloi Martinez-Rabert.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+# doctest: +NORMALIZE_WHITESPACE
+# doctest: +SKIP
+
+"""
+This module contain the client of the nOEN server (see `server.py`). It only
+imports the standard library, so a query does not pay the import of numpy,
+pandas, scipy or matplotlib.
+
+- :func:`parseAddress` for the address of the server (Unix socket or localhost port).
+
+- :func:`submit` for sending one job to the server and waiting for its reply.
+
+"""
+
+import sys
+import json
+import socket
+import argparse
+
+ADDRESS = 'localhost:8765'      # Default address of the nOEN server
+
+
+def parseAddress(address):
+    """
+    - :input:`address` (str). `HOST:PORT` (localhost only) or path of a Unix socket.
+    - :output:`family`, `address`. Socket family and address (tuple for TCP, str for Unix sockets).
+
+    """
+    host, sep, port = address.rpartition(':')
+    if sep and port.isdigit():
+        return socket.AF_INET, (host or 'localhost', int(port))
+
+    return socket.AF_UNIX, address
+
+
+def submit(job, address = ADDRESS, timeout = None):
+    """
+    - :input:`job` (dict). Job, e.g., {'job': 'export', 'fileName': 'template', 'Dim': [2], 'onlySig': True}.
+    - :input:`address` (str). Address of the server (see :func:`parseAddress`) (default: `ADDRESS`).
+    - :input:`timeout` (float). Maximum time (s) waiting for the reply (default: None -> No limit).
+    - :output:`reply` (dict). Reply of the server: `ok`, `time` (s), `log` (messages) and the output of the job (or `error`).
+
+    """
+    family, addr = parseAddress(address)
+    with socket.socket(family, socket.SOCK_STREAM) as sock:
+        sock.settimeout(timeout)
+        sock.connect(addr)
+        with sock.makefile('rwb') as f:
+            f.write(json.dumps(job).encode() + b'\n')
+            f.flush()
+            line = f.readline()
+    if not line:
+        return {'ok': False, 'error': 'Connection closed by the server.'}
+
+    return json.loads(line)
+
+
+# Command Line Interface (CLI)
+parser = argparse.ArgumentParser(description = '> Client of the nOEN server. Sends one job (analyse, export, plot, ...) to a running server (see server.py).')
+parser.add_argument('job', choices = ['load', 'analyse', 'export', 'plot', 'save', 'drop', 'status', 'shutdown'],
+                    help = '[str] Job sent to the server.')
+parser.add_argument('-filename', dest = 'fileName', default = None, action = 'store',
+                    help = '[str] Name of file with data and info (CASE-SENSITIVE).')
+parser.add_argument('-address', dest = 'address', default = ADDRESS, action = 'store',
+                    help = '[str] Address of the server: HOST:PORT (localhost) or path of a Unix socket (Default: ' + ADDRESS + ').')
+parser.add_argument('-dim', dest = 'Dim', default = 0, nargs = '+', type = int, action = 'store',
+                    help = '[list] Dimensions we want to test, write or plot (Default: 0 -> \'All\').')
+parser.add_argument('-infoinocula', dest = 'infoInocula', default = False, action = 'store_true',
+                    help = '[bool] Information of inocula (or time 0) provided (Default: False).')
+parser.add_argument('-varSelect', dest = 'varSelect', default = 0, nargs = '+', action = 'store',
+                    help = '[list] Variables we want to write and/or plot (Default: 0 -> \'All\'; CASE-SENSITIVE).')
+parser.add_argument('-onlysig', dest = 'onlySig', default = False, action = 'store_true',
+                    help = '[bool] Only significant results (p < 0.05) are written and/or plotted (Default: False).')
+parser.add_argument('-format', dest = 'fmt', default = 'xlsx', choices = ['xlsx', 'csv', 'parquet'], action = 'store',
+                    help = '[str] Format of written results (Default: xlsx).')
+parser.add_argument('-lattice', dest = 'lattice', default = False, action = 'store_true',
+                    help = '[bool] Derive the orthant codes of each combination from its parent combination (Default: False).')
+parser.add_argument('-permutations', dest = 'permutations', default = 0, type = int, action = 'store',
+                    help = '[int] Maximum number of permutations for empirical (permutation) p-values (Default: 0).')
+parser.add_argument('-seed', dest = 'seed', default = 0, type = int, action = 'store',
+                    help = '[int] Seed of the permutation test (Default: 0).')
+parser.add_argument('-approxPairs', dest = 'approxPairs', default = 0, type = int, action = 'store',
+                    help = '[int] Approximate mode for D > 2: maximum number of observation pairs sampled (Default: 0 -> Exact).')
+parser.add_argument('-approxTol', dest = 'approxTol', default = 0, type = float, action = 'store',
+                    help = '[float] Approximate mode for D > 2: half-width of the 95%% confidence intervals aimed at (Default: 0 -> Only -approxPairs).')
+parser.add_argument('-force', dest = 'force', default = False, action = 'store_true',
+                    help = '[bool] Analyse again dimensions already in memory, or read the data file again with `load` (Default: False).')
+parser.add_argument('-dataPath', dest = 'dataPath', default = None, action = 'store',
+                    help = '[str] Folder of the data files (Default: None -> Folder of the server).')
+parser.add_argument('-resultsPath', dest = 'resultsPath', default = None, action = 'store',
+                    help = '[str] Folder of the results (Default: None -> Folder of the server).')
+if __name__ == '__main__':
+    args = vars(parser.parse_args())
+    address = args.pop('address')
+    job = {key: value for key, value in args.items() if value is not None}
+    try:
+        reply = submit(job, address)
+    except OSError as e:
+        print('Error: nOEN server not reachable at `' + address + '` (' + str(e) + ').')
+        sys.exit(1)
+    if reply.get('ok'):
+        print(json.dumps({key: value for key, value in reply.items() if key != 'log'}, indent = 1))
+    else:
+        log = reply.get('log', [])
+        print('\n'.join(log))
+        if reply.get('error', '') not in log:
+            print('Error: ' + reply.get('error', ''))
+        sys.exit(1)
@@ -9,221 +9,1079 @@
 """
 This module contain functions to get data for various purposes.
 
+- :func:`setPaths` and :func:`usePaths` for the folders of datasets and results (`PATHS`).
+
+- :func:`askOverwrite` for the overwrite policy of existing results (ask the user, overwrite or keep).
+
+- :func:`saveCheckpoint`, :func:`loadCheckpoint` and :func:`clearCheckpoint` for the checkpoints of a nOEN run (`fileName_checkpoint` folder).
+
 - :func:`createDict` creates and saves the dictionary with all information and data sets from Excel File (nameFile.xlsx).
 
+- :func:`datasetNames` for the datasets of a batch run (names, glob patterns and sheets of one Excel file).
+
+- :func:`readData` for reading the dataset (t_0 and t_max) from Excel, CSV/TSV or Parquet files, with a cache of parsed data.
+
+- :func:`rankData` and :func:`dataRanks` for the rank-compressed dataset (narrowest integer type) and its tie groups.
+
 - :func:`loadData` for getting the whole information and data sets from Excel file (nameFile.xlsx). Please see README file for more information.
 
 - :func:`loadResults` for getting the nOEN outcomes of the data set already analysed and plot them.
 
-- :func:`writeResults` for writing results in Excel file.
+- :func:`saveStore` for saving the nOEN outcomes in the columnar results store (`fileName_store` folder).
+
+- :func:`openStore` for opening the columnar results store (memory-mapped).
+
+- :func:`convertResults` for converting results saved in the legacy `.npy` format to the columnar results store.
+
+- :func:`combResults` for the outcomes of one combination of variables.
+
+- :func:`resultColumns` for the outcomes of all combinations of one dimension as columns.
+
+- :func:`longResults` for the outcomes as one long table (one row per combination and paired orthant).
+
+- :func:`writeResults` for writing results in Excel (streamed), CSV or Parquet file.
+
+- :func:`combRank` and :func:`combUnrank` for addressing a combination of variables by its index (combinatorial number system).
+
+- :func:`combIter` for generating the combinations of one dimension on demand.
+
+- :func:`iterComb` for the combinations of one dimension of a nOEN dictionary.
+
+- :func:`buildIndex`, :func:`combIndex` and :func:`queryCombs` for the inverted index from variables to combinations and queries of results.
+
+- :func:`coeffEntry` creates the `coeff` entry of a combination.
+
+- :func:`orthantTable` for the paired orthants of dimension D (codes, sign labels and iota pairing), shared by all its combinations.
 
 """
 
+import sys
+import os
 import os.path
+import json
+import math
+import hashlib
+import pickle
+import glob
+import shutil
+import contextlib
+import functools
 import pandas as pd
 import numpy as np
-from itertools import combinations as _comb
-from itertools import compress
+from itertools import compress, chain, combinations
+import openpyxl
+from numpy.lib.format import open_memmap
+
+from monitor import message, timed
+
+PATHS = {'data': '../../Data/', 'results': '../../Results/'}      # Folders of datasets and results (relative to `src/nOEN` by default)
+CACHE_VERSION = 1       # Format of the cache of parsed data (see `readData`); increase it when parsing or the cached arrays change
+
+
+def setPaths(data = None, results = None):
+    """
+    - :input:`data` (str). Folder of the datasets (default: None -> Unchanged).
+    - :input:`results` (str). Folder of the results (default: None -> Unchanged).
+
+    """
+    if data is not None:
+        PATHS['data'] = os.path.join(data, '')
+    if results is not None:
+        PATHS['results'] = os.path.join(results, '')
+        os.makedirs(PATHS['results'], exist_ok = True)
+
 
-def createDict(mainKeyName, iDict, info):
+@contextlib.contextmanager
+def usePaths(data = None, results = None):
+    """
+    - :input:`data`, `results` (str). Folders used inside the `with` block (see :func:`setPaths`).
+
+    """
+    previous = dict(PATHS)
+    setPaths(data, results)
+    try:
+        yield
+    finally:
+        PATHS.update(previous)
+
+
+def combRank(iD, numVar):
+    """
+    - :input:`iD` (np.array). Variables of the combination (1-based and sorted).
+    - :input:`numVar` (int). Number of variables.
+    - :output:`rank` (int). Index of the combination among all combinations of len(iD) variables (lexicographic order).
+
+    """
+    D = len(iD)
+    rank = math.comb(numVar, D) - 1
+    for i, c in enumerate(iD):
+        rank -= math.comb(numVar - int(c), D - i)
+
+    return rank
+
+
+def combUnrank(rank, D, numVar):
+    """
+    - :input:`rank` (int). Index of the combination (see :func:`combRank`).
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`numVar` (int). Number of variables.
+    - :output:`iD` (np.array). Variables of the combination (1-based and sorted).
+
+    """
+    m = math.comb(numVar, D) - 1 - int(rank)
+    x = numVar - 1
+    iD = np.empty(D, dtype = int)
+    for i in range(0, D):
+        k = D - i
+        while math.comb(x, k) > m:
+            x -= 1
+        iD[i] = numVar - x
+        m -= math.comb(x, k)
+        x -= 1
+
+    return iD
+
+
+def combIter(numVar, D, start = 0, stop = None):
+    """
+    - :input:`numVar` (int). Number of variables.
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`start` (int). Rank of the first combination (default: 0).
+    - :input:`stop` (int). Rank after the last combination (default: None -> All).
+    - :output:`iD` (np.array). Variables of each combination (1-based and sorted), in lexicographic order.
+
+    """
+    numComb = math.comb(numVar, D)
+    stop = numComb if stop is None else min(stop, numComb)
+    if start >= stop:
+        return
+    iD = combUnrank(start, D, numVar)
+    for _ in range(start, stop):
+        yield iD.copy()
+        # Next combination
+        i = D - 1
+        while i >= 0 and iD[i] == numVar - D + i + 1:
+            i -= 1
+        if i < 0:
+            return
+        iD[i:] = iD[i] + 1 + np.arange(D - i)
+
+
+def buildIndex(numVar, D):
+    """
+    - :input:`numVar` (int). Number of variables.
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :output:`indptr` (np.array). Offsets of the ranks of each variable in `index` (numVar + 1).
+    - :output:`index` (np.array). Ranks (see :func:`combRank`) of the combinations containing each variable (sorted).
+
+    Inverted index of the combinations of dimension D: the combinations
+    containing variable `v` (0-based) are `index[indptr[v]:indptr[v+1]]`.
+
+    """
+    numComb = math.comb(numVar, D)
+    combs = np.fromiter(chain.from_iterable(combinations(range(numVar), D)), dtype = np.int64, count = numComb * D)
+    order = np.argsort(combs, kind = 'stable')
+    index = (order // D).astype(np.int64)
+    indptr = np.zeros(numVar + 1, dtype = np.int64)
+    np.cumsum(np.bincount(combs, minlength = numVar), out = indptr[1:])
+
+    return indptr, index
+
+
+def combIndex(dict_, D):
+    """
+    - :input:`dict_` (dict). Dictionary with dataset and nOEN outcomes.
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :output:`indptr`, `index` (np.array). Inverted index of the combinations of dimension D (see :func:`buildIndex`).
+
+    The index saved with the results store is used (memory-mapped); otherwise
+    it is built once and kept in `dict_['index']`.
+
+    """
+    D_field = 'D' + str(D)
+    cols = dict_.get('store', {}).get(D_field, {})
+    if 'index' in cols:
+        return cols['indptr'], cols['index']
+    indexes = dict_.setdefault('index', {})
+    if D_field not in indexes:
+        indexes[D_field] = buildIndex(dict_['data']['numVar'], D)
+
+    return indexes[D_field]
+
+
+def queryCombs(dict_, D, varSelect = 0, mode = 'any', alpha = None):
+    """
+    - :input:`dict_` (dict). Dictionary with dataset and nOEN outcomes.
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`varSelect` (list). Names of variables (default: 0 -> 'All').
+    - :input:`mode` (str). 'any' (combinations with at least one of the variables) or 'all' (combinations with all the variables) (default: 'any').
+    - :input:`alpha` (float). Only combinations with at least one iota p-value lower than `alpha` (default: None -> No filter).
+    - :output:`ranks` (np.array). Ranks of the matching combinations (sorted; see :func:`combRank`).
+    - :output:`combs` (np.array). Variables of the matching combinations (1-based; combinations x D).
+
+    Uses the inverted index of dimension D (see :func:`combIndex`): the cost
+    is proportional to the number of matching combinations (p-values are
+    read only for them, see :func:`resultColumns`).
+
+    """
+    numVar = dict_['data']['numVar']
+    if varSelect == 0:
+        ranks = np.arange(math.comb(numVar, D), dtype = np.int64)
+    else:
+        indptr, index = combIndex(dict_, D)
+        varNames = list(dict_['data']['varNames'])
+        iVars = [varNames.index(v) for v in varSelect if v in varNames]
+        lists = [np.asarray(index[indptr[v]:indptr[v+1]]) for v in iVars]
+        if mode == 'all':
+            if len(iVars) < len(varSelect) or not lists or len(set(iVars)) > D:
+                ranks = np.zeros(0, dtype = np.int64)
+            else:
+                lists.sort(key = len)
+                ranks = lists[0]
+                for l in lists[1:]:
+                    ranks = np.intersect1d(ranks, l, assume_unique = True)
+        else:
+            ranks = np.unique(np.concatenate(lists)) if lists else np.zeros(0, dtype = np.int64)
+    if alpha is not None:
+        iota_pval = resultColumns(dict_, D, ranks)['iota_pval']
+        ranks = ranks[np.any(iota_pval < alpha, axis = 1)]
+    combs = np.array([combUnrank(r, D, numVar) for r in ranks], dtype = int).reshape(-1, D)
+
+    return ranks, combs
+
+
+def iterComb(dict_, D):
+    """
+    - :input:`dict_` (dict). Dictionary with dataset and information.
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :output:`iD` (np.array). Variables of each combination (1-based and sorted).
+
+    Dictionaries saved by previous versions hold every combination in
+    `comb`; they are used as they are.
+
+    """
+    D_field = 'D' + str(D)
+    if D_field in dict_['comb']:
+        yield from dict_['comb'][D_field]
+    else:
+        yield from combIter(dict_['data']['numVar'], D)
+
+
+def coeffEntry(iD):
+    """
+    - :input:`iD` (np.array). Variables of the combination (1-based and sorted).
+    - :output:`entry` (dict). Empty `coeff` entry of the combination.
+
+    """
+    D = len(iD)
+    relP = 2/(2**D)     # Reliable point (relP = 2/2^D)
+
+    return {'iD': np.array(iD), 'D': D, 'reliablePoint': relP, 'numObs': [], 'coeffInfo': {'deltas': [], 'd_pval': [], 'iota': [], 'iota_pval': []}}
+
+
+@functools.lru_cache(maxsize = 16)
+def orthantTable(D):
+    """
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :output:`table` (dict). Read-only templates of the N = 2^(D-1) paired orthants of dimension D.
+
+    Keys: `paired` (2 x N x D), signs of each paired orthant (1: positive /
+    0: negative; same order as MATLAB); `codes` (2 x N), orthant codes
+    (sum_k sign_k·2^k, see :func:`stats.cachedOrthantCount`); `signs`
+    (2 x N), signs as labels ('[+ - +]', Excel and tables); `arrows` (2 x N),
+    signs as arrows ('↑ ↓ ↑', plots); `iotaPairs` (N-1 x N), the N-1 paired
+    orthants k != j of each paired orthant j (iota coefficients).
+
+    None of them depends on the data, so they are computed once per
+    dimension and results refer to paired orthants by their index (column
+    of `deltas`).
+
+    """
+    D = int(D)
+    N = 2**(D-1)
+    # Sign k of orthant r is 1 - bit k of r (product([1, 0], repeat = D) in reverse column order)
+    sC = (1 - ((np.arange(2**D)[:, np.newaxis] >> np.arange(D)) & 1)).astype(np.int8)
+    paired = np.stack([sC[:N], sC[:N-1:-1]])
+    codes = paired.astype(np.int64) @ (1 << np.arange(D, dtype = np.int64))
+    marks = np.where(paired == 1, '+', '-').reshape(-1, D)
+    signs = np.array(['[' + ' '.join(m) + ']' for m in marks]).reshape(2, N)
+    arrows = np.array([' '.join(m) for m in np.where(marks == '+', '↑', '↓')]).reshape(2, N)
+    iotaPairs = np.arange(N - 1)[:, np.newaxis] + (np.arange(N - 1)[:, np.newaxis] >= np.arange(N))
+    table = {'N': N, 'paired': paired, 'codes': codes, 'signs': signs, 'arrows': arrows, 'iotaPairs': iotaPairs}
+    for a in table.values():
+        if isinstance(a, np.ndarray):
+            a.setflags(write = False)
+
+    return table
+
+
+def askOverwrite(question, overwrite = None):
+    """
+    - :input:`question` (str). Question asked to the user.
+    - :input:`overwrite` (bool). Overwrite policy (default: None -> Ask the user).
+    - :output:`val` (bool). True if existing files can be overwritten.
+
+    """
+    if overwrite is None:
+        val = input(question)
+        return val == 'Y' or val == 'y'
+
+    return bool(overwrite)
+
+
+def createDict(mainKeyName, iDict, info, overwrite = None):
     """
     - :input:`mainKeyName` (str). Mode of dictionary creation ['data', 'comb', 'coeff', 'saveDict'].
     - :input:`iDict` (dict). Dictionary file.
     - :input:`info` (dict). New information included into dictionary file (iDict).
+    - :input:`overwrite` (bool). Overwrite existing results when saving (default: None -> Ask the user).
+
+    Checkpoints of the run (see :func:`saveCheckpoint`) are removed once the
+    results are saved.
 
     """
     if mainKeyName == 'data':
         iDict['data'] = info 
-        print(' > Structure dataset: Done.')
+        message(' > Structure dataset: Done.')
         return iDict      
     elif mainKeyName == 'comb':
         iDict['comb'] = info 
-        print(' > Structure comb: Done.')
+        message(' > Structure comb: Done.')
         return iDict
     elif mainKeyName == 'coeff':
         iDict['coeff'] = info 
-        print(' > Structure coeff: Done.')
+        message(' > Structure coeff: Done.')
         return iDict
     elif mainKeyName == 'saveDict':
-        path = '../../Results/'
-        fullPathSave = path + info + '.npy'
-        if os.path.isfile(fullPathSave):
+        path = PATHS['results']
+        fullPathSave = path + info + '_store/'
+        if os.path.isfile(fullPathSave + 'meta.json'):
             cDict = loadResults(info)
             if cDict['data']['results']:
-                val = input(' > Do you want to overwrite `' + info + '.npy`? [Y/N]: ')
-                if val == 'Y' or val == 'y':
-                    np.save(fullPathSave, iDict)
-                    print(' > Data structure saved - `' + info +'.npy`.')
+                if askOverwrite(' > Do you want to overwrite `' + info + '_store`? [Y/N]: ', overwrite):
+                    saveStore(iDict, info)
+                    message(' > Data structure saved - `' + info +'_store`.')
                 else:
-                    print(' > Data structure not saved. If you don\'t want to overwrite results files, use another name for data Excel.')
+                    message(' > Data structure not saved. If you don\'t want to overwrite results files, use another name for data Excel.')
+                    return
             else:
-                np.save(fullPathSave, iDict)
-                print(' > Data structure saved - `' + info +'.npy`.') 
+                saveStore(iDict, info)
+                message(' > Data structure saved - `' + info +'_store`.') 
+        else:
+            saveStore(iDict, info)
+            message(' > Data structure saved - `' + info +'_store`.')
+        if iDict['data']['results']:
+            clearCheckpoint(info)
+    else:
+        message(' > No expected Structure: `' + mainKeyName + '`')
+
+
+def saveCheckpoint(fileName, runInfo, coeffs, part):
+    """
+    - :input:`fileName` (str). Name of file with data and info.
+    - :input:`runInfo` (dict). Dataset and settings of the run.
+    - :input:`coeffs` (list). (d, iCombi, coeff) of the combinations completed since the previous checkpoint.
+    - :input:`part` (int). Number of the checkpoint.
+
+    Each checkpoint is written to a temporary file and renamed (atomic), so a
+    crash never leaves a partial checkpoint.
+
+    """
+    path = PATHS['results'] + fileName + '_checkpoint/'
+    os.makedirs(path, exist_ok = True)
+    fullPathPart = path + 'part_{:06d}'.format(part)
+    with open(fullPathPart + '.tmp', 'wb') as f:
+        pickle.dump((runInfo, coeffs), f, protocol = pickle.HIGHEST_PROTOCOL)
+    os.replace(fullPathPart + '.tmp', fullPathPart + '.pkl')
+
+
+def loadCheckpoint(fileName, runInfo):
+    """
+    - :input:`fileName` (str). Name of file with data and info.
+    - :input:`runInfo` (dict). Dataset and settings of the run.
+    - :output:`coeffs` (list). (d, iCombi, coeff) of the combinations completed by previous runs.
+    - :output:`numParts` (int). Number of checkpoints.
+
+    Checkpoints of runs with another dataset or settings are discarded.
+
+    """
+    path = PATHS['results'] + fileName + '_checkpoint/'
+    if not os.path.isdir(path):
+        return [], 0
+    parts = sorted(f for f in os.listdir(path) if f.startswith('part_') and f.endswith('.pkl'))
+    coeffs = []
+    for f in parts:
+        with open(path + f, 'rb') as fp:
+            info, partCoeffs = pickle.load(fp)
+        if info != runInfo:
+            message(' > Checkpoints of `' + fileName + '` belong to another dataset or settings: discarded.')
+            clearCheckpoint(fileName)
+            return [], 0
+        coeffs.extend(partCoeffs)
+
+    return coeffs, len(parts)
+
+
+def clearCheckpoint(fileName):
+    shutil.rmtree(PATHS['results'] + fileName + '_checkpoint/', ignore_errors = True)
+
+
+@timed('ingest')
+def datasetNames(patterns, sheets = False):
+    """
+    - :input:`patterns` (list). Names of data files or glob patterns (e.g., 'site_*') in `Data` folder.
+    - :input:`sheets` (bool). One dataset per `t_max_SITE` sheet of each Excel file, named `fileName#SITE` (default: False).
+    - :output:`names` (list). Names of the datasets (see :func:`readData`).
+
+    """
+    names = []
+    for pattern in patterns:
+        if any(c in pattern for c in '*?['):
+            files = glob.glob(PATHS['data'] + pattern + '.*')
+            matches = sorted({os.path.splitext(os.path.basename(f))[0] for f in files if os.path.splitext(f)[1] in ('.xlsx', '.csv', '.tsv', '.parquet')})
+            matches = [name for name in matches if not (name.endswith('_t_0') and name[:-4] in matches)]
         else:
-            np.save(fullPathSave, iDict)
-            print(' > Data structure saved - `' + info +'.npy`.')
+            matches = [pattern]
+        for name in matches:
+            if sheets and os.path.isfile(PATHS['data'] + name + '.xlsx'):
+                wb = openpyxl.load_workbook(PATHS['data'] + name + '.xlsx', read_only = True)
+                sites = [sheet[len('t_max_'):] for sheet in wb.sheetnames if sheet.startswith('t_max_')]
+                wb.close()
+                names += [name + '#' + site for site in sites] if sites else [name]
+            else:
+                names.append(name)
+
+    return list(dict.fromkeys(names))
+
+
+def readData(fileName):
+    """
+    - :input:`fileName` (str). Name of file with data and info (`fileName#SITE`: sheets `t_0_SITE` and `t_max_SITE` of `fileName.xlsx`).
+    - :output:`inocula` (np.array). Inocula (t_0) as contiguous float array.
+    - :output:`final` (np.array). Dataset (t_max) as contiguous float array.
+    - :output:`varNames` (np.array). Names of variables.
+
+    Supported files in `Data` folder:
+        - `fileName.xlsx`. Sheets `t_0` and `t_max` (read in a single pass), or `t_0_SITE` (optional) and `t_max_SITE` for dataset `fileName#SITE`.
+        - `fileName.csv`, `fileName.tsv` or `fileName.parquet`. Table t_max; t_0 (optional) in `fileName_t_0` with the same extension.
+    Parsed arrays are cached in `Data/.nOENcache`, keyed by the cache format (`CACHE_VERSION`) and the content hash of the source file(s).
+
+    """
+    path = PATHS['data']
+    fileName, _, site = fileName.partition('#')
+    for ext in ('.xlsx', '.csv', '.tsv', '.parquet') if not site else ('.xlsx',):
+        if os.path.isfile(path + fileName + ext):
+            break
+    else:
+        message('Error 404: `' + fileName + '` not found in Data folder (.xlsx, .csv, .tsv or .parquet).')
+        sys.exit()
+    sources = [path + fileName + ext]
+    if ext != '.xlsx' and os.path.isfile(path + fileName + '_t_0' + ext):
+        sources.append(path + fileName + '_t_0' + ext)
+    # Cache of parsed data
+    h = hashlib.sha256(('v' + str(CACHE_VERSION) + ext).encode())
+    if site:
+        h.update(('#' + site).encode())
+    for src in sources:
+        with open(src, 'rb') as f:
+            for block in iter(lambda: f.read(2**20), b''):
+                h.update(block)
+    pathCache = path + '.nOENcache/'
+    fullPathCache = pathCache + h.hexdigest() + '.npz'
+    if os.path.isfile(fullPathCache):
+        message(' > Parsed data found in cache.')
+        with np.load(fullPathCache) as c:
+            return c['inocula'], c['final'], c['varNames'].astype(object)
+    # Parsing
+    if ext == '.xlsx' and site:
+        wb = openpyxl.load_workbook(sources[0], read_only = True)
+        sheetNames = [name for name in ('t_0_' + site, 't_max_' + site) if name in wb.sheetnames]
+        wb.close()
+        if 't_max_' + site not in sheetNames:
+            message('Error 404: Sheet `t_max_' + site + '` not found in `' + fileName + '.xlsx`.')
+            sys.exit()
+        sheets = pd.read_excel(sources[0], sheet_name = sheetNames)
+        df = sheets['t_max_' + site]
+        di = sheets.get('t_0_' + site, pd.DataFrame(columns = df.columns))
+    elif ext == '.xlsx':
+        sheets = pd.read_excel(sources[0], sheet_name = ['t_0', 't_max'])
+        di = sheets['t_0']
+        df = sheets['t_max']
     else:
-        print(' > No expected Structure: `' + mainKeyName + '`')
+        if ext == '.parquet':
+            read = pd.read_parquet
+        else:
+            read = lambda f: pd.read_csv(f, sep = ',' if ext == '.csv' else '\t')
+        df = read(sources[0])
+        di = read(sources[1]) if len(sources) > 1 else pd.DataFrame(columns = df.columns)
+    varNames = np.array(df.keys())
+    inocula = np.ascontiguousarray(di.to_numpy(dtype = float))
+    final = np.ascontiguousarray(df.to_numpy(dtype = float))
+    os.makedirs(pathCache, exist_ok = True)
+    with open(fullPathCache + '.tmp', 'wb') as f:
+        np.savez(f, inocula = inocula, final = final, varNames = varNames.astype(str))
+    os.replace(fullPathCache + '.tmp', fullPathCache)
+
+    return inocula, final, varNames
 
 
-def loadData(fileName):
+def rankData(dataset):
+    """
+    - :input:`dataset` (np.array). Observations (rows) x variables (columns).
+    - :output:`ranks` (np.array). Dense rank of each value within its variable (0: lowest value) in the narrowest unsigned integer type. Missing values (NaN) get the largest value of the type.
+    - :output:`tiePtr`, `tieSize` (np.array). Sizes of the groups of tied observations (2 or more) of each variable k: `tieSize[tiePtr[k]:tiePtr[k+1]]`.
+
+    Iota coefficients only depend on the ordering of the observations, so
+    ranks give the same outcomes as the values with a fraction of the memory.
+
+    """
+    dataset = np.asarray(dataset, dtype = float)
+    numObs, numVar = dataset.shape
+    missing = np.isnan(dataset)
+    inverse = []
+    sizes = []
+    for k in range(0, numVar):
+        _, inv, counts = np.unique(dataset[~missing[:, k], k], return_inverse = True, return_counts = True)
+        inverse.append(inv.ravel())
+        sizes.append(counts[counts > 1])
+    numLevels = max([int(inv.max()) + 1 for inv in inverse if inv.size > 0] + [0])
+    dtype = next(t for t in (np.uint8, np.uint16, np.uint32, np.uint64) if numLevels < np.iinfo(t).max)
+    ranks = np.full((numObs, numVar), np.iinfo(dtype).max, dtype = dtype)
+    for k in range(0, numVar):
+        ranks[~missing[:, k], k] = inverse[k]
+    tiePtr = np.concatenate(([0], np.cumsum([len(t) for t in sizes]))).astype(np.int64)
+    tieSize = np.concatenate(sizes + [np.zeros(0)]).astype(np.int64)
+
+    return ranks, tiePtr, tieSize
+
+
+def dataRanks(data):
+    """
+    - :input:`data` (dict). Dataset of a nOEN dictionary (`dict_['data']`).
+    - :output:`ranks` (np.array). Rank-compressed dataset (t_max) (see :func:`rankData`).
+    - :output:`tiePairs` (np.array). Number of tied observation pairs of each variable.
+
+    Ranks saved in the results store are reused. They are computed (and kept
+    in `data`) if missing or out of date (e.g., appended observations).
+
+    """
+    if 'ranks' not in data or np.shape(data['ranks']) != np.shape(data['final']):
+        data['ranks'], data['tiePtr'], data['tieSize'] = rankData(data['final'])
+    t = np.asarray(data['tieSize'], dtype = np.int64)
+    cum = np.concatenate(([0], np.cumsum(t * (t - 1) // 2)))
+    tiePtr = np.asarray(data['tiePtr'])
+
+    return data['ranks'], cum[tiePtr[1:]] - cum[tiePtr[:-1]]
+
+
+def loadData(fileName, save = True):
     """
     - :input:`fileName` (str). Name of file with data and info.
+    - :input:`save` (bool). Save the structure of a new dataset in the results store (default: True).
+    - :output:`rDict` (dict). Dictionary with dataset and saved nOEN outcomes (if any).
 
     """  
-    print('\n>> Loading data...')
-    path = '../../Results/'
-    fullPathFile = path + fileName + '.npy'
-    if os.path.isfile(fullPathFile):
-        print(' > File `' + fileName + '.npy` with results.')
+    message('\n>> Loading data...')
+    path = PATHS['results']
+    if os.path.isfile(path + fileName + '_store/meta.json'):
+        message(' > File `' + fileName + '_store` with results.')
+        rDict = loadResults(fileName)
+    elif os.path.isfile(path + fileName + '.npy'):
+        message(' > File `' + fileName + '.npy` with results (legacy format).')
         rDict = loadResults(fileName)
     else:
-        print(' > New file .npy.')
-        # Path name of Data
-        path = '../../Data/'
-        fullPath = path + fileName + '.xlsx'
+        message(' > New results store.' if save else ' > New dataset (in memory).')
         # Initialization 
         leDict = {}             # Full dictionary (`data` + `comb` + `coeff`)
         combDict = {}           # Dictionary of combinations (`comb`)
         coeffDict = {}          # Dictionary of Iota coefficients (`coeff`)
         # Structure dataset (data)
-        di = pd.read_excel(fullPath, sheet_name = 't_0')
-        df = pd.read_excel(fullPath, sheet_name = 't_max')
-        varNames = np.array(df.keys())
-        di = np.array(di)
-        df = np.array(df)
+        di, df, varNames = readData(fileName)
         numVar = len(varNames)
-        leDict = createDict('data', leDict, {'inocula': di, 'final': df, 'varNames': varNames, 'numVar': numVar, 'results': False})
+        ranks, tiePtr, tieSize = rankData(df)
+        leDict = createDict('data', leDict, {'inocula': di, 'final': df, 'ranks': ranks, 'tiePtr': tiePtr, 'tieSize': tieSize, 'varNames': varNames, 'numVar': numVar, 'results': False})
         # Structures combinations & Iota coefficients (`comb`, `coeff`)
-        v = np.arange(1, numVar+1)
-        nCoef = []
-        for i in range(2, numVar+1):
-            nameK2 = 'D' + str(i)
-            relP = 2/(2**i)     # Reliable point (relP = 2/2^D)
-            ## Combinations (`comb`)
-            c = np.array(list(_comb(v, i)))
-            nc = c.shape[0]
-            nCoef.append(nc)
-            combDict[nameK2] = c
-            ## Coefficients (`coeff`)
-            coeffDict[nameK2] = {}
-            for i_c in c:
-                nameK3_comb = "_".join(varNames[i_c - 1])
-                coeffDict[nameK2][nameK3_comb] = {'iD': i_c, 'D': i, 'reliablePoint': relP, 'numObs': [], 'coeffInfo': {'signs1': [], 'signs2': [], 'deltas': [], 'd_pval': [], 'iota': [], 'iota_pval': []}}
-        combDict['numcoeff'] = nCoef
+        ## Combinations are generated on demand (see `iterComb`) and `coeff` entries are created by nOEN for the analysed dimensions
+        combDict['numcoeff'] = [math.comb(numVar, i) for i in range(2, numVar+1)]
         leDict = createDict('comb', leDict, combDict)
         leDict = createDict('coeff', leDict, coeffDict)
         # Save structure
-        createDict('saveDict', leDict, fileName)
-        rDict = loadResults(fileName)
+        if save:
+            createDict('saveDict', leDict, fileName)
+        rDict = leDict
     
     return rDict
 
 
 def loadResults(fileName):
-    path = '../../Results/'
+    """
+    - :input:`fileName` (str). Name of file with data and info.
+
+    Results saved in the columnar results store are memory-mapped (see
+    :func:`openStore`). Results saved by previous versions (`fileName.npy`)
+    are unpickled.
+
+    """
+    path = PATHS['results']
+    if os.path.isfile(path + fileName + '_store/meta.json'):
+        return openStore(fileName)
     fullPathSave = path + fileName + '.npy'
     readResults = np.load(fullPathSave, allow_pickle = 'TRUE').item()
 
     return readResults
 
 
-def extractResults(dict_, D, idS):
+@timed('save')
+def saveStore(dict_, fileName):
+    """
+    - :input:`dict_` (dict). Dictionary with dataset and nOEN outcomes.
+    - :input:`fileName` (str). Name of file with data and info.
+
+    Columnar results store (`Results/fileName_store/`):
+        - `meta.json`. Variables, number of combinations and dimensions saved (with the settings of their run, see :func:`stats.finishRun`).
+        - `data_final.npy`, `data_inocula.npy`. Dataset.
+        - `data_ranks.npy`, `data_tiePtr.npy`, `data_tieSize.npy`. Rank-compressed dataset (t_max) and its tie groups (see :func:`rankData`).
+        - `D{d}_signs.npy`. Signs of the paired orthants of dimension d (2 x N).
+        - `D{d}_numObs.npy`. Number of observations of each combination (-1: no results).
+        - `D{d}_deltas.npy`, `D{d}_d_pval.npy`, `D{d}_iota.npy`, `D{d}_iota_pval.npy`. Coefficients (combinations x N).
+        - `D{d}_d_pval_perm.npy`, `D{d}_iota_pval_perm.npy`, `D{d}_numPerm.npy`. Permutation p-values and number of permutations (only if computed).
+        - `D{d}_F.npy`, `D{d}_untied.npy`. Orthant counts and number of untied pairs (used to append observations; only if computed).
+        - `D{d}_d_ci.npy`, `D{d}_iota_ci.npy`, `D{d}_numSampled.npy`. Confidence intervals and number of sampled pairs of approximate coefficients (only in approximate mode; 0: exact).
+        - `D{d}_indptr.npy`, `D{d}_index.npy`. Inverted index from variables to combinations (see :func:`buildIndex`).
+    Rows are indexed by combination rank (see :func:`combRank`). Dimensions
+    of an opened store that are not in `dict_['coeff']` are kept as they are.
+
+    """
+    path = PATHS['results'] + fileName + '_store/'
+    os.makedirs(path, exist_ok = True)
+    data = dict_['data']
+    varNames = data['varNames']
+    numVar = data['numVar']
+    meta = {'version': 1, 'varNames': [str(v) for v in varNames], 'numVar': int(numVar), 'results': bool(data['results']), 'numcoeff': [int(n) for n in dict_['comb']['numcoeff']], 'dims': {}}
+    if os.path.isfile(path + 'meta.json'):
+        with open(path + 'meta.json') as f:
+            meta['dims'] = json.load(f)['dims']
+    np.save(path + 'data_final.npy', data['final'])
+    np.save(path + 'data_inocula.npy', data['inocula'])
+    if 'ranks' in data:
+        for key in ('ranks', 'tiePtr', 'tieSize'):
+            np.save(path + 'data_' + key + '.npy', data[key])
+    for D_field, dCoeff in dict_['coeff'].items():
+        d = int(D_field[1:])
+        N = int(2**d/2)
+        numComb = math.comb(numVar, d)
+        wIota = 1 if d == 2 else N
+        cols = {'numObs': open_memmap(path + D_field + '_numObs.tmp', mode = 'w+', dtype = np.int64, shape = (numComb,)),
+                'deltas': open_memmap(path + D_field + '_deltas.tmp', mode = 'w+', dtype = np.float64, shape = (numComb, N)),
+                'd_pval': open_memmap(path + D_field + '_d_pval.tmp', mode = 'w+', dtype = np.float64, shape = (numComb, N)),
+                'iota': open_memmap(path + D_field + '_iota.tmp', mode = 'w+', dtype = np.float64, shape = (numComb, wIota)),
+                'iota_pval': open_memmap(path + D_field + '_iota_pval.tmp', mode = 'w+', dtype = np.float64, shape = (numComb, wIota))}
+        cols['numObs'][:] = -1
+        perm = any(isinstance(e['coeffInfo'], dict) and 'numPerm' in e['coeffInfo'] for e in dCoeff.values())
+        if perm:
+            cols['d_pval_perm'] = open_memmap(path + D_field + '_d_pval_perm.tmp', mode = 'w+', dtype = np.float64, shape = (numComb, N))
+            cols['iota_pval_perm'] = open_memmap(path + D_field + '_iota_pval_perm.tmp', mode = 'w+', dtype = np.float64, shape = (numComb, wIota))
+            cols['numPerm'] = open_memmap(path + D_field + '_numPerm.tmp', mode = 'w+', dtype = np.int64, shape = (numComb,))
+            cols['numPerm'][:] = 0
+        approx = any(isinstance(e['coeffInfo'], dict) and 'numSampled' in e['coeffInfo'] for e in dCoeff.values())
+        if approx:
+            cols['d_ci'] = open_memmap(path + D_field + '_d_ci.tmp', mode = 'w+', dtype = np.float64, shape = (numComb, N, 2))
+            cols['iota_ci'] = open_memmap(path + D_field + '_iota_ci.tmp', mode = 'w+', dtype = np.float64, shape = (numComb, wIota, 2))
+            cols['numSampled'] = open_memmap(path + D_field + '_numSampled.tmp', mode = 'w+', dtype = np.int64, shape = (numComb,))
+            cols['d_ci'][:] = np.nan
+            cols['iota_ci'][:] = np.nan
+            cols['numSampled'][:] = 0
+        counts = any(isinstance(e['coeffInfo'], dict) and 'F' in e['coeffInfo'] for e in dCoeff.values())
+        if counts:
+            cols['F'] = open_memmap(path + D_field + '_F.tmp', mode = 'w+', dtype = np.int64, shape = (numComb, N))
+            cols['untied'] = open_memmap(path + D_field + '_untied.tmp', mode = 'w+', dtype = np.int64, shape = (numComb,))
+            cols['F'][:] = 0
+            cols['untied'][:] = 0
+        for rank, iD in enumerate(combIter(numVar, d)):
+            entry = dCoeff.get("_".join(varNames[iD - 1]))
+            if entry is None or isinstance(entry['numObs'], list):
+                continue
+            r = entry['coeffInfo']
+            cols['numObs'][rank] = entry['numObs']
+            for key in ('deltas', 'd_pval', 'iota', 'iota_pval'):
+                cols[key][rank] = r[key]
+            if perm and 'numPerm' in r:
+                for key in ('d_pval_perm', 'iota_pval_perm', 'numPerm'):
+                    cols[key][rank] = r[key]
+            if counts and 'F' in r:
+                for key in ('F', 'untied'):
+                    cols[key][rank] = r[key]
+            if approx and 'numSampled' in r:
+                for key in ('d_ci', 'iota_ci', 'numSampled'):
+                    cols[key][rank] = r[key]
+        keys = list(cols)
+        for key, col in cols.items():
+            col.flush()
+            del col
+        cols.clear()
+        for key in keys:
+            os.replace(path + D_field + '_' + key + '.tmp', path + D_field + '_' + key + '.npy')
+        # Optional columns of a previous save that are not computed anymore
+        # (and the signs of the paired orthants, saved per dimension by previous versions; see `orthantTable`)
+        for key in ('d_pval_perm', 'iota_pval_perm', 'numPerm', 'F', 'untied', 'd_ci', 'iota_ci', 'numSampled', 'signs'):
+            if key not in keys and os.path.isfile(path + D_field + '_' + key + '.npy'):
+                os.remove(path + D_field + '_' + key + '.npy')
+        if not os.path.isfile(path + D_field + '_index.npy') or np.load(path + D_field + '_indptr.npy', mmap_mode = 'r').shape != (numVar + 1,):
+            indptr, index = buildIndex(numVar, d)
+            np.save(path + D_field + '_indptr.npy', indptr)
+            np.save(path + D_field + '_index.npy', index)
+        meta['dims'][D_field] = {'numComb': numComb, 'N': N, 'perm': perm, 'counts': counts, 'approx': approx, 'infoInocula': bool(data.get('infoInocula', {}).get(D_field, False)),
+                                 'settings': data.get('runSettings', {}).get(D_field, {})}
+    with open(path + 'meta.json.tmp', 'w') as f:
+        json.dump(meta, f, indent = 1)
+    os.replace(path + 'meta.json.tmp', path + 'meta.json')
+
+
+def openStore(fileName):
+    """
+    - :input:`fileName` (str). Name of file with data and info.
+    - :output:`rDict` (dict). Dictionary with dataset (`data`), combinations (`comb`), an empty `coeff` and the memory-mapped outcomes (`store`).
+
+    """
+    path = PATHS['results'] + fileName + '_store/'
+    with open(path + 'meta.json') as f:
+        meta = json.load(f)
+    data = {'inocula': np.load(path + 'data_inocula.npy', allow_pickle = True), 'final': np.load(path + 'data_final.npy', allow_pickle = True),
+            'varNames': np.array(meta['varNames'], dtype = object), 'numVar': meta['numVar'], 'results': meta['results'],
+            'infoInocula': {D_field: dMeta.get('infoInocula', False) for D_field, dMeta in meta['dims'].items()},
+            'runSettings': {D_field: dMeta.get('settings', {}) for D_field, dMeta in meta['dims'].items()}}
+    if os.path.isfile(path + 'data_ranks.npy'):
+        for key in ('ranks', 'tiePtr', 'tieSize'):
+            data[key] = np.load(path + 'data_' + key + '.npy')
+    store = {}
+    for D_field, dMeta in meta['dims'].items():
+        store[D_field] = {}
+        keys = ['numObs', 'deltas', 'd_pval', 'iota', 'iota_pval']
+        if dMeta.get('perm', False):
+            keys += ['d_pval_perm', 'iota_pval_perm', 'numPerm']
+        if dMeta.get('counts', False):
+            keys += ['F', 'untied']
+        if dMeta.get('approx', False):
+            keys += ['d_ci', 'iota_ci', 'numSampled']
+        for key in keys:
+            store[D_field][key] = np.load(path + D_field + '_' + key + '.npy', mmap_mode = 'r')
+        if os.path.isfile(path + D_field + '_index.npy'):
+            for key in ('indptr', 'index'):
+                store[D_field][key] = np.load(path + D_field + '_' + key + '.npy', mmap_mode = 'r')
+
+    return {'data': data, 'comb': {'numcoeff': meta['numcoeff']}, 'coeff': {}, 'store': store}
+
+
+def convertResults(fileName):
+    """
+    - :input:`fileName` (str). Name of file with data and info.
+
+    Converts results saved in the legacy format (`fileName.npy`) to the columnar results store.
+
+    """
+    path = PATHS['results']
+    fullPathFile = path + fileName + '.npy'
+    if not os.path.isfile(fullPathFile):
+        message(' > `' + fileName + '.npy` does not exist.')
+        return
+    legacy = np.load(fullPathFile, allow_pickle = 'TRUE').item()
+    saveStore(legacy, fileName)
+    message(' > `' + fileName + '.npy` converted to `' + fileName + '_store`.')
+
+
+def hasDim(dict_, D):
+    """
+    - :input:`dict_` (dict). Dictionary with dataset and nOEN outcomes.
+    - :input:`D` (int). Dimension/number of joint variables.
+
+    """
     D_field = 'D' + str(D)
-    idS = idS
-    varNames = dict_['data']['varNames']
-    iVar = []
-    for i in idS:
-        iVar.append(varNames[i])
-    nameK3_comb = "_".join(iVar)
+
+    return D_field in dict_['coeff'] or D_field in dict_.get('store', {})
+
+
+def combResults(dict_, D, iD):
+    """
+    - :input:`dict_` (dict). Dictionary with dataset and nOEN outcomes.
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`iD` (np.array). Variables of the combination (1-based and sorted).
+    - :output:`entry` (dict). `coeff` entry of the combination (see :func:`coeffEntry`).
+
+    Outcomes in `dict_['coeff']` (in memory) take precedence over those of the
+    results store, from which only the row of the combination is read.
+
+    """
+    D_field = 'D' + str(D)
+    if D_field in dict_['coeff']:
+        nameK3_comb = "_".join(dict_['data']['varNames'][np.asarray(iD) - 1])
+        return dict_['coeff'][D_field][nameK3_comb]
+    cols = dict_['store'][D_field]
+    rank = combRank(iD, dict_['data']['numVar'])
+    entry = coeffEntry(iD)
+    numObs = int(cols['numObs'][rank])
+    if numObs < 0:
+        return entry
+    iota = np.array(cols['iota'][rank])
+    iota_pval = np.array(cols['iota_pval'][rank])
+    if D == 2:
+        iota = iota[0]
+        iota_pval = iota_pval[0]
+    entry['numObs'] = numObs
+    entry['coeffInfo'] = {'deltas': np.array(cols['deltas'][rank]), 'd_pval': np.array(cols['d_pval'][rank]), 'iota': iota, 'iota_pval': iota_pval}
+    if 'numPerm' in cols and cols['numPerm'][rank] > 0:
+        iota_pval_perm = np.array(cols['iota_pval_perm'][rank])
+        if D == 2:
+            iota_pval_perm = iota_pval_perm[0]
+        entry['coeffInfo'].update({'d_pval_perm': np.array(cols['d_pval_perm'][rank]), 'iota_pval_perm': iota_pval_perm, 'numPerm': int(cols['numPerm'][rank])})
+    if 'numSampled' in cols and cols['numSampled'][rank] > 0:
+        entry['coeffInfo'].update({'approx': True, 'numSampled': int(cols['numSampled'][rank]), 'd_ci': np.array(cols['d_ci'][rank]), 'iota_ci': np.array(cols['iota_ci'][rank])})
+
+    return entry
+
+
+def extractResults(dict_, D, idS):
+    entry = combResults(dict_, D, np.asarray(idS) + 1)
     
-    symU = dict_['coeff'][D_field][nameK3_comb]['coeffInfo']['signs1']
-    symD = dict_['coeff'][D_field][nameK3_comb]['coeffInfo']['signs2']
-    iota = dict_['coeff'][D_field][nameK3_comb]['coeffInfo']['iota']
-    pval = dict_['coeff'][D_field][nameK3_comb]['coeffInfo']['iota_pval']
-    num_obs = dict_['coeff'][D_field][nameK3_comb]['numObs']
-    rely = dict_['coeff'][D_field][nameK3_comb]['reliablePoint']
+    symU, symD = orthantTable(D)['signs']
+    iota = entry['coeffInfo']['iota']
+    pval = entry['coeffInfo']['iota_pval']
+    num_obs = entry['numObs']
+    rely = entry['reliablePoint']
     
     return iota, pval, num_obs, rely, symU, symD
 
-def writeResults(fileName, Dim = 0, varSelect = 0, onlySig = False):
+def resultColumns(dict_, D, ranks = None):
+    """
+    - :input:`dict_` (dict). Dictionary with dataset and nOEN outcomes.
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`ranks` (np.array). Ranks of the combinations wanted (see :func:`combRank`) (default: None -> All).
+    - :output:`cols` (dict). Outcomes of the combinations of dimension D as columns (same layout as the results store, see :func:`saveStore`).
+
+    Rows are indexed by combination rank (or follow `ranks`); `numObs` is -1
+    for combinations without results. Outcomes in `dict_['coeff']` (in memory)
+    take precedence over those of the results store. Only the rows of `ranks`
+    are read: the cost is proportional to the number of ranks (or of
+    combinations in memory, if fewer).
+
+    """
+    D_field = 'D' + str(D)
+    if D_field not in dict_['coeff']:
+        store = dict_['store'][D_field]
+        if ranks is None:
+            return store
+        return {key: np.asarray(col[ranks]) for key, col in store.items() if key not in ('indptr', 'index')}
+    varNames = dict_['data']['varNames']
+    numVar = dict_['data']['numVar']
+    dCoeff = dict_['coeff'][D_field]
+    N = int(2**D/2)
+    ranks = np.arange(math.comb(numVar, D), dtype = np.int64) if ranks is None else np.asarray(ranks, dtype = np.int64)
+    numComb = len(ranks)
+    wIota = 1 if D == 2 else N
+    cols = {'numObs': np.full(numComb, -1, dtype = np.int64), 'deltas': np.full((numComb, N), np.nan), 'd_pval': np.full((numComb, N), np.nan),
+            'iota': np.full((numComb, wIota), np.nan), 'iota_pval': np.full((numComb, wIota), np.nan)}
+    if numComb < len(dCoeff):
+        # Entries of the ranks wanted
+        rows = ((rank, dCoeff.get("_".join(varNames[combUnrank(r, D, numVar) - 1]))) for rank, r in enumerate(ranks))
+    else:
+        # Rows of the entries in memory
+        entries = [e for e in dCoeff.values() if not isinstance(e['numObs'], list)]
+        order = np.argsort(ranks, kind = 'stable')
+        eRanks = np.array([combRank(e['iD'], numVar) for e in entries], dtype = np.int64)
+        pos = np.searchsorted(ranks[order], eRanks)
+        hit = np.flatnonzero(pos < numComb)
+        hit = hit[ranks[order[pos[hit]]] == eRanks[hit]]
+        rows = ((order[pos[j]], entries[j]) for j in hit)
+    for rank, entry in rows:
+        if entry is None or isinstance(entry['numObs'], list):
+            continue
+        r = entry['coeffInfo']
+        cols['numObs'][rank] = entry['numObs']
+        for key in ('deltas', 'd_pval', 'iota', 'iota_pval'):
+            cols[key][rank] = r[key]
+        if 'numPerm' in r:
+            if 'numPerm' not in cols:
+                cols.update({'d_pval_perm': np.full((numComb, N), np.nan), 'iota_pval_perm': np.full((numComb, wIota), np.nan), 'numPerm': np.zeros(numComb, dtype = np.int64)})
+            for key in ('d_pval_perm', 'iota_pval_perm', 'numPerm'):
+                cols[key][rank] = r[key]
+        if 'numSampled' in r:
+            if 'numSampled' not in cols:
+                cols.update({'d_ci': np.full((numComb, N, 2), np.nan), 'iota_ci': np.full((numComb, wIota, 2), np.nan), 'numSampled': np.zeros(numComb, dtype = np.int64)})
+            for key in ('d_ci', 'iota_ci', 'numSampled'):
+                cols[key][rank] = r[key]
+
+    return cols
+
+
+def excelValue(v, float_format = None):
+    """
+    - :input:`v` (object). Value of a cell.
+    - :input:`float_format` (str). Format of floats (default: None -> Unchanged).
+    - :output:`v` (object). Value written in Excel (same conversion as :meth:`pandas.DataFrame.to_excel`).
+
+    """
+    if isinstance(v, (float, np.floating)):
+        if np.isnan(v):
+            return None
+        if np.isinf(v):
+            return 'inf' if v > 0 else '-inf'
+        return float(float_format % v) if float_format is not None else float(v)
+    if isinstance(v, np.integer):
+        return int(v)
+    if isinstance(v, np.str_):
+        return str(v)
+
+    return v
+
+
+def longResults(rDict, vD, varSelect = 0, onlySig = False):
+    """
+    - :input:`rDict` (dict). Dictionary with dataset and nOEN outcomes.
+    - :input:`vD` (list). Dimensions we want to write.
+    - :input:`varSelect` (list). Variables that must be in the combinations (default: 0 -> 'All').
+    - :input:`onlySig` (bool). Only combinations with significant results (p < 0.05) (default: False).
+    - :output:`df` (pd.DataFrame). One row per combination and paired orthant (one row per combination if D = 2, with the delta of its paired orthant).
+
+    Columns: `combination`, `dimension`, `numObs`, `signs`, `signs_opposite`,
+    `delta`, `delta_pval`, `iota`, `iota_pval` (and `iota_pval_perm`,
+    `numPerm` if permutation p-values were computed; `iota_ci_low`,
+    `iota_ci_high` and `approx` if coefficients were approximated).
+
+    """
+    varNames = rDict['data']['varNames']
+    frames = []
+    for d in vD:
+        if not hasDim(rDict, d):
+            continue
+        ranks, combs = queryCombs(rDict, d, varSelect, 'any', 0.051 if onlySig else None)
+        cols = resultColumns(rDict, d, ranks)
+        idx = np.flatnonzero(cols['numObs'] >= 0)
+        combs = combs[idx]
+        numObs = cols['numObs']
+        n = 1 if d == 2 else int(2**d/2)
+        names = np.array(["_".join(varNames[c - 1]) for c in combs], dtype = object)
+        signs = orthantTable(d)['signs'][:, :n].astype(object)
+        frame = {'combination': np.repeat(names, n), 'dimension': d, 'numObs': np.repeat(numObs[idx], n),
+                 'signs': np.tile(signs[0], len(idx)), 'signs_opposite': np.tile(signs[1], len(idx)),
+                 'delta': cols['deltas'][idx, :n].ravel(), 'delta_pval': cols['d_pval'][idx, :n].ravel(),
+                 'iota': cols['iota'][idx].ravel(), 'iota_pval': cols['iota_pval'][idx].ravel()}
+        if 'numPerm' in cols:
+            frame['iota_pval_perm'] = cols['iota_pval_perm'][idx].ravel()
+            frame['numPerm'] = np.repeat(cols['numPerm'][idx], n)
+        if 'numSampled' in cols:
+            iota_ci = cols['iota_ci'][idx]
+            frame['iota_ci_low'] = iota_ci[:, :, 0].ravel()
+            frame['iota_ci_high'] = iota_ci[:, :, 1].ravel()
+            frame['approx'] = np.repeat(cols['numSampled'][idx] > 0, n)
+        frames.append(pd.DataFrame(frame))
+    if not frames:
+        return pd.DataFrame(columns = ['combination', 'dimension', 'numObs', 'signs', 'signs_opposite', 'delta', 'delta_pval', 'iota', 'iota_pval'])
+
+    return pd.concat(frames, ignore_index = True)
+
+
+@timed('excel')
+def writeResults(fileName, Dim = 0, varSelect = 0, onlySig = False, fmt = 'xlsx', overwrite = None, rDict = None):
     """
     - :input:`fileName` (str). Name of file with data and info.
     - :input:`Dim` (list). List with dimensions we want to write (default: 0 -> 'All').
+    - :input:`varSelect` (list). Variables we want to write (default: 0 -> 'All').
+    - :input:`onlySig` (bool). Only significant results (p < 0.05) (default: False).
+    - :input:`fmt` (str). 'xlsx' (one sheet per dimension), 'csv' or 'parquet' (one long table, see :func:`longResults`) (default: 'xlsx').
+    - :input:`overwrite` (bool). Overwrite an existing results file (default: None -> Ask the user).
+    - :input:`rDict` (dict). Dictionary with dataset and nOEN outcomes (default: None -> Saved results of `fileName`).
+
+    Excel sheets are built row by row in one pass and streamed to the file
+    (write-only workbook).
 
     """
-    path = '../../Results/'
+    path = PATHS['results']
     fullPathFile = path + fileName + '.npy'
-    fullPathSave = path + fileName + '_results.xlsx'
-    if os.path.isfile(fullPathFile):
-        if os.path.isfile(fullPathSave):
-            val = input(' > Do you want to overwrite `' + fileName + '_results.xlsx`? [Y/N]: ')
-        else:
-            val = 'Y'
-        if val == 'Y' or val == 'y':
-            rDict = loadResults(fileName)
+    fullPathSave = path + fileName + '_results.' + fmt
+    if rDict is not None or os.path.isfile(path + fileName + '_store/meta.json') or os.path.isfile(fullPathFile):
+        if not os.path.isfile(fullPathSave) or askOverwrite(' > Do you want to overwrite `' + fileName + '_results.' + fmt + '`? [Y/N]: ', overwrite):
+            if rDict is None:
+                rDict = loadResults(fileName)
             D = rDict['data']['numVar']
             numComb = rDict['comb']['numcoeff']
-            print('\n>> Writing results ' + '`' + fileName + '.npy` to `' + fileName + '_results.xlsx`.')
+            message('\n>> Writing results ' + '`' + fileName + '` to `' + fileName + '_results.' + fmt + '`.')
             # Data Sheet
             data = rDict['data']['final']
             varNames = rDict['data']['varNames']
             nd = data.shape[0]
-            df = pd.DataFrame(data, columns = varNames.tolist(), index = np.arange(1, nd+1))
             if not varSelect == 0:
                 # Check if variable name(s) exists
                 cvarNames = np.isin(varSelect, varNames)
                 getnotNames = list(compress(varSelect, ~cvarNames))
                 if getnotNames:
-                    print(' > Variable(s) `' + ' '.join(getnotNames) + '` not found.')
-            with pd.ExcelWriter(fullPathSave) as writer:
-                df.to_excel(writer, sheet_name='Data')
-                if Dim == 0:
-                    vD = np.arange(2, D+1)
-                else:
-                    vD = Dim
+                    message(' > Variable(s) `' + ' '.join(getnotNames) + '` not found.')
+            if Dim == 0:
+                vD = np.arange(2, D+1)
+            else:
+                vD = Dim
+            if fmt != 'xlsx':
                 for d in vD:
-                    sName = 'D' + str(d)
-                    infoR = pd.DataFrame(np.array(['· Dimension ' + str(d), '· Reliable point: ' + str(2/(2**d)), '· Total number of observations: ' + str(nd), '· Total number of var combinations: ' + str(numComb[d-2])]))
-                    infoR.to_excel(writer, sheet_name = sName, index = False, header = False)
-                    headR = ['[ ' + '± ' * d + ']', '[ ' + '∓ ' * d + ']', 'δ coeff.', 'ι coeff.', 'p-values']
-                    for c in rDict['comb'][sName]:
-                        if not varSelect == 0:
-                            # Check if variable(s) is present in combination `c`
-                            ind = np.array(np.where(np.isin(varNames, varSelect)), dtype = int) + 1
-                            checkVar = any(np.isin(c, ind))
-                            if not checkVar:
-                                continue
-                        sRow = writer.sheets[sName].max_row
-                        jvarName = "_".join(varNames[c - 1])
-                        ExcelName = jvarName.replace("_", " ")
-                        dvarName = pd.DataFrame(["[" + ExcelName + "]"])
-                        dvarName.to_excel(writer, sheet_name = sName, startrow = sRow+1, index = False, header = False)
-                        r = rDict['coeff'][sName][jvarName]['coeffInfo']
-                        numObsComb = pd.DataFrame(['Number of observations: ' + str(rDict['coeff'][sName][jvarName]['numObs'])])
-                        numObsComb.to_excel(writer, sheet_name = sName, startrow = sRow+2, index = False, header = False)
-                        if onlySig:
-                            checkSig = np.any(r['iota_pval'] < 0.051)
-                            if not checkSig:
-                                noSigMSN = pd.DataFrame(['No significant data trends were found.'])
-                                noSigMSN.to_excel(writer, sheet_name = sName, startrow = sRow+3, index = False, header = False)
-                                continue
-                        if d == 2:
-                            rM = [r['signs1'][0], r['signs2'][0], '-', r['iota'], r['iota_pval']]
-                            R = pd.DataFrame([rM], columns = headR)
-                            R[headR[-2:]] = R[headR[-2:]].astype(float)
-                        else:
-                            rMSings = np.array([r['signs1'], r['signs2']]).T
-                            rMcoeffs = np.array([r['deltas'], r['iota'], r['iota_pval']], dtype = 'float').T
-                            rM = np.append(rMSings, rMcoeffs, axis = 1)
-                            R = pd.DataFrame(rM, columns = headR).infer_objects()
-                            R[headR[-3:]] = R[headR[-3:]].astype(float)
-                        R.to_excel(writer, sheet_name = sName, float_format = '%.4f', startrow = sRow+3, index = False)
-            print('>> Writing done.')
+                    if not hasDim(rDict, d):
+                        message(' > Dimension ' + str(d) + ' not analysed.')
+                df = longResults(rDict, vD, varSelect, onlySig)
+                if fmt == 'csv':
+                    df.to_csv(fullPathSave, index = False)
+                else:
+                    try:
+                        df.to_parquet(fullPathSave, index = False)
+                    except ImportError:
+                        message('Error: Writing Parquet files requires `pyarrow` or `fastparquet`.')
+                        return
+                message('>> Writing done.')
+                return
+            wb = openpyxl.Workbook(write_only = True)
+            ws = wb.create_sheet('Data')
+            ws.append([None] + [excelValue(v) for v in varNames])
+            for i, row in enumerate(data, start = 1):
+                ws.append([i] + [excelValue(v) for v in row])
+            for d in vD:
+                sName = 'D' + str(d)
+                if not hasDim(rDict, d):
+                    message(' > Dimension ' + str(d) + ' not analysed.')
+                    continue
+                ws = wb.create_sheet(sName)
+                for infoR in ['· Dimension ' + str(d), '· Reliable point: ' + str(2/(2**d)), '· Total number of observations: ' + str(nd), '· Total number of var combinations: ' + str(numComb[d-2])]:
+                    ws.append([infoR])
+                headR = ['[ ' + '± ' * d + ']', '[ ' + '∓ ' * d + ']', 'δ coeff.', 'ι coeff.', 'p-values']
+                signs = orthantTable(d)['signs']
+                # Combinations with any of the selected variables (inverted index)
+                combs = iterComb(rDict, d) if varSelect == 0 else queryCombs(rDict, d, varSelect, 'any')[1]
+                for c in combs:
+                    ExcelName = " ".join(varNames[c - 1])
+                    ws.append([])
+                    ws.append(["[" + ExcelName + "]"])
+                    entry = combResults(rDict, d, c)
+                    r = entry['coeffInfo']
+                    ws.append(['Number of observations: ' + str(entry['numObs']) + (' (approximate: ' + str(r['numSampled']) + ' sampled pairs)' if 'numSampled' in r else '')])
+                    if isinstance(entry['numObs'], list):
+                        ws.append(headR)
+                        continue
+                    if onlySig:
+                        checkSig = np.any(r['iota_pval'] < 0.051)
+                        if not checkSig:
+                            ws.append(['No significant data trends were found.'])
+                            continue
+                    perm = 'numPerm' in r
+                    approx = 'numSampled' in r
+                    ws.append(headR + (['p-values (perm.)'] if perm else []) + (['ι 95% CI (low)', 'ι 95% CI (high)'] if approx else []))
+                    if d == 2:
+                        rM = [signs[0, 0], signs[1, 0], '-', r['iota'], r['iota_pval']] + ([r['iota_pval_perm']] if perm else [])
+                        ws.append(rM[:3] + [excelValue(float(v), '%.4f') for v in rM[3:]])
+                    else:
+                        rMcoeffs = np.array([r['deltas'], r['iota'], r['iota_pval']] + ([r['iota_pval_perm']] if perm else []) +
+                                            ([r['iota_ci'][:, 0], r['iota_ci'][:, 1]] if approx else []), dtype = 'float').T
+                        for s1, s2, rC in zip(signs[0], signs[1], rMcoeffs):
+                            ws.append([str(s1), str(s2)] + [excelValue(v, '%.4f') for v in rC])
+            wb.save(fullPathSave)
+            message('>> Writing done.')
         else:
-            print(' > Results not written. If you don\'t want to lose existing results files, change the name of existing Excel or make a copy into another folder before.')
+            message(' > Results not written. If you don\'t want to lose existing results files, change the name of existing Excel or make a copy into another folder before.')
     else:
-        print(' > `' + fileName + '.npy` does not exist.')
+        message(' > Results of `' + fileName + '` do not exist.')
 
 
 #-DEBUGGING
@@ -0,0 +1,261 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 by Eloi Martinez-Rabert.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+# doctest: +NORMALIZE_WHITESPACE
+# doctest: +SKIP
+
+"""
+This module contain functions for instrumentation and progress reporting of nOEN runs.
+
+- :func:`message` for the messages of nOEN (all messages are routed through it).
+
+- :func:`enableMonitor`, :func:`monitorEnabled` and :func:`resetMonitor` for switching the instrumentation on/off.
+
+- :func:`stage` and :func:`timed` for the timing of a stage (ingest, enumeration, compute, save, Excel, plotting).
+
+- :func:`recordDim` for the combination throughput of each dimension.
+
+- :func:`recordTile` and :func:`takeTiles` for the peak memory and throughput of the pair tiles of each kernel.
+
+- :func:`startProgress`, :func:`advanceProgress` and :func:`endProgress` for the live progress line (with ETA).
+
+- :func:`getProfile` and :func:`saveProfile` for the accumulated profile (JSON).
+
+"""
+
+import sys
+import json
+import time
+import functools
+import contextlib
+
+_monitor = {'enabled': False, 'progress': False, 'stages': {}, 'dims': {}, 'tiles': {}, 'bar': None, 'start': None}
+_null = contextlib.nullcontext()
+
+
+def message(text = ''):
+    """
+    - :input:`text` (str). Message.
+
+    Prints `text` above the progress line (if any).
+
+    """
+    bar = _monitor['bar']
+    if bar is not None and bar['shown']:
+        sys.stderr.write('\r' + ' ' * bar['width'] + '\r')
+        sys.stderr.flush()
+        bar['shown'] = False
+    print(text)
+    if bar is not None:
+        drawProgress(force = True)
+
+
+def enableMonitor(enabled = True, progress = True):
+    """
+    - :input:`enabled` (bool). Record stage timings and dimension throughput (default: True).
+    - :input:`progress` (bool). Show the live progress line (default: True).
+
+    When disabled, :func:`stage` returns a shared null context and the other
+    functions return at once.
+
+    """
+    _monitor['enabled'] = bool(enabled)
+    _monitor['progress'] = bool(enabled and progress)
+    if enabled and _monitor['start'] is None:
+        _monitor['start'] = time.perf_counter()
+
+
+def monitorEnabled():
+    return _monitor['enabled']
+
+
+def resetMonitor():
+    _monitor['stages'].clear()
+    _monitor['dims'].clear()
+    _monitor['tiles'].clear()
+    _monitor['bar'] = None
+    _monitor['start'] = time.perf_counter() if _monitor['enabled'] else None
+
+
+@contextlib.contextmanager
+def _timedStage(name):
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        s = _monitor['stages'].setdefault(name, {'calls': 0, 'time': 0.0})
+        s['calls'] += 1
+        s['time'] += time.perf_counter() - t0
+
+
+def stage(name):
+    """
+    - :input:`name` (str). Name of the stage.
+    - :output:`ctx` (context manager). Adds the elapsed time of the `with` block to the stage.
+
+    """
+    if not _monitor['enabled']:
+        return _null
+
+    return _timedStage(name)
+
+
+def timed(name):
+    """
+    - :input:`name` (str). Name of the stage.
+    - :output:`decorator` (function). Adds the run time of the decorated function to the stage.
+
+    """
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if not _monitor['enabled']:
+                return fn(*args, **kwargs)
+            with _timedStage(name):
+                return fn(*args, **kwargs)
+        return wrapper
+
+    return decorator
+
+
+def recordDim(timings):
+    """
+    - :input:`timings` (dict). Number of combinations and compute time (s) of each dimension ({d: [combinations, time]}), and the tiles of a worker (`tiles`, see :func:`takeTiles`).
+
+    """
+    if not _monitor['enabled']:
+        return
+    for d, value in timings.items():
+        if d == 'tiles':
+            mergeTiles(value)
+            continue
+        n, t = value
+        r = _monitor['dims'].setdefault('D' + str(d), {'combinations': 0, 'time': 0.0})
+        r['combinations'] += int(n)
+        r['time'] += float(t)
+
+
+def recordTile(kernel, pairs, seconds, nbytes):
+    """
+    - :input:`kernel` (str). Name of the pairwise kernel.
+    - :input:`pairs` (int). Number of observation pairs of the tile.
+    - :input:`seconds` (float). Compute time (s) of the tile.
+    - :input:`nbytes` (int). Peak memory (bytes) of the arrays of the tile.
+
+    """
+    if not _monitor['enabled']:
+        return
+    mergeTiles({kernel: {'tiles': 1, 'pairs': int(pairs), 'time': float(seconds), 'peakBytes': int(nbytes),
+                         'minThroughput': pairs / seconds if seconds > 0 else None, 'maxThroughput': pairs / seconds if seconds > 0 else None}})
+
+
+def mergeTiles(tiles):
+    for kernel, t in tiles.items():
+        r = _monitor['tiles'].setdefault(kernel, {'tiles': 0, 'pairs': 0, 'time': 0.0, 'peakBytes': 0, 'minThroughput': None, 'maxThroughput': None})
+        for key in ('tiles', 'pairs', 'time'):
+            r[key] += t[key]
+        r['peakBytes'] = max(r['peakBytes'], t['peakBytes'])
+        if t['minThroughput'] is not None:
+            r['minThroughput'] = t['minThroughput'] if r['minThroughput'] is None else min(r['minThroughput'], t['minThroughput'])
+            r['maxThroughput'] = t['maxThroughput'] if r['maxThroughput'] is None else max(r['maxThroughput'], t['maxThroughput'])
+
+
+def takeTiles():
+    """
+    - :output:`tiles` (dict). Tiles recorded since the last call (e.g., by a worker process), which are then cleared.
+
+    """
+    tiles = {kernel: dict(t) for kernel, t in _monitor['tiles'].items()}
+    _monitor['tiles'].clear()
+
+    return tiles
+
+
+def formatTime(seconds):
+    seconds = int(round(seconds))
+    h, m, s = seconds // 3600, seconds // 60 % 60, seconds % 60
+
+    return '{:d}:{:02d}:{:02d}'.format(h, m, s) if h else '{:02d}:{:02d}'.format(m, s)
+
+
+def startProgress(total, label = ''):
+    """
+    - :input:`total` (int). Total amount of work (e.g., number of combinations).
+    - :input:`label` (str). Text shown before the progress line (default: '').
+
+    """
+    if not _monitor['progress']:
+        return
+    _monitor['bar'] = {'total': max(int(total), 1), 'done': 0, 'label': label, 'status': '', 'start': time.perf_counter(), 'last': 0.0, 'width': 0, 'shown': False}
+    drawProgress(force = True)
+
+
+def advanceProgress(n = 1, status = None):
+    """
+    - :input:`n` (int). Amount of work done since the last call (default: 1).
+    - :input:`status` (str). Text shown after the progress (e.g., running dimension) (default: None -> Unchanged).
+
+    """
+    bar = _monitor['bar']
+    if bar is None:
+        return
+    bar['done'] += n
+    if status is not None:
+        bar['status'] = status
+    drawProgress()
+
+
+def drawProgress(force = False):
+    bar = _monitor['bar']
+    now = time.perf_counter()
+    if not force and now - bar['last'] < 0.2 and bar['done'] < bar['total']:
+        return
+    bar['last'] = now
+    elapsed = now - bar['start']
+    frac = min(bar['done'] / bar['total'], 1.0)
+    eta = elapsed / frac * (1 - frac) if frac > 0 else None
+    line = ' > {} [{:<20}] {:5.1f}% ({}/{}) {} | elapsed {} | ETA {}'.format(bar['label'], '#' * int(20 * frac), 100 * frac, bar['done'], bar['total'],
+                                                                            bar['status'], formatTime(elapsed), '--:--' if eta is None else formatTime(eta))
+    sys.stderr.write('\r' + line.ljust(bar['width']))
+    sys.stderr.flush()
+    bar['width'] = max(bar['width'], len(line))
+    bar['shown'] = True
+
+
+def endProgress():
+    bar = _monitor['bar']
+    if bar is None:
+        return
+    drawProgress(force = True)
+    sys.stderr.write('\n')
+    sys.stderr.flush()
+    _monitor['bar'] = None
+
+
+def getProfile():
+    """
+    - :output:`profile` (dict). Timings of each stage, combination throughput of each dimension and pair tiles of each kernel (number, pairs, peak memory in MB and throughput in pairs/s).
+
+    """
+    dims = {}
+    for D_field, r in _monitor['dims'].items():
+        dims[D_field] = dict(r, throughput = r['combinations'] / r['time'] if r['time'] > 0 else None)
+    tiles = {}
+    for kernel, r in _monitor['tiles'].items():
+        tiles[kernel] = {'tiles': r['tiles'], 'pairs': r['pairs'], 'time': r['time'], 'peakMB': r['peakBytes'] / 2**20,
+                         'throughput': r['pairs'] / r['time'] if r['time'] > 0 else None, 'minThroughput': r['minThroughput'], 'maxThroughput': r['maxThroughput']}
+    total = time.perf_counter() - _monitor['start'] if _monitor['start'] is not None else 0.0
+
+    return {'total': total, 'stages': {name: dict(s) for name, s in _monitor['stages'].items()}, 'dims': dims, 'tiles': tiles}
+
+
+def saveProfile(fileName):
+    """
+    - :input:`fileName` (str). Path of the JSON file.
+
+    """
+    with open(fileName, 'w') as f:
+        json.dump(getProfile(), f, indent = 1)
+    message(' > Profile saved - `' + fileName + '`.')
@@ -10,17 +10,19 @@
 This module contain functions to run nOEN in Command Prompt.
 
 """
+import sys
 import argparse
 
-from stats import nOEN
-from getData import loadData, createDict, writeResults
-from plotting import ecologicalGrid
+from session import Session, analyseBatch
+from getData import convertResults, datasetNames, usePaths
+from stats import setMemoryCap
+from monitor import enableMonitor, saveProfile
 
 # Command Line Interface (CLI)
 parser = argparse.ArgumentParser(description = '> n-Order Ecological Network platform (nOEN). Statistical platform to identify and map pairwise and higher-order interactions.')
 # Arguments
-parser.add_argument('-filename', dest = 'fileName', required = True, action = 'store',
-                    help = '[str] Name of file with data and info (REQUIRED & CASE-SENSITIVE).')
+parser.add_argument('-filename', dest = 'fileName', required = True, nargs = '+', action = 'store',
+                    help = '[str] Name of file with data and info (REQUIRED & CASE-SENSITIVE). Several names or glob patterns (e.g., \'site_*\') run as one batch on a shared process pool.')
 parser.add_argument('-dim', dest = 'dim', default = 0, nargs = '+', type = int, action = 'store',
                     help = '[list] Dimensions we want to test. Numbers separated by spaces without parenthesis or brakets (Default: 0 -> \'All\').')
 parser.add_argument('-infoinocula', dest = 'infoInocula', default = False, action = 'store_true',
@@ -37,43 +39,131 @@ parser.add_argument('-noFigures', dest = 'noFigure', default = True, action = 's
                     help = '[bool] No plotting, only outcomes from nOEN are saved in Excel.')
 parser.add_argument('-onlyFigures', dest = 'figureOnly', default = False, action = 'store_true',
                     help = '[bool] Only plotting results.')
+parser.add_argument('-format', dest = 'fmt', default = 'xlsx', choices = ['xlsx', 'csv', 'parquet'], action = 'store',
+                    help = '[str] Format of written results: Excel file with one sheet per dimension, or one long table in CSV or Parquet (Default: xlsx).')
+parser.add_argument('-workers', dest = 'workers', default = 1, type = int, action = 'store',
+                    help = '[int] Number of worker processes used to compute the combinations in parallel (Default: 1 -> Serial run).')
+parser.add_argument('-lattice', dest = 'lattice', default = False, action = 'store_true',
+                    help = '[bool] Derive the orthant codes of each combination from its parent combination (Default: False).')
+parser.add_argument('-cacheMB', dest = 'cacheBudget', default = 512, type = float, action = 'store',
+                    help = '[float] Memory budget (MB) per process for cached parent orthant codes with -lattice and for cached row masks with -infoinocula (Default: 512).')
+parser.add_argument('-memMB', dest = 'memCap', default = 0, type = float, action = 'store',
+                    help = '[float] Memory cap (MB) per process of the pairwise kernels: observation pairs are compared in tiles of a quarter of the cap, and the pairwise sign cache is not built above half of the cap (Default: 0 -> No cap, tiles of 64 MB).')
+parser.add_argument('-permutations', dest = 'permutations', default = 0, type = int, action = 'store',
+                    help = '[int] Maximum number of permutations for empirical (permutation) p-values of each combination (Default: 0 -> Only asymptotic p-values).')
+parser.add_argument('-seed', dest = 'seed', default = 0, type = int, action = 'store',
+                    help = '[int] Seed of the permutation test (Default: 0).')
+parser.add_argument('-approxPairs', dest = 'approxPairs', default = 0, type = int, action = 'store',
+                    help = '[int] Approximate mode for D > 2: coefficients estimated from a random sample of at most this number of observation pairs, with 95%% confidence intervals; combinations near the significance threshold are computed exactly (Default: 0 -> Exact).')
+parser.add_argument('-approxTol', dest = 'approxTol', default = 0, type = float, action = 'store',
+                    help = '[float] Approximate mode for D > 2: half-width of the 95%% confidence intervals aimed at, which sets the number of pairs sampled (Default: 0 -> Only -approxPairs).')
+parser.add_argument('-progress', dest = 'progress', default = False, action = 'store_true',
+                    help = '[bool] Show a live progress line (with ETA) and record the time of each stage (Default: False).')
+parser.add_argument('-profile', dest = 'profile', default = None, action = 'store',
+                    help = '[str] JSON file where the time of each stage and the combination throughput of each dimension are saved (Default: None -> Not saved).')
+parser.add_argument('-append', dest = 'append', default = False, action = 'store_true',
+                    help = '[bool] Append the new observations (rows added at the end of the data file) to existing nOEN results, comparing only the new observation pairs (Default: False).')
+parser.add_argument('-convert', dest = 'convert', default = False, action = 'store_true',
+                    help = '[bool] Convert existing results saved in the legacy \'.npy\' format to the columnar results store and exit (Default: False).')
+parser.add_argument('-resume', dest = 'resume', default = False, action = 'store_true',
+                    help = '[bool] Resume an interrupted run: skip the combinations saved in its checkpoints (same data and settings) (Default: False).')
+parser.add_argument('-checkpoint', dest = 'checkpointEvery', default = 300, type = float, action = 'store',
+                    help = '[float] Minimum time (s) between two checkpoints of the completed combinations (Default: 300).')
+parser.add_argument('-overwrite', '--overwrite', dest = 'overwrite', default = None, action = 'store_true',
+                    help = '[bool] Overwrite existing results, Excel and plots without asking (Default: None -> Ask).')
+parser.add_argument('-no-overwrite', '--no-overwrite', dest = 'overwrite', default = None, action = 'store_false',
+                    help = '[bool] Never overwrite existing results, Excel and plots (Default: None -> Ask).')
+parser.add_argument('-sheets', dest = 'sheets', default = False, action = 'store_true',
+                    help = '[bool] One dataset per `t_max_SITE` sheet (and optional `t_0_SITE` sheet) of each Excel file, with results named FILENAME#SITE (Default: False).')
+parser.add_argument('-dataPath', dest = 'dataPath', default = None, action = 'store',
+                    help = '[str] Folder of the data files (Default: ../../Data).')
+parser.add_argument('-resultsPath', dest = 'resultsPath', default = None, action = 'store',
+                    help = '[str] Folder of the results (Default: ../../Results).')
 # parser.add_argument('-plottype', dest = 'plotType', default = 'All', action = 'store',
 #                     help = '[str] Select plotting style of nOEN outcomes ['squarePlot', 'concentricPlot', 'getNetwork'].')
-args = parser.parse_args()
+if __name__ == '__main__':
+    args = parser.parse_args()
 
-fileName = args.fileName
-dim = args.dim
-infoInocula = args.infoInocula
-excel = args.noExcel
-onlyRead = args.onlyRead
-varSelect = args.varSelect
-onlySig = args.onlySig
-figure = args.noFigure
-figureOnly = args.figureOnly
-# plotType = args.plotType
+    fileName = args.fileName
+    dim = args.dim
+    infoInocula = args.infoInocula
+    excel = args.noExcel
+    onlyRead = args.onlyRead
+    varSelect = args.varSelect
+    onlySig = args.onlySig
+    figure = args.noFigure
+    figureOnly = args.figureOnly
+    fmt = args.fmt
+    workers = args.workers
+    lattice = args.lattice
+    cacheBudget = args.cacheBudget
+    memCap = args.memCap
+    permutations = args.permutations
+    seed = args.seed
+    approxPairs = args.approxPairs
+    approxTol = args.approxTol
+    convert = args.convert
+    append = args.append
+    progress = args.progress
+    profile = args.profile
+    resume = args.resume
+    checkpointEvery = args.checkpointEvery
+    overwrite = args.overwrite
+    dataPath = args.dataPath
+    resultsPath = args.resultsPath
+    sheets = args.sheets
+    # plotType = args.plotType
 
-#-DEBUGGING-#
-# print('>> Arguments')
-# print(' > Dims: ' + str(dim))
-# print(' > InfoInocula: ' + str(infoInocula))
-# print(' > CreateExcelWithResults: ' + str(excel))
-# print(' > OnlyRead (read previous results): ' + str(onlyRead))
-# print(' > varWrite: ' + str(varSelect))
-# print(' > OnlySignifiative: ' + str(onlySig))
-# print(' > Figure: ' + str(figure))
-# print(' > OnlyFigures: ' + str(figureOnly))
-#-----------#
-if figureOnly:
-    excel = False
-if not onlyRead:
-    # Read data from Excel and create nested dictionary
-    loadDict = loadData(fileName)
-    # Run nOEN
-    leDict = nOEN(loadDict, dim, infoInocula)
-    # Save results in .pyn
-    createDict('saveDict', leDict, fileName)
-# Create Excel file with results
-if excel:
-    writeResults(fileName, dim, varSelect, onlySig)
-if figure:
-    ecologicalGrid(fileName, leDict, dim, varSelect, onlySig)
+    #-DEBUGGING-#
+    # print('>> Arguments')
+    # print(' > Dims: ' + str(dim))
+    # print(' > InfoInocula: ' + str(infoInocula))
+    # print(' > CreateExcelWithResults: ' + str(excel))
+    # print(' > OnlyRead (read previous results): ' + str(onlyRead))
+    # print(' > varWrite: ' + str(varSelect))
+    # print(' > OnlySignifiative: ' + str(onlySig))
+    # print(' > Figure: ' + str(figure))
+    # print(' > OnlyFigures: ' + str(figureOnly))
+    #-----------#
+    if progress or profile is not None:
+        enableMonitor(True, progress)
+    setMemoryCap(memCap)
+    # Datasets (several files, glob patterns or sheets -> batch run)
+    with usePaths(dataPath, resultsPath):
+        names = datasetNames(fileName, sheets)
+        if convert:
+            for name in names:
+                convertResults(name)
+            sys.exit()
+    if figureOnly:
+        excel = False
+    sessions = [Session(name, dataPath, resultsPath, overwrite) for name in names]
+    
+    def writeOutputs(session):
+        # Create Excel file with results
+        if excel:
+            session.export(dim, varSelect, onlySig, fmt)
+
+    if onlyRead:
+        for session in sessions:
+            writeOutputs(session.read())
+    elif append:
+        # Update existing results with the new observations of the data file
+        for session in sessions:
+            writeOutputs(session.append().save())
+    elif len(sessions) == 1:
+        # Read data, run nOEN and save results in the results store
+        session = sessions[0]
+        session.load()
+        session.analyse(dim, infoInocula, workers, lattice, cacheBudget, permutations, seed, checkpoint = True, checkpointEvery = checkpointEvery, resume = resume,
+                        approxPairs = approxPairs, approxTol = approxTol)
+        writeOutputs(session.save())
+    else:
+        # All datasets on one process pool; each one is saved and written as soon as it is done
+        analyseBatch(sessions, dim, infoInocula, workers, lattice, cacheBudget, permutations, seed, onDone = lambda session: writeOutputs(session.save()),
+                     approxPairs = approxPairs, approxTol = approxTol, checkpoint = True, checkpointEvery = checkpointEvery, resume = resume)
+    if figure:
+        for session in sessions:
+            session.plot(dim, varSelect, onlySig, workers)
+    if profile is not None:
+        saveProfile(profile)
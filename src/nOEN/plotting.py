@@ -11,6 +11,10 @@ This module contain functions for plotting the outcomes from nOEN analysis.
 
 - :func:`ecologicalGrid` for ...
 
+- :func:`renderCombs` for rendering the plots of a dimension D > 2 with one figure template (process pool worker).
+
+- :func:`plotHash` for the content hash of a plot (plots with unchanged results and style are not rendered again).
+
 - :func:`ecologicalMap` for ...
 
 """
@@ -20,38 +24,117 @@ warnings.simplefilter('ignore')
 
 import sys
 import os
-import shutil
+import json
+import hashlib
+from concurrent.futures import ProcessPoolExecutor
 
 import numpy as np
+import matplotlib
 import matplotlib.pyplot as plt
 from matplotlib import colors
-from getData import extractResults
+from getData import extractResults, iterComb, hasDim, queryCombs, askOverwrite, orthantTable, PATHS
+from monitor import message, timed
+
+STYLE = 1                       # Version of the plot style (change it to render all plots again)
+MANIFEST = '.ecoGrid.json'      # Content hashes of the plots of a folder
+CMAP = colors.LinearSegmentedColormap.from_list('', ['orangered', 'white', 'forestgreen'])
+# CMAP = plt.colormaps['RdYlGn']
+
+
+def plotHash(*content):
+    """
+    - :input:`content` (object). Results and labels shown in the plot.
+    - :output:`key` (str). Content hash of the plot (including the plot style).
+
+    """
+    h = hashlib.sha256(str(STYLE).encode())
+    for c in content:
+        if isinstance(c, np.ndarray):
+            h.update(str(c.dtype).encode() + str(c.shape).encode())
+            h.update(np.ascontiguousarray(c).tobytes() if c.dtype != object else repr(c.tolist()).encode())
+        else:
+            h.update(repr(c).encode())
+
+    return h.hexdigest()
+
+
+def renderCombs(D, specs, fullPath):
+    """
+    - :input:`D` (int). Dimension/number of joint variables (D > 2).
+    - :input:`specs` (list). Plots to render: file name (`file`), iota coefficients (`iota`), p-value labels (`plabels`), orthant labels (`LSym`) and title (`title`).
+    - :input:`fullPath` (str). Folder of the plots.
 
-def ecologicalGrid(fileName, dictR, D = 0, varSelect = 0, only_sign = False):
-    print('\n>> Plotting...')
-    path = '../../Results/'
+    The figure (axes, colorbar, borders and layout) is built once and only
+    the content of each combination is updated before saving.
+
+    """
+    num_Oh = int(2**(D) / 2);
+    nTicks = np.arange(0.5, num_Oh+0.5)
+    fig, ax = plt.subplots(figsize=(2, num_Oh*1.45))
+    colormesh = ax.pcolormesh(np.zeros((num_Oh, 1)), cmap = CMAP, vmin = -1, vmax = 1)
+    cbar = fig.colorbar(colormesh, pad = 0.1)
+    cbar.set_label('$ι_{2}$')
+    ax.invert_yaxis()
+    title = ax.set_title('', fontweight="bold", pad = 15)
+    ax.set_yticks(nTicks)
+    ax.tick_params(axis='x', which='both', bottom=False, top=False,labelbottom=False)
+    # Borders
+    for i in range(num_Oh):
+        ax.hlines(i, 0.0, 1.0, colors = 'k', linewidth=1)
+    # p-values labels
+    texts = [fig.text(0.5, (num_Oh-i-1+0.5)/num_Oh, '', horizontalalignment='center', verticalalignment='center', transform=ax.transAxes) for i in range(num_Oh)]
+    layout = False
+    for spec in specs:
+        colormesh.set_array(np.array([spec['iota']]).T)
+        title.set_text(spec['title'])
+        ax.set_yticklabels(spec['LSym'])
+        for text, label in zip(texts, spec['plabels']):
+            text.set_text(label)
+        if not layout:
+            fig.tight_layout()
+            layout = True
+        fig.savefig(fullPath + spec['file'], bbox_inches='tight')
+    plt.close(fig)
+
+
+@timed('plotting')
+def ecologicalGrid(fileName, dictR, D = 0, varSelect = 0, only_sign = False, workers = 1, overwrite = None):
+    """
+    - :input:`fileName` (str). Name of file with data and info.
+    - :input:`dictR` (dict). Dictionary with dataset and nOEN outcomes.
+    - :input:`D` (list). Dimensions we want to plot (default: 0 -> 'All').
+    - :input:`varSelect` (list). Variables we want to plot (default: 0 -> 'All').
+    - :input:`only_sign` (bool). Only significant results (p < 0.05) (default: False).
+    - :input:`workers` (int). Number of worker processes rendering the plots of D > 2 (Agg backend) (default: 1).
+    - :input:`overwrite` (bool). Overwrite existing plots (default: None -> Ask the user).
+
+    Plots whose results and style are unchanged since the last run (same
+    content hash) are kept as they are; plots of previous runs that are not
+    part of this one are removed.
+
+    """
+    message('\n>> Plotting...')
+    path = PATHS['results']
     nameResults = fileName + '_ecologicalGrid'
     fullPath = path + nameResults + '/'
-    plotting = True
     if os.path.exists(fullPath):
-        val = input(f' > Do you want to overwrite existing plots of `{fullPath}`? [Y/N]: ')
-        if val == 'Y' or val == 'y':
-            shutil.rmtree(fullPath, ignore_errors=True)
-            os.makedirs(fullPath)
-        else:
-            print(' > Plotting was stopped by the user.')
+        if not askOverwrite(f' > Do you want to overwrite existing plots of `{fullPath}`? [Y/N]: ', overwrite):
+            message(' > Plotting was stopped by the user.')
             return
-    else:
-        os.makedirs(fullPath)
-    if not plotting:
-        pass
-    print(' > Creating and saving plots...')
+    os.makedirs(fullPath, exist_ok = True)
+    message(' > Creating and saving plots...')
+    # Content hashes of existing plots (plots with unchanged results and style are not rendered again)
+    manifest = {}
+    if os.path.isfile(fullPath + MANIFEST):
+        with open(fullPath + MANIFEST) as f:
+            manifest = json.load(f)
+    produced = set()
+    executor = None
     # Extract general data
     nameVar = dictR['data']['varNames']
     numVar = dictR['data']['numVar']
     # Plotting options
-    cmap = colors.LinearSegmentedColormap.from_list('', ['orangered', 'white', 'forestgreen'])
-    # cmap = plt.colormaps['RdYlGn']
+    cmap = CMAP
     nTicks = np.arange(0.5, numVar+0.5)
     if D == 0:
         vD = np.arange(2, numVar+1)
@@ -64,10 +147,13 @@ def ecologicalGrid(fileName, dictR, D = 0, varSelect = 0, only_sign = False):
         D_field = 'D' + str(iD)
         # Extract combinations
         iNumCoeff = dictR['comb']['numcoeff'] 
-        combs = dictR['comb'][D_field]
         if iD-1 > len(iNumCoeff):
-            print('Error: Requested dimension higher than number of variables.')
+            message('Error: Requested dimension higher than number of variables.')
             sys.exit()
+        if not hasDim(dictR, iD):
+            message(f' > Dimension {iD} not analysed.')
+            continue
+        combs = iterComb(dictR, iD)
         if iD == 2:
             # Extract results
             mIota = np.zeros((numVar, numVar))
@@ -84,9 +170,15 @@ def ecologicalGrid(fileName, dictR, D = 0, varSelect = 0, only_sign = False):
             mNumObs = mNumObs.T
             # Check if correlation(s) are significative
             check_sign = (mPval[mPval != 0] < 0.051).any()
+            files = [f'ecoGrid_{D_field}_iota.png', f'ecoGrid_{D_field}_numObs.png']
+            key = plotHash(D_field, nameVar, mIota, mPval, mNumObs)
             if not check_sign and only_sign:
-                print(f' > No significant pairwise data trends were found ({iD})' )
+                message(f' > No significant pairwise data trends were found ({iD})' )
+            elif all(manifest.get(f) == key and os.path.isfile(fullPath + f) for f in files):
+                produced.update(files)
             else:
+                produced.update(files)
+                manifest.update({f: key for f in files})
                 # p-value labels
                 plabels = np.zeros(mPval.shape, dtype = object)
                 plabels[mPval == 999.0] = ''
@@ -115,7 +207,7 @@ def ecologicalGrid(fileName, dictR, D = 0, varSelect = 0, only_sign = False):
                     for j in range(numVar):
                         fig.text((i+0.5)/(numVar), (numVar-j-1+0.5)/numVar, plabels[j,i], horizontalalignment='center', verticalalignment='center', transform=ax.transAxes)
                 fig.tight_layout()
-                fig.savefig(fullPath + f'ecoGrid_{D_field}_iota', bbox_inches='tight')
+                fig.savefig(fullPath + files[0], bbox_inches='tight')
                 plt.close()
                 # Plot number of observations
                 fig, ax = plt.subplots()
@@ -131,11 +223,15 @@ def ecologicalGrid(fileName, dictR, D = 0, varSelect = 0, only_sign = False):
                     for j in range(numVar):
                         fig.text((i+0.5)/(numVar), (numVar-j-1+0.5)/numVar, mNumObs[j,i], horizontalalignment='center', verticalalignment='center', transform=ax.transAxes)
                 fig.tight_layout()
-                fig.savefig(fullPath + f'ecoGrid_{D_field}_numObs', bbox_inches='tight')
+                fig.savefig(fullPath + files[1], bbox_inches='tight')
                 plt.close()
         else:
+            if not varSelect == 0:
+                # Combinations with all selected variables (inverted index)
+                combs = queryCombs(dictR, iD, varSelect, 'all')[1]
             num_Oh = int(2**(iD) / 2);
-            nTicks = np.arange(0.5, num_Oh+0.5)
+            mSymU, mSymD = orthantTable(iD)['arrows']          # Signs of the paired orthants as arrows (↑/↓)
+            specs = []
             for iComb in combs:
                 iComb = iComb - 1
                 iNames = nameVar[iComb].astype(str)
@@ -143,27 +239,12 @@ def ecologicalGrid(fileName, dictR, D = 0, varSelect = 0, only_sign = False):
                 cleanNames = cleanNames.replace('[', '')
                 cleanNames = cleanNames.replace(']', '')
                 cleanNames = cleanNames.replace("'", '')
-                if not varSelect == 0:
-                    # Check if variable(s) is present in combination `c`
-                    vcVar = []
-                    for ivS in varSelect:
-                        checkVar = np.isin(ivS, iNames)
-                        vcVar.append(checkVar)
-                    if not all(vcVar):
-                        continue
-                mIota, mPval, num_obs, _, mSymU, mSymD = extractResults(dictR, iD, iComb)
+                mIota, mPval, num_obs, _, _, _ = extractResults(dictR, iD, iComb)
                 # Check if correlation(s) are significative
                 check_sign = (mPval[mPval != 0] < 0.051).any()
                 if not check_sign and only_sign:
-                    print(f' > No significant data trends were found for [{cleanNames}] (D{iD}) | min(p-value) = {min(mPval)}; n = {num_obs}.' )
+                    message(f' > No significant data trends were found for [{cleanNames}] (D{iD}) | min(p-value) = {min(mPval)}; n = {num_obs}.' )
                 else:
-                    mSym = [mSymU, mSymD]
-                    mSym = np.char.replace(mSym, ['['], [''])
-                    mSym = np.char.replace(mSym, [']'], [''])
-                    mSym = np.char.replace(mSym, ['+'], ['↑'])
-                    mSym = np.char.replace(mSym, ['-'], ['↓'])
-                    mSymU = mSym[0, :]
-                    mSymD = mSym[1, :]
                     # Plot labels
                     leftLSym = []
                     rightLSym = []
@@ -182,23 +263,28 @@ def ecologicalGrid(fileName, dictR, D = 0, varSelect = 0, only_sign = False):
                     plabels[mPval < 0.001] = "▪ ▪ ▪";
                     # Title
                     title_ = f'{cleanNames} | # observations: {num_obs}'
-                    # Plotting Iota (nD)
-                    fig, ax = plt.subplots(figsize=(2, num_Oh*1.45))
-                    colormesh = ax.pcolormesh(np.array([mIota.astype(float)]).T, cmap = cmap, vmin = -1, vmax = 1)
-                    cbar = fig.colorbar(colormesh, pad = 0.1)
-                    cbar.set_label('$ι_{2}$')
-                    ax.invert_yaxis()
-                    plt.title(title_, fontweight="bold", pad = 15)
-                    plt.yticks(nTicks, LSym)
-                    plt.tick_params(axis='x', which='both', bottom=False, top=False,labelbottom=False)
-                    # Borders
-                    for i in range(num_Oh):
-                        plt.hlines(i, 0.0, 1.0, colors = 'k', linewidth=1)
-                    # p-values labels
-                    for i in range(num_Oh):
-                            fig.text(0.5, (num_Oh-i-1+0.5)/num_Oh, plabels[i], horizontalalignment='center', verticalalignment='center', transform=ax.transAxes)
-                    fig.tight_layout()
                     fileNames = cleanNames.replace(' ', '_')
-                    fig.savefig(fullPath + f'ecoGrid_{D_field}_{fileNames}.png', bbox_inches='tight')
-                    plt.close()
-    print('>> Plotting done.')
\ No newline at end of file
+                    spec = {'file': f'ecoGrid_{D_field}_{fileNames}.png', 'iota': np.asarray(mIota, dtype = float), 'plabels': [str(l) for l in plabels], 'LSym': LSym, 'title': title_}
+                    key = plotHash(D_field, spec['iota'], spec['plabels'], LSym, title_)
+                    produced.add(spec['file'])
+                    if manifest.get(spec['file']) != key or not os.path.isfile(fullPath + spec['file']):
+                        manifest[spec['file']] = key
+                        specs.append(spec)
+            # Rendering (figure template per dimension; process pool if workers > 1)
+            if workers > 1 and len(specs) > 1:
+                if executor is None:
+                    executor = ProcessPoolExecutor(max_workers = workers, initializer = matplotlib.use, initargs = ('Agg',))
+                chunks = [specs[i::4*workers] for i in range(min(len(specs), 4*workers))]
+                list(executor.map(renderCombs, [iD] * len(chunks), chunks, [fullPath] * len(chunks)))
+            elif specs:
+                renderCombs(iD, specs, fullPath)
+    if executor is not None:
+        executor.shutdown()
+    # Plots of previous runs that are not part of this one
+    for f in os.listdir(fullPath):
+        if f.startswith('ecoGrid_') and f.endswith('.png') and f not in produced:
+            os.remove(fullPath + f)
+    manifest = {f: k for f, k in manifest.items() if f in produced}
+    with open(fullPath + MANIFEST, 'w') as f:
+        json.dump(manifest, f, indent = 0)
+    message('>> Plotting done.')
\ No newline at end of file
@@ -0,0 +1,291 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 by Eloi Martinez-Rabert.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+# doctest: +NORMALIZE_WHITESPACE
+# doctest: +SKIP
+
+"""
+This module contain the local nOEN server (daemon). It keeps the imports,
+the loaded datasets (sessions), their nOEN outcomes and caches and a process
+pool resident, so interactive queries (e.g., one dimension, a few variables
+or only significant results) do not start nOEN from cold.
+
+- :class:`Server` runs the jobs (load, analyse, export, plot, save, drop, status and shutdown) on the sessions in memory.
+
+- :class:`JobHandler` for the protocol: one JSON job per line, one JSON reply per line (see :func:`client.submit`).
+
+- :func:`serve` for listening on a Unix socket or a localhost port.
+
+Example:
+    python server.py -workers 8 -address /tmp/nOEN.sock
+    python client.py analyse -filename template -dim 2 -address /tmp/nOEN.sock
+    python client.py export -filename template -dim 2 -onlysig -format csv -address /tmp/nOEN.sock
+
+"""
+
+import os
+import io
+import sys
+import json
+import time
+import socket
+import argparse
+import threading
+import contextlib
+import socketserver
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import resource_tracker
+
+import matplotlib
+matplotlib.use('Agg')           # No display: plots are only saved
+
+from session import Session, analyseBatch
+from stats import setMemoryCap
+from getData import hasDim, PATHS
+from monitor import message, enableMonitor, resetMonitor, getProfile
+from client import ADDRESS, parseAddress
+
+
+class Server:
+    """
+    - :input:`workers` (int). Number of worker processes of the resident pool (default: 1 -> Serial runs, no pool).
+    - :input:`overwrite` (bool). Overwrite existing results, Excel and plots (default: True; the server cannot ask).
+    - :input:`dataPath` (str). Folder of the datasets (default: None -> `PATHS['data']`).
+    - :input:`resultsPath` (str). Folder of the results (default: None -> `PATHS['results']`).
+
+    Sessions are kept by (fileName, dataPath, resultsPath). Dimensions
+    analysed by the server are not analysed again with the same settings
+    (unless `force`). Data files are not watched: `load` with `force` reads
+    them again. Jobs run one at a time (`status` answers at any time).
+
+    """
+
+    def __init__(self, workers = 1, overwrite = True, dataPath = None, resultsPath = None):
+        self.workers = workers
+        self.overwrite = overwrite
+        self.dataPath = dataPath
+        self.resultsPath = resultsPath
+        self.sessions = {}
+        self.settings = {}      # Settings of the dimensions analysed by the server ({key: {D: settings}})
+        self.lock = threading.Lock()
+        self.start = time.time()
+        self.numJobs = 0
+        self.executor = None
+        self.startPool()
+        self.jobs = {'load': self.load, 'analyse': self.analyse, 'export': self.export, 'plot': self.plot,
+                     'save': self.save, 'drop': self.drop, 'status': self.status, 'shutdown': self.status}
+
+    def startPool(self):
+        if self.workers > 1:
+            # Workers share the resource tracker of the server (shared memory blocks are unlinked by the server)
+            resource_tracker.ensure_running()
+            self.executor = ProcessPoolExecutor(max_workers = self.workers)
+            # Start the workers now, not with the first query
+            list(self.executor.map(abs, range(self.workers)))
+
+    def close(self):
+        if self.executor is not None:
+            self.executor.shutdown(cancel_futures = True)
+            self.executor = None
+
+    def session(self, job, reload = False):
+        """
+        - :input:`job` (dict). Job with `fileName` (and optional `dataPath`, `resultsPath` and `overwrite`).
+        - :input:`reload` (bool). Read the data file (and saved outcomes) again (default: False).
+        - :output:`key`, `session`. Key and session of the dataset (loaded if needed).
+
+        """
+        fileName = job.get('fileName')
+        if not fileName:
+            raise ValueError('`fileName` is required.')
+        key = (fileName, job.get('dataPath', self.dataPath), job.get('resultsPath', self.resultsPath))
+        if key not in self.sessions or reload:
+            session = Session(*key)
+            session.load()
+            self.sessions[key] = session
+            self.settings[key] = {}
+        session = self.sessions[key]
+        session.overwrite = job.get('overwrite', self.overwrite)
+
+        return key, session
+
+    def dims(self, session):
+        return [d for d in range(2, session.dict['data']['numVar'] + 1) if hasDim(session.dict, d)]
+
+    def load(self, job):
+        _, session = self.session(job, job.get('force', False))
+
+        return {'numVar': int(session.dict['data']['numVar']), 'varNames': [str(v) for v in session.dict['data']['varNames']], 'dims': self.dims(session)}
+
+    def analyse(self, job):
+        key, session = self.session(job)
+        Dim = job.get('Dim', 0)
+        vD = list(range(2, session.dict['data']['numVar'] + 1)) if Dim == 0 else sorted({int(d) for d in Dim})
+        settings = [bool(job.get('infoInocula', False)), int(job.get('permutations', 0)), int(job.get('seed', 0)), int(job.get('approxPairs', 0)), float(job.get('approxTol', 0))]
+        done = self.settings[key]
+        todo = [d for d in vD if job.get('force', False) or done.get(d) != settings]
+        if todo:
+            analyseBatch([session], todo, settings[0], self.workers, job.get('lattice', False), job.get('cacheBudget', 512),
+                         settings[1], settings[2], executor = self.executor, approxPairs = settings[3], approxTol = settings[4])
+            done.update({d: settings for d in todo})
+        if job.get('save', False):
+            session.save()
+
+        return {'analysed': todo, 'inMemory': [d for d in vD if d not in todo]}
+
+    def export(self, job):
+        _, session = self.session(job)
+        fmt = job.get('fmt', 'xlsx')
+        session.export(job.get('Dim', 0), job.get('varSelect', 0), job.get('onlySig', False), fmt)
+        with session.paths():
+            path = PATHS['results']
+
+        return {'file': os.path.abspath(path + session.fileName + '_results.' + fmt)}
+
+    def plot(self, job):
+        _, session = self.session(job)
+        session.plot(job.get('Dim', 0), job.get('varSelect', 0), job.get('onlySig', False), job.get('workers', 1))
+
+        return {}
+
+    def save(self, job):
+        _, session = self.session(job)
+        session.save()
+
+        return {}
+
+    def drop(self, job):
+        key = (job.get('fileName'), job.get('dataPath', self.dataPath), job.get('resultsPath', self.resultsPath))
+        self.settings.pop(key, None)
+
+        return {'dropped': self.sessions.pop(key, None) is not None}
+
+    def status(self, job):
+        return {'workers': self.workers, 'uptime': time.time() - self.start, 'jobs': self.numJobs,
+                'sessions': [{'fileName': key[0], 'dataPath': key[1], 'resultsPath': key[2], 'dims': self.dims(session)}
+                             for key, session in list(self.sessions.items())]}
+
+    def run(self, job):
+        """
+        - :input:`job` (dict). Job: {'job': name, ...} with the inputs of the job (e.g., `fileName`, `Dim`, `varSelect`, `onlySig`, `fmt`).
+        - :output:`reply` (dict). `ok`, `time` (s), `log` (messages of nOEN), `profile` (time of each stage) and the output of the job (or `error`).
+
+        """
+        handler = self.jobs.get(job.get('job')) if isinstance(job, dict) else None
+        if handler is None:
+            return {'ok': False, 'error': 'Unknown job. Jobs: ' + ', '.join(self.jobs) + '.'}
+        if handler == self.status:
+            return dict(self.status(job), ok = True)
+        start = time.perf_counter()
+        log = io.StringIO()
+        with self.lock:
+            self.numJobs += 1
+            resetMonitor()
+            try:
+                with contextlib.redirect_stdout(log):
+                    reply = dict(handler(job), ok = True)
+            except SystemExit:
+                # nOEN errors (e.g., file or inocula not found) are messages followed by `sys.exit`
+                lines = log.getvalue().strip().splitlines()
+                reply = {'ok': False, 'error': lines[-1].strip() if lines else 'Job aborted.'}
+            except BrokenProcessPool:
+                self.close()
+                self.startPool()
+                reply = {'ok': False, 'error': 'A worker process died; the pool was restarted.'}
+            except Exception as e:
+                reply = {'ok': False, 'error': type(e).__name__ + ': ' + str(e)}
+            profile = getProfile()
+        sys.stdout.write(log.getvalue())
+        sys.stdout.flush()
+        reply.update(time = time.perf_counter() - start, log = log.getvalue().splitlines(), profile = {key: profile[key] for key in ('stages', 'dims', 'tiles')})
+
+        return reply
+
+
+class JobHandler(socketserver.StreamRequestHandler):
+    """
+    One JSON job per line; one JSON reply per line (several jobs per connection).
+
+    """
+
+    def handle(self):
+        for line in self.rfile:
+            if not line.strip():
+                continue
+            try:
+                job = json.loads(line)
+            except ValueError:
+                job = None
+                reply = {'ok': False, 'error': 'Job is not valid JSON.'}
+            else:
+                reply = self.server.nOEN.run(job)
+            self.wfile.write(json.dumps(reply, default = lambda o: o.item() if hasattr(o, 'item') else str(o)).encode() + b'\n')
+            self.wfile.flush()
+            if isinstance(job, dict) and job.get('job') == 'shutdown':
+                threading.Thread(target = self.server.shutdown).start()
+                return
+
+
+def serve(address = ADDRESS, workers = 1, overwrite = True, dataPath = None, resultsPath = None, preload = (), memCap = 0):
+    """
+    - :input:`address` (str). `HOST:PORT` (localhost only) or path of a Unix socket (see :func:`client.parseAddress`) (default: `client.ADDRESS`).
+    - :input:`preload` (list). Names of files loaded before the first query (default: ()).
+    - :input:`memCap` (float). Memory cap (MB) per process of the pairwise kernels (see :func:`stats.setMemoryCap`) (default: 0 -> No cap).
+
+    Other inputs: see :class:`Server`. Runs until a `shutdown` job (or Ctrl+C).
+
+    """
+    family, addr = parseAddress(address)
+    if family == socket.AF_INET:
+        if addr[0] not in ('localhost', '127.0.0.1', '::1'):
+            message('Error: the nOEN server only listens on localhost.')
+            sys.exit()
+        serverClass = socketserver.ThreadingTCPServer
+    else:
+        if os.path.exists(addr):
+            os.remove(addr)
+        serverClass = socketserver.ThreadingUnixStreamServer
+    serverClass.allow_reuse_address = True
+    serverClass.daemon_threads = True
+    enableMonitor(True, False)
+    setMemoryCap(memCap)
+    nOEN = Server(workers, overwrite, dataPath, resultsPath)
+    try:
+        for fileName in preload:
+            nOEN.run({'job': 'load', 'fileName': fileName})
+        with serverClass(addr, JobHandler) as server:
+            server.nOEN = nOEN
+            message('>> nOEN server listening on `' + address + '` (' + str(workers) + ' workers).')
+            try:
+                server.serve_forever()
+            except KeyboardInterrupt:
+                pass
+    finally:
+        nOEN.close()
+        if family != socket.AF_INET and os.path.exists(addr):
+            os.remove(addr)
+    message('>> nOEN server stopped.')
+
+
+# Command Line Interface (CLI)
+parser = argparse.ArgumentParser(description = '> Local nOEN server. Keeps datasets, outcomes and a process pool in memory and runs the jobs sent with client.py.')
+parser.add_argument('-address', dest = 'address', default = ADDRESS, action = 'store',
+                    help = '[str] Address of the server: HOST:PORT (localhost) or path of a Unix socket (Default: ' + ADDRESS + ').')
+parser.add_argument('-workers', dest = 'workers', default = 1, type = int, action = 'store',
+                    help = '[int] Number of worker processes kept by the server (Default: 1 -> Serial runs).')
+parser.add_argument('-filename', dest = 'preload', default = [], nargs = '+', action = 'store',
+                    help = '[list] Names of files loaded at start (Default: None).')
+parser.add_argument('-no-overwrite', '--no-overwrite', dest = 'overwrite', default = True, action = 'store_false',
+                    help = '[bool] Never overwrite existing results, Excel and plots (Default: False -> Overwrite).')
+parser.add_argument('-memMB', dest = 'memCap', default = 0, type = float, action = 'store',
+                    help = '[float] Memory cap (MB) per process of the pairwise kernels (Default: 0 -> No cap, tiles of 64 MB).')
+parser.add_argument('-dataPath', dest = 'dataPath', default = None, action = 'store',
+                    help = '[str] Folder of the data files (Default: ../../Data).')
+parser.add_argument('-resultsPath', dest = 'resultsPath', default = None, action = 'store',
+                    help = '[str] Folder of the results (Default: ../../Results).')
+if __name__ == '__main__':
+    args = parser.parse_args()
+    serve(args.address, args.workers, args.overwrite, args.dataPath, args.resultsPath, args.preload, args.memCap)
@@ -0,0 +1,175 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 by Eloi Martinez-Rabert.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+# doctest: +NORMALIZE_WHITESPACE
+# doctest: +SKIP
+
+"""
+This module contain the in-memory nOEN session (Python API).
+
+- :class:`Session` holds the dataset, nOEN outcomes and caches of one data file in memory across calls to load, analyse, save, export and plot.
+
+- :func:`analyseBatch` for the analysis of several sessions (datasets) on one shared process pool.
+
+Example:
+    session = Session('template', dataPath = 'Data', resultsPath = 'Results', overwrite = True)
+    session.load()
+    session.analyse(Dim = [2, 3], workers = 4)
+    session.save()
+    session.export(fmt = 'csv')
+    session.plot(D = [2])
+
+"""
+
+import sys
+
+from stats import nOEN, nOENbatch, appendObservations
+from getData import loadData, loadResults, readData, createDict, writeResults, usePaths
+from plotting import ecologicalGrid
+from monitor import message
+
+
+class Session:
+    """
+    - :input:`fileName` (str). Name of file with data and info.
+    - :input:`dataPath` (str). Folder of the datasets (default: None -> `PATHS['data']`).
+    - :input:`resultsPath` (str). Folder of the results (default: None -> `PATHS['results']`).
+    - :input:`overwrite` (bool). Overwrite existing results, Excel and plots (default: None -> Ask the user).
+
+    Nothing is written unless :meth:`save`, :meth:`export` or :meth:`plot`
+    are called. The dictionary with dataset and outcomes (`dict`) and its
+    caches (ranks, pairwise signs and row masks) stay in memory, so later
+    calls (e.g., other dimensions or exports) do not read them again.
+
+    """
+
+    def __init__(self, fileName, dataPath = None, resultsPath = None, overwrite = None):
+        self.fileName = fileName
+        self.dataPath = dataPath
+        self.resultsPath = resultsPath
+        self.overwrite = overwrite
+        self.dict = None
+
+    def paths(self):
+        return usePaths(self.dataPath, self.resultsPath)
+
+    def load(self):
+        """
+        Dataset (and saved outcomes, if any) of `fileName`. A new dataset is not saved.
+
+        """
+        with self.paths():
+            self.dict = loadData(self.fileName, save = False)
+
+        return self
+
+    def read(self):
+        """
+        Saved outcomes of `fileName` (see :func:`getData.loadResults`).
+
+        """
+        with self.paths():
+            self.dict = loadResults(self.fileName)
+
+        return self
+
+    def analyse(self, Dim = 0, infoInocula = False, workers = 1, lattice = False, cacheBudget = 512, permutations = 0, seed = 0,
+                checkpoint = False, checkpointEvery = 300, resume = False, approxPairs = 0, approxTol = 0):
+        """
+        - :input:`checkpoint` (bool). Save checkpoints of the completed combinations (default: False).
+
+        Other inputs: see :func:`stats.nOEN`.
+
+        """
+        if self.dict is None:
+            self.load()
+        with self.paths():
+            self.dict = nOEN(self.dict, Dim, infoInocula, workers, lattice, cacheBudget, permutations = permutations, seed = seed,
+                             checkpoint = self.fileName if checkpoint or resume else None, checkpointEvery = checkpointEvery, resume = resume,
+                             approxPairs = approxPairs, approxTol = approxTol)
+
+        return self
+
+    def append(self):
+        """
+        New observations of the data file appended to the saved outcomes (see :func:`stats.appendObservations`).
+
+        """
+        with self.paths():
+            di, df, _ = readData(self.fileName)
+            self.dict = appendObservations(self.dict if self.dict is not None else loadResults(self.fileName), di, df)
+
+        return self
+
+    def save(self):
+        """
+        Outcomes saved in the results store (see :func:`getData.saveStore`).
+
+        """
+        with self.paths():
+            createDict('saveDict', self.dict, self.fileName, self.overwrite)
+
+        return self
+
+    def export(self, Dim = 0, varSelect = 0, onlySig = False, fmt = 'xlsx'):
+        """
+        Outcomes in memory written to Excel, CSV or Parquet (see :func:`getData.writeResults`).
+
+        """
+        with self.paths():
+            writeResults(self.fileName, Dim, varSelect, onlySig, fmt, self.overwrite, self.dict)
+
+        return self
+
+    def plot(self, D = 0, varSelect = 0, only_sign = False, workers = 1):
+        """
+        Ecological grids of the outcomes in memory (see :func:`plotting.ecologicalGrid`).
+
+        """
+        with self.paths():
+            ecologicalGrid(self.fileName, self.dict, D, varSelect, only_sign, workers, self.overwrite)
+
+        return self
+
+
+def analyseBatch(sessions, Dim = 0, infoInocula = False, workers = 1, lattice = False, cacheBudget = 512, permutations = 0, seed = 0, onDone = None,
+                 executor = None, approxPairs = 0, approxTol = 0, checkpoint = False, checkpointEvery = 300, resume = False):
+    """
+    - :input:`sessions` (list). Sessions of the datasets (loaded if needed). Names of files must be unique.
+    - :input:`onDone` (function). Called with the session of each dataset as soon as all its combinations are done, e.g., to save and export it (default: None).
+    - :input:`executor` (ProcessPoolExecutor). Process pool kept by the caller (default: None -> New pool).
+    - :input:`checkpoint` (bool). Save checkpoints of the completed combinations of each dataset (default: False).
+    - :output:`sessions` (list). Sessions with the nOEN outcomes.
+
+    Other inputs: see :func:`stats.nOEN`. The combinations of all datasets
+    share one process pool (see :func:`stats.nOENbatch`). Checkpoints are
+    saved in the results folder of the sessions, which must be the same for
+    all of them.
+
+    """
+    byName = {}
+    for session in sessions:
+        if session.dict is None:
+            session.load()
+        byName[session.fileName] = session
+    checkpoints = None
+    if checkpoint or resume:
+        if len({(session.dataPath, session.resultsPath) for session in sessions}) > 1:
+            message('Error: Checkpoints of a batch need the same folders of data and results for all datasets.')
+            sys.exit()
+        checkpoints = {name: name for name in byName}
+
+    def done(name, dDict):
+        session = byName[name]
+        session.dict = dDict
+        if onDone is not None:
+            onDone(session)
+
+    with sessions[0].paths() if checkpoints else usePaths():
+        nOENbatch({name: session.dict for name, session in byName.items()}, Dim, infoInocula, workers, lattice, cacheBudget,
+                  permutations = permutations, seed = seed, onDone = done, executor = executor, approxPairs = approxPairs, approxTol = approxTol,
+                  checkpoints = checkpoints, checkpointEvery = checkpointEvery, resume = resume)
+
+    return sessions
@@ -9,151 +9,1752 @@
 """
 This module contain functions to perform multivariate rank correlation coefficient.
 
+- :func:`missingMask` for the missing values of a dataset (values or ranks).
+
+- :func:`setMemoryCap`, :func:`tileSize`, :func:`pairIndices` and :func:`pairRange` for the memory-bounded tiles of observation pairs.
+
+- :func:`pairSignCache` for the bit-packed pairwise sign and tie matrices of a dataset.
+
+- :func:`cachedOrthantCount` for counting the observation pairs of a variable combination that fall in each orthant.
+
+- :func:`maskCache` for the pairwise sign cache of a row mask (shared by the combinations selecting the same observations).
+
+- :func:`orthantCount` for counting the observation pairs that fall in each orthant (tiles of observation pairs, no cache).
+
+- :func:`extendCodes` for appending variables to the orthant codes of a combination.
+
+- :func:`inversionCount` for counting the inversions of a rank vector (vectorized merge sort).
+
+- :func:`kendallCount` for counting concordant and discordant pairs in O(n log n) when D = 2 (Knight's algorithm).
+
 - :func:`formalism_Oh` for the computation of the summation of individual data trend coefficient calculation.
 
+- :func:`pairedOrthants` and :func:`orthantSymbols` for the signs of the paired orthants of dimension D (see :func:`getData.orthantTable`).
+
+- :func:`coeffBatch` for the delta and iota coefficients (and p-values) of a block of combinations.
+
 - :func:`multivarcorr` for the calculus of Tau-N coefficients.
 
-- :func:`nOEN` for n-Order Ecological Network analysis (nOEN).
+- :func:`countBatch` for the paired orthant counts of a block of combinations.
+
+- :func:`multivarcorr_batch` for the calculus of Tau-N coefficients of a block of combinations of the same dimension.
+
+- :func:`sampleSize`, :func:`samplePairs`, :func:`sampledCI` and :func:`sampledCoeff` for the approximate mode (coefficients estimated from a sample of observation pairs, with confidence intervals).
+
+- :func:`permutationTest` for empirical (permutation) p-values of the delta and iota coefficients of a combination.
+
+- :func:`blockCoeff` for the coefficients of a block of combinations of variables.
+
+- :func:`latticeCoeff` for the coefficients of a sub-lattice of combinations, reusing the orthant codes of parent combinations.
+
+- :func:`combChunk` for the coefficients of a chunk of combinations (process pool worker).
+
+- :func:`nOEN` for n-Order Ecological Network analysis (nOEN), in three steps: :func:`prepareRun`, compute and :func:`finishRun`.
+
+- :func:`nOENbatch` for nOEN analysis of several datasets on one shared process pool (:func:`batchChunk`).
+
+- :func:`appendCounts` and :func:`appendObservations` for appending new observations to saved outcomes (only new pairs are compared).
 
 """
 
 import sys
+import time
+import contextlib
+from collections import OrderedDict
+import hashlib
 
 import numpy as np
 import math
 from scipy.stats import norm, gmean
-from itertools import product
+from itertools import combinations
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from multiprocessing import shared_memory
+
+from getData import iterComb, coeffEntry, orthantTable, combIter, dataRanks, saveCheckpoint, loadCheckpoint, clearCheckpoint
+from monitor import message, stage, recordDim, recordTile, takeTiles, enableMonitor, monitorEnabled, startProgress, advanceProgress, endProgress
+
+MEMORY = {'capMB': 0, 'tileMB': 64}     # Memory cap of a run and size of the tiles of observation pairs (MB)
+
+
+def missingMask(dataset):
+    """
+    - :input:`dataset` (np.array). Values or ranks (unsigned integers, see :func:`getData.rankData`).
+    - :output:`missing` (np.array). Boolean mask of the missing values (NaN or largest rank of the type).
+
+    """
+    dataset = np.asarray(dataset)
+    if dataset.dtype.kind == 'u':
+        return dataset == np.iinfo(dataset.dtype).max
+
+    return np.isnan(np.asarray(dataset, dtype = float))
+
+
+def setMemoryCap(capMB = 0):
+    """
+    - :input:`capMB` (float). Memory cap (MB) per process of a run (default: 0 -> No cap, tiles of 64 MB).
+
+    Pairwise kernels work on tiles of observation pairs of a quarter of the
+    cap, and the pairwise sign cache is not built if it needs more than half
+    of the cap (see :func:`prepareRun`).
+
+    """
+    MEMORY['capMB'] = float(capMB)
+    MEMORY['tileMB'] = capMB / 4 if capMB > 0 else 64
+
+
+def tileSize(bytesPerPair):
+    """
+    - :input:`bytesPerPair` (int). Bytes of the temporary arrays of a kernel per observation pair.
+    - :output:`numPairs` (int). Number of observation pairs of a tile (multiple of 8, i.e., whole bytes of the packed bits).
+
+    """
+    return max(8, int(MEMORY['tileMB'] * 2**20 / bytesPerPair) // 8 * 8)
+
+
+def pairIndices(k, numObs):
+    """
+    - :input:`k` (np.array). Linear indices of observation pairs (np.triu_indices order).
+    - :input:`numObs` (int). Number of observations.
+    - :output:`ii`, `jj` (np.array). Observations of each pair (ii < jj).
+
+    """
+    n = int(numObs)
+    k = np.asarray(k, dtype = np.int64)
+    # Row ii of each index: first index of row ii is ii·(2n-ii-1)/2 (float estimate, then corrected)
+    ii = np.floor(((2*n - 1) - np.sqrt(np.maximum((2*n - 1)**2 - 8.0*k, 0))) / 2).astype(np.int64)
+    ii -= ii * (2*n - ii - 1) // 2 > k
+    ii += (ii + 1) * (2*n - ii - 2) // 2 <= k
+    jj = k - ii * (2*n - ii - 1) // 2 + ii + 1
 
-# from getData import loadResults, createDict
+    return ii, jj
+
+
+def pairRange(p0, p1, numObs):
+    """
+    - :input:`p0`, `p1` (int). First and last (excluded) linear indices of consecutive observation pairs (np.triu_indices order).
+    - :input:`numObs` (int). Number of observations.
+    - :output:`ii`, `jj` (np.array). Observations of each pair (ii < jj).
+
+    Faster than :func:`pairIndices` for a range: only the rows of its first
+    and last pairs are searched.
+
+    """
+    n = int(numObs)
+    if p1 <= p0:
+        return np.zeros(0, dtype = np.int64), np.zeros(0, dtype = np.int64)
+    i0, i1 = pairIndices([p0, p1 - 1], n)[0]
+    rows = np.arange(i0, i1 + 1, dtype = np.int64)
+    starts = np.maximum(rows * (2*n - rows - 1) // 2, p0)
+    ends = np.minimum((rows + 1) * (2*n - rows - 2) // 2, p1)
+    # jj = k - (first index of row ii) + ii + 1
+    ii = np.repeat(rows, ends - starts)
+    jj = np.arange(p0, p1, dtype = np.int64) - np.repeat(rows * (2*n - rows - 1) // 2 - rows - 1, ends - starts)
+
+    return ii, jj
+
+
+def pairSignCache(dataset, inocula = None, tiePairs = None, pairs = None):
+    """
+    - :input:`dataset` (np.array). Observations (rows) x variables (columns): values or ranks (see :func:`getData.rankData`).
+    - :input:`inocula` (np.array). Inocula (t_0) of the same observations (default: None).
+    - :input:`tiePairs` (np.array). Number of tied observation pairs of each variable (default: None -> Unknown).
+    - :input:`pairs` (np.array). Observation pairs (2 x pairs, ii < jj) of a sample (see :func:`samplePairs`) (default: None -> All pairs).
+    - :output:`cache` (dict). Bit-packed sign and tie matrices (variables x pairs).
+
+    For every observation pair (ii < jj, in np.triu_indices order) and every
+    variable k, bit `signs[k]` is (dataset[jj, k] - dataset[ii, k] > 0) and bit
+    `ties[k]` is (dataset[jj, k] - dataset[ii, k] == 0). Both only depend on
+    the variable, so the cache is built once per dataset and shared by all
+    variable combinations. If `inocula` is given, bit `present[k]` is set when
+    variable k is present in the inocula of both observations. Ranks are
+    compared directly (no subtraction), with pairs with a missing value
+    neither positive nor tied (as NaN differences), and the ties of variables
+    without tied pairs are not compared. With `pairs`, only the pairs of the
+    sample are cached (kept in `pairs`). Pairs are compared in tiles (see
+    :func:`tileSize`), so the temporary arrays do not grow with the number of
+    pairs.
 
-def formalism_Oh(N, numObs, dataset, paired_Oh, binomial):
+    """
+    dataset = np.asarray(dataset)
+    numObs, numVar = dataset.shape
+    numPairs = numObs * (numObs - 1) // 2 if pairs is None else np.shape(pairs)[1]
+    signs = np.empty((numVar, (numPairs + 7) // 8), dtype = np.uint8)
+    ties = np.zeros((numVar, (numPairs + 7) // 8), dtype = np.uint8)
+    present = None
+    if inocula is not None:
+        inocula = np.asarray(inocula).astype(bool)
+        present = np.empty((numVar, (numPairs + 7) // 8), dtype = np.uint8)
+    isRank = dataset.dtype.kind == 'u'
+    missing = missingMask(dataset) if isRank else None
+    # Tiles of consecutive pairs (whole bytes of the packed bits)
+    step = tileSize(40 + 3 * dataset.itemsize + (3 * numVar if present is not None else 0))
+    for p0 in range(0, numPairs, step):
+        t0 = time.perf_counter()
+        p1 = min(p0 + step, numPairs)
+        if pairs is not None:
+            ii, jj = pairs[0][p0:p1], pairs[1][p0:p1]
+        else:
+            ii, jj = pairRange(p0, p1, numObs)
+        b0, b1 = p0 // 8, (p1 + 7) // 8
+        for k in range(0, numVar):
+            if isRank:
+                a, b = dataset[ii, k], dataset[jj, k]
+                valid = None if not missing[:, k].any() else ~(missing[ii, k] | missing[jj, k])
+                signs[k, b0:b1] = np.packbits(b > a if valid is None else (b > a) & valid)
+                if tiePairs is None or tiePairs[k] > 0:
+                    ties[k, b0:b1] = np.packbits(b == a if valid is None else (b == a) & valid)
+            else:
+                diff = dataset[jj, k] - dataset[ii, k]
+                signs[k, b0:b1] = np.packbits(diff > 0)
+                ties[k, b0:b1] = np.packbits(diff == 0)
+        if present is not None:
+            present[:, b0:b1] = np.packbits(inocula[ii, :] & inocula[jj, :], axis = 0).T
+        recordTile('pairSignCache', p1 - p0, time.perf_counter() - t0, (p1 - p0) * (40 + 3 * dataset.itemsize + (3 * numVar if present is not None else 0)))
+    cache = {'numObs': numObs, 'numPairs': numPairs, 'signs': signs, 'ties': ties}
+    if pairs is not None:
+        cache['pairs'] = np.asarray(pairs)
+    if present is not None:
+        cache['present'] = present
+
+    return cache
+
+
+def cachedOrthantCount(cache, iCombi, rows = None):
+    """
+    - :input:`cache` (dict). Pairwise sign cache (see :func:`pairSignCache`) or sign cache of a row mask (see :func:`maskCache`).
+    - :input:`iCombi` (np.array). Column indices of the joint variables.
+    - :input:`rows` (np.array). Boolean mask of the observations to include (default: None -> 'All').
+    - :output:`F` (np.array). Number of untied observation pairs per paired orthant.
+    - :output:`numUntied` (int). Number of untied observation pairs.
+
+    The orthant code of a pair is the integer c = sum_k (diff_k > 0)·2^k, where
+    k is the position of the variable in `iCombi`. Pairs with any zero
+    difference are tied and discarded. Codes c and 2^D-1-c are the two halves
+    of paired orthant min(c, 2^D-1-c), so F has 2^(D-1) entries. Pairs are
+    counted in tiles (see :func:`tileSize`).
+
+    """
+    D = len(iCombi)
+    numPairs = cache['numPairs']
+    iCombi = np.asarray(iCombi, dtype = np.intp)
+    hist = np.zeros(2**D, dtype = np.int64)
+    numUntied = 0
+    pairRows = rows is not None and 'present' not in cache
+    # Tiles of consecutive pairs (whole bytes of the packed bits)
+    step = tileSize(10 + (17 if pairRows else 0))
+    for p0 in range(0, numPairs, step):
+        t0 = time.perf_counter()
+        p1 = min(p0 + step, numPairs)
+        b0, b1 = p0 // 8, (p1 + 7) // 8
+        # Tied data detection
+        untied = ~np.bitwise_or.reduce(np.array([cache['ties'][v][b0:b1] for v in iCombi]), axis = 0)
+        if rows is not None and not pairRows:
+            untied &= np.bitwise_and.reduce(cache['present'][iCombi, b0:b1], axis = 0)
+        elif pairRows:
+            ii, jj = (cache['pairs'][0][p0:p1], cache['pairs'][1][p0:p1]) if 'pairs' in cache else pairRange(p0, p1, cache['numObs'])
+            untied &= np.packbits(rows[ii] & rows[jj])
+        untied = np.unpackbits(untied, count = p1 - p0).astype(bool)
+        # Orthant codes
+        codes = np.zeros(p1 - p0, dtype = np.intp)
+        for k, v in enumerate(iCombi):
+            codes |= np.unpackbits(cache['signs'][v][b0:b1], count = p1 - p0).astype(np.intp) << k
+        codes = codes[untied]
+        hist += np.bincount(codes, minlength = 2**D)
+        numUntied += codes.size
+        recordTile('cachedOrthantCount', p1 - p0, time.perf_counter() - t0, (p1 - p0) * (10 + (17 if pairRows else 0)))
+    N = int(2**D/2)
+
+    return (hist[:N] + hist[:N-1:-1], int(numUntied))
+
+
+def maskCache(signCache, rows, iVars):
+    """
+    - :input:`signCache` (dict). Pairwise sign cache of all observations (see :func:`pairSignCache`), with the cached row masks (`groups`) and their memory budget in MB (`groupBudget`).
+    - :input:`rows` (np.array). Boolean mask of the observations present in the inocula of all `iVars`.
+    - :input:`iVars` (np.array). Column indices of the variables needed.
+    - :output:`cache` (dict). Sign and tie bits of the pairs of the observations in `rows` (one packed array per variable).
+
+    Combinations selecting the same observations (inocula) share one cache:
+    the bits of a variable are derived once per row mask, only for the pairs
+    of the selected observations. They are sub-masked from the smallest
+    cached mask that includes `rows` (or from `signCache`) instead of being
+    computed again, in tiles of pairs (see :func:`tileSize`). Least recently
+    used masks are released once the cached bits exceed `groupBudget`.
+
+    """
+    groups = signCache['groups']
+    key = np.packbits(rows).tobytes()
+    cache = groups.get(key)
+    if cache is None:
+        numObs = int(np.count_nonzero(rows))
+        cache = {'numObs': numObs, 'numPairs': numObs * (numObs - 1) // 2, 'rows': rows, 'signs': {}, 'ties': {}, 'nbytes': 0}
+        groups[key] = cache
+    groups.move_to_end(key)
+    missing = [int(v) for v in iVars if int(v) not in cache['signs']]
+    if missing:
+        # Smallest cached mask including `rows` with the missing variables (sub-masking)
+        src = signCache
+        for other in groups.values():
+            if other is not cache and other['numPairs'] < src['numPairs'] and all(v in other['signs'] for v in missing) and not np.any(rows & ~other['rows']):
+                src = other
+        iVars = np.asarray(iVars, dtype = np.intp)
+        pos = None if src is signCache else rows[src['rows']]
+        # Tiles of consecutive pairs of `src`; selected bits are packed as soon as they fill whole bytes
+        parts = {(bits, v): [] for v in missing for bits in ('signs', 'ties')}
+        carry = {key: np.zeros(0, dtype = bool) for key in parts}
+        step = tileSize(28)
+        for p0 in range(0, src['numPairs'], step):
+            t0 = time.perf_counter()
+            p1 = min(p0 + step, src['numPairs'])
+            b0, b1 = p0 // 8, (p1 + 7) // 8
+            if pos is None:
+                sel = np.unpackbits(np.bitwise_and.reduce(signCache['present'][iVars, b0:b1], axis = 0), count = p1 - p0).astype(bool)
+            else:
+                ii, jj = pairRange(p0, p1, src['numObs'])
+                sel = pos[ii] & pos[jj]
+                del ii, jj
+            sel = np.flatnonzero(sel)
+            for (bits, v), part in parts.items():
+                new = np.concatenate([carry[(bits, v)], np.unpackbits(src[bits][v][b0:b1], count = p1 - p0)[sel].astype(bool)])
+                whole = new.size // 8 * 8
+                part.append(np.packbits(new[:whole]))
+                carry[(bits, v)] = new[whole:]
+            recordTile('maskCache', p1 - p0, time.perf_counter() - t0, (p1 - p0) * 28)
+        for (bits, v), part in parts.items():
+            cache[bits][v] = np.concatenate(part + [np.packbits(carry[(bits, v)])])
+            cache['nbytes'] += cache[bits][v].nbytes
+        # Memory budget
+        total = sum(g['nbytes'] for g in groups.values())
+        while total > signCache['groupBudget'] * 2**20 and len(groups) > 1:
+            _, old = groups.popitem(last = False)
+            total -= old['nbytes']
+
+    return cache
+
+
+def pairedOrthantCount(codes, D):
+    """
+    - :input:`codes` (np.array). Orthant codes of the untied observation pairs.
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :output:`F` (np.array). Number of untied observation pairs per paired orthant.
+    - :output:`numUntied` (int). Number of untied observation pairs.
+
+    """
+    hist = np.bincount(codes, minlength = 2**D)
+    N = int(2**D/2)
+
+    return (hist[:N] + hist[:N-1:-1], int(codes.size))
+
+
+def extendCodes(codes, cache, iVars, k0, dtype = np.intp, p0 = 0, p1 = None):
+    """
+    - :input:`codes` (np.array). Orthant codes of the pairs p0..p1 for the first `k0` joint variables (None if k0 = 0).
+    - :input:`cache` (dict). Pairwise sign cache (see :func:`pairSignCache`).
+    - :input:`iVars` (list). Column indices of the variables appended to the combination.
+    - :input:`k0` (int). Number of variables already encoded in `codes`.
+    - :input:`dtype` (np.dtype). Signed integer type of the codes.
+    - :input:`p0`, `p1` (int). First and last (excluded) pairs of the tile; `p0` multiple of 8 (default: 0, None -> All pairs).
+    - :output:`codes` (np.array). Orthant codes of the pairs p0..p1 for the k0 + len(iVars) joint variables.
+
+    Tied pairs (and pairs not present in the inocula) get the code -1, which
+    is kept by the bitwise OR of any later sign bit.
+
+    """
+    p1 = cache['numPairs'] if p1 is None else p1
+    b0, b1 = p0 // 8, (p1 + 7) // 8
+    for k, v in enumerate(iVars, start = k0):
+        bits = np.unpackbits(cache['signs'][v][b0:b1], count = p1 - p0).astype(dtype)
+        bits <<= k
+        if codes is None:
+            codes = bits
+        elif k == k0:
+            # New array: `codes` of the parent combination may be cached
+            codes = codes | bits
+        else:
+            codes |= bits
+        del bits
+        bad = cache['ties'][v][b0:b1]
+        if 'present' in cache:
+            bad = bad | ~cache['present'][v][b0:b1]
+        codes[np.unpackbits(bad, count = p1 - p0).view(bool)] = -1
+
+    return codes
+
+
+def orthantCount(dataset):
+    """
+    - :input:`dataset` (np.array). Observations (rows) x variables (columns).
+    - :output:`F` (np.array). Number of untied observation pairs per paired orthant.
+    - :output:`numUntied` (int). Number of untied observation pairs.
+
+    Square tiles of observations (ii, jj) are compared directly, without any
+    pairwise cache: memory is bounded by the tile size (see :func:`tileSize`)
+    whatever the number of observations. Pairs with a missing value (NaN or
+    missing rank) are neither positive nor tied.
+
+    """
+    dataset = np.asarray(dataset)
+    numObs, D = dataset.shape
+    missing = missingMask(dataset)
+    valid = None if not missing.any() else ~missing
+    hist = np.zeros(2**D, dtype = np.int64)
+    numUntied = 0
+    side = max(1, math.isqrt(tileSize(24)))
+    for i0 in range(0, numObs, side):
+        A = dataset[i0:i0+side]
+        for j0 in range(i0, numObs, side):
+            t0 = time.perf_counter()
+            B = dataset[j0:j0+side]
+            codes = np.zeros((len(A), len(B)), dtype = np.intp)
+            tied = np.zeros((len(A), len(B)), dtype = bool)
+            for k in range(D):
+                a, b = A[:, k, np.newaxis], B[np.newaxis, :, k]
+                if valid is None:
+                    codes |= np.left_shift(b > a, k, dtype = np.intp)
+                    tied |= b == a
+                else:
+                    ok = valid[i0:i0+side, k, np.newaxis] & valid[np.newaxis, j0:j0+side, k]
+                    codes |= np.left_shift((b > a) & ok, k, dtype = np.intp)
+                    tied |= (b == a) & ok
+            untied = ~tied
+            if i0 == j0:
+                # Only pairs ii < jj
+                untied &= np.arange(len(B))[np.newaxis, :] > np.arange(len(A))[:, np.newaxis]
+            codes = codes[untied]
+            hist += np.bincount(codes, minlength = 2**D)
+            numUntied += codes.size
+            recordTile('orthantCount', len(A) * len(B), time.perf_counter() - t0, len(A) * len(B) * 24)
+    N = int(2**D/2)
+
+    return (hist[:N] + hist[:N-1:-1], int(numUntied))
+
+
+def inversionCount(r):
+    """
+    - :input:`r` (np.array). Integer ranks (0 <= r < len(r)).
+    - :output:`inv` (int). Number of strict inversions (i < j and r[i] > r[j]).
+
+    Bottom-up merge sort. Each level merges all pairs of adjacent sorted blocks
+    at once: blocks are offset by their pair index so that a single
+    searchsorted counts, for every element of a right block, the elements of
+    its left block that are greater.
+
+    """
+    n = r.size
+    idx = np.arange(n, dtype = np.int64)
+    v = np.asarray(r, dtype = np.int64)
+    inv = 0
+    w = 1
+    while w < n:
+        pair = idx // (2*w)
+        isRight = (idx // w) % 2 == 1
+        key = pair*n + v
+        left = key[~isRight]
+        hi = np.searchsorted(left, (pair[isRight] + 1)*n, side = 'left')
+        lo = np.searchsorted(left, key[isRight], side = 'right')
+        inv += int(np.sum(hi - lo))
+        # Merge
+        v = np.sort(key) - pair*n
+        w *= 2
+
+    return inv
+
+
+def kendallCount(dataset, tiePairs = None):
+    """
+    - :input:`dataset` (np.array). Observations (rows) x 2 variables (columns).
+    - :input:`tiePairs` (np.array). Number of tied pairs of each variable, only if `dataset` holds the dense ranks of all observations (see :func:`getData.rankData`) (default: None -> Computed).
+    - :output:`F` (np.array). Number of concordant and discordant untied pairs.
+    - :output:`numUntied` (int). Number of untied observation pairs.
+
+    Knight's O(n log n) algorithm: observations are sorted by the first variable
+    (ties broken by the second) and discordant pairs are the inversions of the
+    second variable. Pairs tied in any variable are discarded, as in
+    :func:`formalism_Oh`. Same output as :func:`orthantCount` for D = 2.
+
+    """
+    dataset = np.asarray(dataset)
+    numObs = dataset.shape[0]
+    perm = np.lexsort((dataset[:, 1], dataset[:, 0]))
+    x = dataset[perm, 0]
+    y = dataset[perm, 1]
+    # Tied pairs (first variable, second variable and both)
+    if tiePairs is not None:
+        n1, n2 = int(tiePairs[0]), int(tiePairs[1])
+        r = y
+    else:
+        _, t = np.unique(x, return_counts = True)
+        n1 = int(np.sum(t*(t - 1)//2))
+        _, r, t = np.unique(y, return_inverse = True, return_counts = True)
+        n2 = int(np.sum(t*(t - 1)//2))
+    newGroup = np.concatenate(([True], (x[1:] != x[:-1]) | (y[1:] != y[:-1])))
+    t = np.diff(np.append(np.flatnonzero(newGroup), numObs))
+    n3 = int(np.sum(t*(t - 1)//2))
+    numUntied = math.comb(numObs, 2) - n1 - n2 + n3
+    discordant = inversionCount(r.ravel())
+
+    return (np.array([numUntied - discordant, discordant]), numUntied)
+
+
+def pairedOrthants(D):
+    """
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :output:`paired_Oh` (np.array). Signs of each paired orthant (3D: [2xNxD]).
+
+    """
+    return orthantTable(D)['paired']
+
+
+def orthantSymbols(N, paired_Oh):
+    """
+    - :input:`N` (int). Number of paired orthants and delta coefficients.
+    - :input:`paired_Oh` (np.array). Signs of each paired orthant.
+    - :output:`symbolMatrix_up`, `symbolMatrix_down` (np.array). Signs (+/-) of each paired orthant as strings.
+
+    """
+    signs = orthantTable(paired_Oh.shape[2])['signs']
+
+    return (signs[0, :N], signs[1, :N])
+
+
+def formalism_Oh(N, numObs, dataset, paired_Oh, binomial, counts = None):
     """
     - :input:`N` (int). Number of paired orthants and delta coefficients.
     - :input:`numObs` (int). Number of observations.
     - :input:`dataset` (np.array).
     - :input:`paired_Oh` (np.array). Signs of each paired orthant.
     - :input:`binomial` (int). Binomial coefficient.
+    - :input:`counts` (tuple). Precomputed output of :func:`cachedOrthantCount` (default: None -> computed from `dataset`).
 
     """
-    # Definition of variables
-    F = np.empty((0), int)
-    symbolMatrix_up = np.empty((0), str)
-    symbolMatrix_down = np.empty((0), str)
-    # Summation
-    for i in range(0, N):
-        binomial_untied = int(binomial)
-        i_pOh = np.vstack((paired_Oh[0, i, :], paired_Oh[1, i, :]))        
-        f = 0
-        for jj in range(1, numObs):
-            for ii in range(0, jj):
-                diff = dataset[jj, :] - dataset[ii, :]
-                # Tied data detection
-                if not all(diff):
-                    binomial_untied -= 1
-                    continue
-                f += int(np.logical_or(all(np.equal(i_pOh[0, :], np.greater(diff, 0))), all(np.equal(i_pOh[1, :], np.greater(diff, 0)))))
-        F = np.append(F, [f])
-        # Symbol assignment
-        s_up = np.char.replace(str(i_pOh[0, :]), '1', '+'); 
-        s_up = np.char.replace(s_up, '0', '-')
-        s_down = np.char.replace(str(i_pOh[1, :]), '1', '+')
-        s_down = np.char.replace(s_down, '0', '-')
-        symbolMatrix_up = np.append(symbolMatrix_up, [s_up])
-        symbolMatrix_down = np.append(symbolMatrix_down, [s_down])
+    # Summation (one histogram pass over all observation pairs)
+    if counts is None:
+        counts = orthantCount(dataset[:numObs, :])
+    fOh, numUntied = counts
+    binomial_untied = int(binomial) - (math.comb(numObs, 2) - numUntied)
+    F = fOh[orthantTable(paired_Oh.shape[2])['codes'][:, :N].min(axis = 0)]
+    symbolMatrix_up, symbolMatrix_down = orthantSymbols(N, paired_Oh)
 
     return (F, symbolMatrix_up, symbolMatrix_down, binomial_untied)
 
 
-def multivarcorr(D, dataset, numObs):
+def coeffBatch(D, F, binomial_untied, numObs):
     """
     - :input:`D` (int). Dimension/number of joint variables.
-    - :input:`dataset` (np.array).
-    - :input:`numObs` (int). Number of observations.
+    - :input:`F` (np.array). Number of untied pairs per paired orthant (combinations x N).
+    - :input:`binomial_untied` (np.array). Number of untied pairs of each combination.
+    - :input:`numObs` (np.array). Number of observations of each combination.
+    - :output:`iota`, `iota_pval`, `deltas`, `d_pval` (np.array). Coefficients and p-values (one row per combination).
 
     """
-    binomial = math.comb(numObs, 2)                                 # Binomial coeficient
-    N = int(2**D/2)                                                 # Number of paired orthants and delta coefficients
-    # Signs permutations with repetitions
-    signs = [1, 0]                                                  # 1: Positive / 0: Negative
-    sC = np.fliplr(np.array(list(product(signs, repeat=D))))        # np.fliplr() to have same sign order as MATLAB
-    # Paired orthants matrix (3D: [2xNxD])
-    pOh1 = sC[0:N, :]
-    pOh2 = np.flipud(sC[-N:])
-    paired_Oh = np.stack([pOh1, pOh2])
-    # Delta coefficients (Direct computation)
-    F, symbolMatrix_up, symbolMatrix_down, binomial_untied = formalism_Oh(N, numObs, dataset, paired_Oh, binomial)
-    if binomial_untied == 0:
-        deltas = (1 / binomial) * F
-    else:
-        deltas = (1 / binomial_untied) * F
+    N = int(2**D/2)
+    numObs = np.asarray(numObs, dtype = np.int64)
+    binomial = numObs * (numObs - 1) // 2                           # Binomial coeficient
+    binomial_untied = np.where(binomial_untied == 0, binomial, binomial_untied)
+    deltas = (1 / binomial_untied)[:, np.newaxis] * F
     # p-value (deltas)
     var = (2 * (2 * numObs + 5)) / (9 * numObs * (numObs - 1))
-    d_Zt = deltas / math.sqrt(var)
+    sd = np.sqrt(var)[:, np.newaxis]
+    d_Zt = deltas / sd
     d_pval = 2 * norm.cdf(-abs(d_Zt))
     # Iota-N coefficient
     if D == 2:
-        iota = deltas[0] - deltas[1]
+        iota = deltas[:, 0] - deltas[:, 1]
+        iota_Zt = iota / sd[:, 0]
     else:
-        iota_comb = np.empty([0, 2], dtype=int)
-        for t in np.array(list(product(np.arange(0, N, dtype=int), repeat=2))):
-            if not np.all(t == t[0]):
-                iota_comb = np.append(iota_comb, [t], axis=0)     # Combinations of paired orthants
-        d_diff = (1 + (deltas[iota_comb[:, 0]] - deltas[iota_comb[:, 1]]))
-        deltas_diff = d_diff.reshape(N-1, N, order='F').copy()
-        iota = (gmean(deltas_diff)-1).transpose()
-    iota_Zt = iota / math.sqrt(var)
+        # deltas_diff[:, i, j] = 1 + (deltas[:, j] - deltas[:, k]) for the N-1 paired orthants k != j
+        iota_comb = orthantTable(D)['iotaPairs']
+        deltas_diff = 1 + (deltas[:, np.newaxis, :] - deltas[:, iota_comb])
+        iota = gmean(deltas_diff, axis = 1) - 1
+        iota_Zt = iota / sd
     iota_pval = 2 * norm.cdf(-abs(iota_Zt))
 
-    return (iota, iota_pval, deltas, d_pval, symbolMatrix_up, symbolMatrix_down)
+    return (iota, iota_pval, deltas, d_pval)
+
+
+def multivarcorr(D, dataset, numObs, counts = None):
+    """
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`dataset` (np.array).
+    - :input:`numObs` (int). Number of observations.
+    - :input:`counts` (tuple). Precomputed output of :func:`cachedOrthantCount` (default: None -> computed from `dataset`).
+
+    """
+    binomial = math.comb(numObs, 2)                                 # Binomial coeficient
+    if counts is None and D == 2 and not np.isnan(np.asarray(dataset, dtype = float)).any():
+        counts = kendallCount(dataset)                              # Knight's algorithm (Kendall's Tau)
+    N = int(2**D/2)                                                 # Number of paired orthants and delta coefficients
+    paired_Oh = pairedOrthants(D)
+    # Delta coefficients (Direct computation)
+    F, symbolMatrix_up, symbolMatrix_down, binomial_untied = formalism_Oh(N, numObs, dataset, paired_Oh, binomial, counts)
+    iota, iota_pval, deltas, d_pval = coeffBatch(D, F[np.newaxis, :], np.array([binomial_untied]), np.array([numObs]))
+
+    return (iota[0], iota_pval[0], deltas[0], d_pval[0], symbolMatrix_up, symbolMatrix_down)
+
+
+def countBatch(D, data, combos, inocula = None, signCache = None, tiePairs = None):
+    """
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`data` (np.array). Dataset (observations x all variables).
+    - :input:`combos` (np.array). Column indices of the joint variables of each combination (combinations x D).
+    - :input:`inocula` (np.array). Inocula (t_0) used to select observations (default: None -> 'All').
+    - :input:`signCache` (dict). Pairwise sign cache (see :func:`pairSignCache`) (default: None -> Pairs compared in tiles, see :func:`orthantCount`).
+    - :input:`tiePairs` (np.array). Number of tied pairs of each variable, if `data` holds dense ranks (see :func:`getData.dataRanks`) (default: None).
+    - :output:`F` (np.array). Number of untied pairs per paired orthant (combinations x N).
+    - :output:`binomial_untied` (np.array). Number of untied pairs of each combination.
+    - :output:`numObs` (np.array). Number of observations of each combination.
+
+    """
+    combos = np.asarray(combos, dtype = np.intp).reshape(-1, D)
+    numComb = len(combos)
+    F = np.zeros((numComb, int(2**D/2)), dtype = np.int64)
+    binomial_untied = np.zeros(numComb, dtype = np.int64)
+    numObs = np.full(numComb, data.shape[0], dtype = np.int64)
+    masks = None
+    if inocula is not None:
+        # Select those observations with all variables in inocula
+        masks = np.all(inocula[:, combos] != 0, axis = 2)
+        numObs = np.count_nonzero(masks, axis = 0).astype(np.int64)
+    # Combinations with the same row mask share its pairwise structure (see `maskCache`)
+    grouped = masks is not None and D > 2 and signCache is not None and 'groups' in signCache
+    if grouped:
+        _, inverse, repeats = np.unique(masks, axis = 1, return_inverse = True, return_counts = True)
+        shared = repeats[inverse.ravel()] > 1
+    for c, iCombi in enumerate(combos):
+        rows = None if masks is None or numObs[c] == data.shape[0] else masks[:, c]
+        if numObs[c] < 2:
+            continue
+        if D == 2:
+            iData = data[:, iCombi] if rows is None else data[:, iCombi][rows]
+            if missingMask(iData).any():
+                counts = orthantCount(iData)
+            else:
+                counts = kendallCount(iData, tiePairs[iCombi] if rows is None and tiePairs is not None else None)   # Knight's algorithm (Kendall's Tau)
+        elif signCache is None:
+            # No pairwise sign cache (memory cap, see `prepareRun`)
+            counts = orthantCount(data[:, iCombi] if rows is None else data[:, iCombi][rows])
+        elif grouped and rows is not None and (shared[c] or np.packbits(rows).tobytes() in signCache['groups']):
+            counts = cachedOrthantCount(maskCache(signCache, rows, iCombi), iCombi)
+        else:
+            counts = cachedOrthantCount(signCache, iCombi, rows)
+        F[c], binomial_untied[c] = counts
+
+    return (F, binomial_untied, numObs)
+
+
+def multivarcorr_batch(D, data, combos, inocula = None, signCache = None, tiePairs = None, counts = None):
+    """
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`data` (np.array). Dataset (observations x all variables).
+    - :input:`combos` (np.array). Column indices of the joint variables of each combination (combinations x D).
+    - :input:`inocula` (np.array). Inocula (t_0) used to select observations (default: None -> 'All').
+    - :input:`signCache` (dict). Pairwise sign cache (see :func:`pairSignCache`) (default: None -> computed from `data` if D > 2).
+    - :input:`tiePairs` (np.array). Tied pairs of each variable (see :func:`getData.dataRanks`) (default: None -> Taken from `signCache` or the ranks).
+    - :input:`counts` (tuple). Precomputed output of :func:`countBatch` (default: None -> computed from `data`).
+    - :output:`iota`, `iota_pval`, `deltas`, `d_pval` (np.array). Coefficients and p-values (one row per combination; NaN if less than 2 observations).
+    - :output:`symbolMatrix_up`, `symbolMatrix_down` (np.array). Signs of each paired orthant.
+    - :output:`numObs` (np.array). Number of observations of each combination.
+
+    Same outcomes as :func:`multivarcorr` for each combination, computed with
+    one vectorized call per block. Blocks of :func:`nOEN` go through here
+    (see :func:`coeffDicts`).
+
+    """
+    if counts is None:
+        combos = np.asarray(combos)
+        if D > 2 and signCache is None:
+            signCache = pairSignCache(data, inocula)
+        counts = countBatch(D, data, combos, inocula, signCache, tiePairs)
+    F, binomial_untied, numObs = counts
+    N = int(2**D/2)
+    symbolMatrix_up, symbolMatrix_down = orthantTable(D)['signs']
+    valid = numObs >= 2
+    iota = np.full((len(numObs),) if D == 2 else (len(numObs), N), np.nan)
+    iota_pval = iota.copy()
+    deltas = np.full((len(numObs), N), np.nan)
+    d_pval = deltas.copy()
+    if valid.any():
+        iota[valid], iota_pval[valid], deltas[valid], d_pval[valid] = coeffBatch(D, F[valid], binomial_untied[valid], numObs[valid])
+
+    return (iota, iota_pval, deltas, d_pval, symbolMatrix_up, symbolMatrix_down, numObs)
+
+
+def coeffDicts(D, F, binomial_untied, numObs):
+    """
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`F`, `binomial_untied`, `numObs` (np.array). Output of :func:`countBatch`.
+    - :output:`coeffs` (list). `numObs` and rounded `coeffInfo` of each combination (None if less than 2 observations).
+
+    Coefficients come from :func:`multivarcorr_batch` on the given counts.
+
+    `coeffInfo` also keeps the orthant counts (`F`) and the number of untied
+    pairs (`untied`), so new observations can be appended later (see
+    :func:`appendObservations`). Paired orthants are the columns of `deltas`
+    (signs in :func:`getData.orthantTable`).
+
+    """
+    valid = np.flatnonzero(numObs >= 2)
+    coeffs = [None] * len(numObs)
+    if valid.size == 0:
+        return coeffs
+    iota, iota_pval, deltas, d_pval = multivarcorr_batch(D, None, None, counts = (F, binomial_untied, numObs))[:4]
+    iota, iota_pval, deltas, d_pval = iota[valid], iota_pval[valid], deltas[valid], d_pval[valid]
+    iota = np.around(iota, decimals = 4)
+    iota_pval = np.around(iota_pval, decimals = 6)
+    deltas = np.around(deltas, decimals = 4)
+    d_pval = np.around(d_pval, decimals = 6)
+    for i, c in enumerate(valid):
+        coeffInfo = {'deltas': deltas[i], 'd_pval': d_pval[i], 'iota': iota[i], 'iota_pval': iota_pval[i],
+                     'F': F[c], 'untied': int(binomial_untied[c])}
+        coeffs[c] = {'numObs': int(numObs[c]), 'coeffInfo': coeffInfo}
+
+    return coeffs
+
+
+def sampleSize(approxPairs = 0, approxTol = 0):
+    """
+    - :input:`approxPairs` (int). Maximum number of observation pairs sampled (default: 0 -> No limit).
+    - :input:`approxTol` (float). Half-width of the 95% confidence intervals aimed at (default: 0 -> Only `approxPairs`).
+    - :output:`numPairs` (int). Number of observation pairs sampled (0 -> Exact computation).
+
+    With `approxTol`, (z/approxTol)^2 untied pairs give intervals of delta
+    coefficients narrower than `approxTol` (z = 1.96).
+
+    """
+    if approxTol > 0:
+        numPairs = math.ceil((norm.ppf(0.975) / approxTol)**2)
+        return min(numPairs, int(approxPairs)) if approxPairs > 0 else numPairs
+
+    return int(approxPairs)
+
+
+def samplePairs(numObs, numPairs, seed = 0):
+    """
+    - :input:`numObs` (int). Number of observations.
+    - :input:`numPairs` (int). Number of observation pairs of the sample.
+    - :input:`seed` (int). Seed of the random generator (default: 0).
+    - :output:`pairs` (np.array). Observation pairs (2 x numPairs; ii < jj, in np.triu_indices order).
+
+    Simple random sample without replacement of the numObs·(numObs-1)/2
+    pairs: linear indices of the upper triangle are drawn and mapped back to
+    their (ii, jj) observations.
+
+    """
+    n = int(numObs)
+    total = n * (n - 1) // 2
+    rng = np.random.default_rng([int(seed), n, int(numPairs)])
+    k = np.sort(rng.choice(total, size = min(int(numPairs), total), replace = False)).astype(np.int64)
+
+    return np.stack(pairIndices(k, n))
+
+
+def sampledCI(D, deltas, untied, fpc, level = 0.95):
+    """
+    - :input:`D` (int). Dimension/number of joint variables (D > 2).
+    - :input:`deltas` (np.array). Delta coefficients estimated from a sample of pairs (combinations x N).
+    - :input:`untied` (np.array). Number of untied pairs of the sample of each combination.
+    - :input:`fpc` (np.array). Finite population correction of each combination (1 - sampled pairs / all pairs).
+    - :input:`level` (float). Confidence level (default: 0.95).
+    - :output:`d_ci`, `iota_ci` (np.array). Confidence intervals of the delta and iota coefficients (combinations x N x 2).
+
+    Delta coefficients are the proportions of the untied pairs in each paired
+    orthant (multinomial). Intervals of the iota coefficients (geometric
+    means, see :func:`coeffBatch`) use the delta method.
+
+    """
+    z = norm.ppf(0.5 + level/2)
+    N = deltas.shape[1]
+    cov = (deltas[:, :, np.newaxis] * np.eye(N) - deltas[:, :, np.newaxis] * deltas[:, np.newaxis, :]) * (fpc / np.maximum(untied, 1))[:, np.newaxis, np.newaxis]
+    d_hw = z * np.sqrt(np.clip(np.diagonal(cov, axis1 = 1, axis2 = 2), 0, None))
+    # Same pairing of paired orthants as `coeffBatch`
+    iota_comb = orthantTable(D)['iotaPairs']
+    with np.errstate(divide = 'ignore', invalid = 'ignore'):
+        terms = 1 + (deltas[:, np.newaxis, :] - deltas[:, iota_comb])
+        iota1 = gmean(terms, axis = 1)
+        w = iota1[:, np.newaxis, :] / ((N - 1) * terms)
+        G = np.zeros((len(deltas), N, N))
+        jIdx = np.arange(N)
+        G[:, jIdx, jIdx] = w.sum(axis = 1)
+        for i in range(N - 1):
+            G[:, jIdx, iota_comb[i]] -= w[:, i, :]
+        i_hw = z * np.sqrt(np.clip(np.einsum('cjn,cnm,cjm->cj', G, cov, G), 0, None))
+    iota = iota1 - 1
+
+    return (np.stack([deltas - d_hw, deltas + d_hw], axis = 2), np.stack([iota - i_hw, iota + i_hw], axis = 2))
+
+
+def sampledCoeff(D, combos, final, inocula = None, signCache = None, alpha = 0.05):
+    """
+    - :input:`D` (int). Dimension/number of joint variables (D > 2).
+    - :input:`combos` (np.array). Column indices of the joint variables of each combination (combinations x D).
+    - :input:`final` (np.array). Dataset (t_max).
+    - :input:`inocula` (np.array). Inocula (t_0) used to select observations (default: None -> 'All').
+    - :input:`signCache` (dict). Pairwise sign cache of a sample of pairs (see :func:`pairSignCache` and :func:`samplePairs`).
+    - :input:`alpha` (float). Significance level (default: 0.05).
+    - :output:`coeffs` (list). `numObs` and `coeffInfo` of each combination (None if less than 2 observations), as :func:`coeffDicts`.
+
+    Coefficients are estimated from the sampled pairs (of the observations
+    selected by the inocula), with their 95% confidence intervals (`d_ci`,
+    `iota_ci`), `approx` = True and the number of sampled pairs used
+    (`numSampled`). Combinations with an interval including the threshold of
+    significance (`alpha`) of any coefficient, without sampled untied pairs,
+    or with fewer pairs than the sample are computed exactly instead.
+
+    """
+    combos = np.asarray(combos, dtype = np.intp).reshape(-1, D)
+    numComb = len(combos)
+    N = int(2**D/2)
+    numSample = signCache['numPairs']
+    F = np.zeros((numComb, N), dtype = np.int64)
+    untied = np.zeros(numComb, dtype = np.int64)
+    sampled = np.full(numComb, numSample, dtype = np.int64)
+    numObs = np.full(numComb, final.shape[0], dtype = np.int64)
+    masks = None
+    if inocula is not None:
+        masks = np.all(inocula[:, combos] != 0, axis = 2)
+        numObs = np.count_nonzero(masks, axis = 0).astype(np.int64)
+    rows = [None if masks is None or numObs[c] == final.shape[0] else masks[:, c] for c in range(numComb)]
+    for c, iCombi in enumerate(combos):
+        if numObs[c] < 2:
+            continue
+        F[c], untied[c] = cachedOrthantCount(signCache, iCombi, rows[c])
+        if rows[c] is not None:
+            sampled[c] = np.count_nonzero(np.unpackbits(np.bitwise_and.reduce(signCache['present'][iCombi], axis = 0), count = numSample))
+    numPairs = numObs * (numObs - 1) // 2
+    exact = (numObs >= 2) & ((untied == 0) | (numPairs <= numSample))
+    coeffs = [None] * numComb
+    est = np.flatnonzero((numObs >= 2) & ~exact)
+    if est.size > 0:
+        iota, iota_pval, deltas, d_pval = coeffBatch(D, F[est], untied[est], numObs[est])
+        d_ci, iota_ci = sampledCI(D, deltas, untied[est], 1 - sampled[est] / numPairs[est])
+        # Threshold of significance of the coefficients (same standard deviation as `coeffBatch`)
+        n = numObs[est]
+        thr = (norm.ppf(1 - alpha/2) * np.sqrt((2 * (2 * n + 5)) / (9 * n * (n - 1))))[:, np.newaxis]
+        near = np.zeros(est.size, dtype = bool)
+        for ci in (d_ci, iota_ci):
+            low, high = ci[:, :, 0], ci[:, :, 1]
+            near |= np.any(((low <= thr) & (thr <= high)) | ((low <= -thr) & (-thr <= high)) | np.isnan(low) | np.isnan(high), axis = 1)
+        exact[est[near]] = True
+        for i in np.flatnonzero(~near):
+            coeffInfo = {'deltas': np.around(deltas[i], decimals = 4), 'd_pval': np.around(d_pval[i], decimals = 6),
+                         'iota': np.around(iota[i], decimals = 4), 'iota_pval': np.around(iota_pval[i], decimals = 6),
+                         'approx': True, 'numSampled': int(sampled[est[i]]), 'd_ci': np.around(d_ci[i], decimals = 4), 'iota_ci': np.around(iota_ci[i], decimals = 4)}
+            coeffs[est[i]] = {'numObs': int(numObs[est[i]]), 'coeffInfo': coeffInfo}
+    # Exact computation
+    idx = np.flatnonzero(exact)
+    if idx.size > 0:
+        exactF = np.zeros((idx.size, N), dtype = np.int64)
+        exactUntied = np.zeros(idx.size, dtype = np.int64)
+        for i, c in enumerate(idx):
+            iData = final[:, combos[c]] if rows[c] is None else final[:, combos[c]][rows[c]]
+            exactF[i], exactUntied[i] = orthantCount(iData)
+        for c, r in zip(idx, coeffDicts(D, exactF, exactUntied, numObs[idx])):
+            coeffs[c] = r
+
+    return coeffs
+
+
+def permutationStats(D, X):
+    """
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`X` (np.array). Batch of datasets (batch x observations x D).
+    - :output:`deltas` (np.array). Delta coefficients of each dataset (batch x N).
+    - :output:`iota` (np.array). Iota coefficients of each dataset (batch or batch x N).
+
+    Datasets x pairs are compared in tiles (see :func:`tileSize`).
+
+    """
+    B, numObs, _ = X.shape
+    N = int(2**D/2)
+    numPairs = numObs * (numObs - 1) // 2
+    w = 1 << np.arange(D, dtype = np.int64)
+    hist = np.zeros(B * 2**D, dtype = np.int64)
+    numUntied = np.zeros(B, dtype = np.int64)
+    # Tiles of `b` datasets x `m` consecutive pairs
+    size = tileSize(26 * D + 17)
+    m = max(1, min(numPairs, size))
+    b = max(1, size // m)
+    for p0 in range(0, numPairs, m):
+        ii, jj = pairRange(p0, min(p0 + m, numPairs), numObs)
+        for b0 in range(0, B, b):
+            t0 = time.perf_counter()
+            Xb = X[b0:b0+b]
+            diff = Xb[:, jj, :] - Xb[:, ii, :]
+            untied = np.all(diff != 0, axis = 2)
+            # One bincount for the whole tile (tied pairs go to the last bin)
+            codes = np.where(untied, np.greater(diff, 0) @ w + (np.arange(b0, b0 + len(Xb), dtype = np.int64) * 2**D)[:, np.newaxis], B * 2**D)
+            hist += np.bincount(codes.ravel(), minlength = B * 2**D + 1)[:-1]
+            numUntied[b0:b0+b] += untied.sum(axis = 1)
+            recordTile('permutationStats', diff.shape[0] * diff.shape[1], time.perf_counter() - t0, diff.shape[0] * diff.shape[1] * (26 * D + 17))
+    hist = hist.reshape(B, 2**D)
+    F = hist[:, :N] + hist[:, :N-1:-1]
+    iota, _, deltas, _ = coeffBatch(D, F, numUntied, np.full(B, numObs))
+
+    return (deltas, iota)
+
+
+def permutationTest(D, data, permutations, rng, alpha = 0.05, maxBatch = 2**24):
+    """
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`data` (np.array). Dataset of the combination (observations x D).
+    - :input:`permutations` (int). Maximum number of permutations.
+    - :input:`rng` (np.random.Generator). Random generator.
+    - :input:`alpha` (float). Significance level used for early stopping (default: 0.05).
+    - :input:`maxBatch` (int). Number of pair differences of a batch of permutations drawn at once (default: 2^24).
+    - :output:`d_pval` (np.array). Permutation p-values of the delta coefficients.
+    - :output:`iota_pval` (np.array). Permutation p-values of the iota coefficients.
+    - :output:`numPerm` (int). Number of permutations done.
+
+    Null hypothesis: independence of the D variables. Each permutation shuffles
+    the observations of every variable but the first one, and the permuted
+    datasets are evaluated in vectorized batches. p-values are two-sided,
+    p = min(1, 2·(1 + min(#(T* >= T), #(T* <= T))) / (1 + k)). The test stops
+    early once every iota p-value is above `alpha` with a margin of three
+    standard errors. Batches of permutations are drawn by `maxBatch` (so
+    p-values do not depend on the memory cap) and evaluated in tiles (see
+    :func:`permutationStats`).
+
+    """
+    numObs = data.shape[0]
+    B = int(max(1, min(permutations, maxBatch // max(numObs * (numObs - 1) // 2 * D, 1))))
+    obsDeltas, obsIota = permutationStats(D, data[np.newaxis, :, :])
+    eps = 1e-12
+    ge = [np.zeros(obsDeltas.shape[1:], dtype = np.int64), np.zeros(obsIota.shape[1:], dtype = np.int64)]
+    le = [np.zeros(obsDeltas.shape[1:], dtype = np.int64), np.zeros(obsIota.shape[1:], dtype = np.int64)]
+    k = 0
+    while k < permutations:
+        b = min(B, permutations - k)
+        X = np.repeat(data[np.newaxis, :, :], b, axis = 0)
+        for col in range(1, D):
+            idx = rng.permuted(np.tile(np.arange(numObs), (b, 1)), axis = 1)
+            X[:, :, col] = data[idx, col]
+        for i, (T, t) in enumerate(zip(permutationStats(D, X), (obsDeltas[0], obsIota[0]))):
+            ge[i] += np.sum(T >= t - eps, axis = 0)
+            le[i] += np.sum(T <= t + eps, axis = 0)
+        k += b
+        # Early stopping (clearly non-significant)
+        p = np.minimum(1, 2 * (1 + np.minimum(ge[1], le[1])) / (1 + k))
+        if k < permutations and np.all(p - 3 * np.sqrt(p * (1 - p) / k) > alpha):
+            break
+    d_pval, iota_pval = [np.minimum(1, 2 * (1 + np.minimum(g, l)) / (1 + k)) for g, l in zip(ge, le)]
+
+    return (d_pval, iota_pval, k)
+
+
+def addPermutations(d, combos, coeffs, final, inocula, permutations, seed):
+    """
+    - :input:`d` (int). Dimension/number of joint variables.
+    - :input:`combos` (list). Column indices of the joint variables of each combination.
+    - :input:`coeffs` (list). Output of :func:`coeffDicts` (updated in place).
+    - :input:`final` (np.array). Dataset (t_max).
+    - :input:`inocula` (np.array). Inocula (t_0) used to select observations (None -> 'All').
+    - :input:`permutations` (int). Maximum number of permutations per combination.
+    - :input:`seed` (int). Seed of the random generator.
+
+    Adds the permutation p-values (`d_pval_perm`, `iota_pval_perm`) and the
+    number of permutations done (`numPerm`) to `coeffInfo`. The random
+    generator of each combination is seeded with (seed, d, iCombi), so the
+    outcomes do not depend on how combinations are split among workers.
+
+    """
+    for iCombi, coeff in zip(combos, coeffs):
+        if coeff is None:
+            continue
+        iCombi = [int(v) for v in iCombi]
+        data = final[:, iCombi]
+        if inocula is not None:
+            data = data[np.all(inocula[:, iCombi], axis = 1), :]
+        rng = np.random.default_rng([int(seed), d] + iCombi)
+        data = np.where(missingMask(data), np.nan, np.asarray(data, dtype = float))
+        d_pval, iota_pval, numPerm = permutationTest(d, data, permutations, rng)
+        coeff['coeffInfo']['d_pval_perm'] = np.around(d_pval, decimals = 6)
+        coeff['coeffInfo']['iota_pval_perm'] = np.around(iota_pval, decimals = 6)
+        coeff['coeffInfo']['numPerm'] = numPerm
+
+
+def appendCounts(D, data, combos, numOld, inocula = None):
+    """
+    - :input:`D` (int). Dimension/number of joint variables.
+    - :input:`data` (np.array). Dataset (observations x all variables): previous observations followed by the new ones.
+    - :input:`combos` (np.array). Column indices of the joint variables of each combination (combinations x D).
+    - :input:`numOld` (int). Number of previous observations.
+    - :input:`inocula` (np.array). Inocula (t_0) used to select observations (default: None -> 'All').
+    - :output:`dF` (np.array). Number of new untied pairs per paired orthant (combinations x N).
+    - :output:`dUntied` (np.array). Number of new untied pairs of each combination.
+
+    Only the pairs (i, j) with i < j and j >= numOld are compared, i.e.
+    O(n·k) pairs for k new observations, in tiles of pairs x combinations
+    (see :func:`tileSize`). Pairs are counted as in :func:`countBatch`, so
+    `F + dF` equals the counts of the whole dataset.
+
+    """
+    combos = np.asarray(combos, dtype = np.intp).reshape(-1, D)
+    numObs = data.shape[0]
+    N = int(2**D/2)
+    dF = np.zeros((len(combos), N), dtype = np.int64)
+    dUntied = np.zeros(len(combos), dtype = np.int64)
+    # New pairs ordered by (jj, ii): pairs of observation jj start at cumulative[jj - numOld]
+    cumulative = np.concatenate([[0], np.cumsum(np.arange(numOld, numObs, dtype = np.int64))])
+    numPairs = int(cumulative[-1])
+    if numPairs == 0:
+        return (dF, dUntied)
+    w = 1 << np.arange(D, dtype = np.int64)
+    # Tiles of `m` consecutive new pairs x `step` combinations
+    size = tileSize(27 * D + 18)
+    m = max(1, min(numPairs, size))
+    step = max(1, size // m)
+    for q0 in range(0, numPairs, m):
+        q = np.arange(q0, min(q0 + m, numPairs), dtype = np.int64)
+        k = np.searchsorted(cumulative, q, side = 'right') - 1
+        jj = numOld + k
+        ii = q - cumulative[k]
+        for c0 in range(0, len(combos), step):
+            t0 = time.perf_counter()
+            cc = combos[c0:c0+step]
+            B = len(cc)
+            diff = data[jj[:, np.newaxis, np.newaxis], cc] - data[ii[:, np.newaxis, np.newaxis], cc]
+            untied = np.all(diff != 0, axis = 2)
+            if inocula is not None:
+                rows = np.all(inocula[:, cc], axis = 2)
+                untied &= rows[ii] & rows[jj]
+            codes = np.where(untied, np.greater(diff, 0) @ w + np.arange(B, dtype = np.int64) * 2**D, B * 2**D)
+            hist = np.bincount(codes.ravel(), minlength = B * 2**D + 1)[:-1].reshape(B, 2**D)
+            dF[c0:c0+B] += hist[:, :N] + hist[:, :N-1:-1]
+            dUntied[c0:c0+B] += untied.sum(axis = 0)
+            recordTile('appendCounts', len(q) * B, time.perf_counter() - t0, len(q) * B * (27 * D + 18))
+
+    return (dF, dUntied)
+
+
+def mergeCoeff(dDict, d, iCombi, r):
+    """
+    - :input:`dDict` (dict). Dictionary with dataset and nOEN outcomes.
+    - :input:`d` (int). Dimension/number of joint variables.
+    - :input:`iCombi` (np.array). Column indices of the joint variables.
+    - :input:`r` (dict). `numObs` and `coeffInfo` of the combination (None if less than 2 observations).
+
+    """
+    D_field = 'D' + str(d)
+    nameK3_comb = "_".join(dDict['data']['varNames'][iCombi])
+    dCoeff = dDict['coeff'].setdefault(D_field, {})
+    if nameK3_comb not in dCoeff:
+        dCoeff[nameK3_comb] = coeffEntry(iCombi + 1)
+    if r is None:
+        message('!UserWarning: Not enough number of observations in ' + nameK3_comb +' dataset (D=' + str(d) +')')
+    else:
+        dCoeff[nameK3_comb]['numObs'] = r['numObs']
+        coeffInfo = dCoeff[nameK3_comb]['coeffInfo']
+        # Outcomes of a previous run that are not computed anymore (approximate mode, permutation test)
+        if 'numSampled' not in r['coeffInfo']:
+            for key in ('approx', 'numSampled', 'd_ci', 'iota_ci'):
+                coeffInfo.pop(key, None)
+        if 'numPerm' not in r['coeffInfo']:
+            for key in ('d_pval_perm', 'iota_pval_perm', 'numPerm'):
+                coeffInfo.pop(key, None)
+        coeffInfo.update(r['coeffInfo'])
+        dDict['data']['results'] = True
 
 
-def nOEN(dDict, Dim = 0, infoInocula = False):
+def balancedChunks(weights, nChunks):
+    """
+    - :input:`weights` (np.array). Cost of each task.
+    - :input:`nChunks` (int). Number of chunks.
+    - :output:`bounds` (list). (start, stop) of each contiguous chunk of tasks.
+
+    """
+    cum = np.cumsum(weights)
+    cuts = np.searchsorted(cum, cum[-1] * np.arange(1, nChunks) / nChunks, side = 'right')
+    cuts = np.unique(np.concatenate(([0], cuts, [len(weights)])))
+
+    return list(zip(cuts[:-1], cuts[1:]))
+
+
+def blockCoeff(d, combos, final, inocula = None, signCache = None, permutations = 0, seed = 0, tiePairs = None):
+    """
+    - :input:`d` (int). Dimension/number of joint variables.
+    - :input:`combos` (np.array). Column indices of the joint variables of each combination (combinations x d).
+    - :input:`final` (np.array). Dataset (t_max).
+    - :input:`inocula` (np.array). Inocula (t_0) used to select observations (default: None -> 'All').
+    - :input:`signCache` (dict). Pairwise sign cache (see :func:`pairSignCache`), of all pairs or of a sample of pairs (approximate mode, see :func:`sampledCoeff`). Required if d > 2.
+    - :input:`permutations` (int). Maximum number of permutations of the permutation test (default: 0 -> No test).
+    - :input:`seed` (int). Seed of the permutation test (default: 0).
+    - :input:`tiePairs` (np.array). Number of tied pairs of each variable, if `final` holds dense ranks (default: None).
+    - :output:`coeffs` (list). `numObs` and `coeffInfo` of each combination (None if less than 2 observations).
+
+    """
+    if d > 2 and signCache is not None and 'pairs' in signCache:
+        # Approximate mode (sample of pairs)
+        coeffs = sampledCoeff(d, combos, final, inocula, signCache)
+    else:
+        coeffs = coeffDicts(d, *countBatch(d, final, combos, inocula, signCache, tiePairs))
+    if permutations > 0:
+        addPermutations(d, combos, coeffs, final, inocula, permutations, seed)
+
+    return coeffs
+
+
+def latticeCoeff(root, vD, final, inocula, signCache, cacheBudget = 512, permutations = 0, seed = 0):
+    """
+    - :input:`root` (tuple). Column indices of the combination at the root of the walked sub-lattice.
+    - :input:`vD` (list). Dimensions we want to test.
+    - :input:`final` (np.array). Dataset (t_max).
+    - :input:`inocula` (np.array). Inocula (t_0) used to select observations (None -> 'All').
+    - :input:`signCache` (dict). Pairwise sign cache (see :func:`pairSignCache`).
+    - :input:`cacheBudget` (float). Memory budget (MB) for the cached orthant codes of parent combinations.
+    - :input:`permutations` (int). Maximum number of permutations of the permutation test (default: 0 -> No test).
+    - :input:`seed` (int). Seed of the permutation test (default: 0).
+    - :output:`coeffs` (list). (d, iCombi, coeff) of each combination of `root` (and supersets) with dimension in `vD`.
+
+    Depth-first walk of the combination lattice: the children of a combination
+    append one variable with a higher index, so the orthant codes of a child
+    are the codes of its parent plus one sign bit. The codes of the parents on
+    the current path are cached while they fit in `cacheBudget` and are
+    released once all their children are done; deeper combinations extend the
+    codes of their deepest cached ancestor. The walk is repeated for each tile
+    of pairs (see :func:`tileSize`), so the cached codes and the temporary
+    arrays do not grow with the number of pairs. Coefficients are computed
+    per dimension in one vectorized call at the end of the walk.
+
+    """
+    numVar = final.shape[1]
+    numObsAll = final.shape[0]
+    numPairs = signCache['numPairs']
+    vD = set(int(d) for d in vD)
+    maxD = max(vD)
+    dtype = np.int8 if maxD < 8 else np.int16 if maxD < 16 else np.int32 if maxD < 32 else np.int64
+    itemsize = np.dtype(dtype).itemsize
+    # Tiles of pairs: cached codes of (at most) maxD levels and temporary arrays of one combination
+    step = tileSize(26 + (maxD + 3) * itemsize)
+    levels = int(cacheBudget * 2**20) // max(min(step, numPairs) * itemsize, 1) - 1
+    counts = {d: ([], [], [], []) for d in vD}
+    pos = {}
+
+    def visit(prefix, base, baseLen, nCached, p0, p1):
+        d = len(prefix)
+        codes = extendCodes(base, signCache, prefix[baseLen:], baseLen, dtype, p0, p1)
+        if d in vD:
+            iCombi, F, untied, numObs = counts[d]
+            fOh, numUntied = pairedOrthantCount(codes[codes >= 0], d)
+            if p0 == 0:
+                iCombi.append(prefix)
+                if inocula is not None:
+                    numObs.append(np.count_nonzero(np.all(inocula[:, list(prefix)], axis = 1)))
+                else:
+                    numObs.append(numObsAll)
+                F.append(fOh)
+                untied.append(numUntied)
+            else:
+                # Same order of the walk in every tile
+                F[pos[d]] += fOh
+                untied[pos[d]] += numUntied
+                pos[d] += 1
+        last = prefix[-1]
+        if not any(d < iD <= d + numVar - 1 - last for iD in vD):
+            return
+        if nCached < levels:
+            base, baseLen, nCached = codes, d, nCached + 1
+        del codes
+        for x in range(last + 1, numVar):
+            visit(prefix + (x,), base, baseLen, nCached, p0, p1)
+
+    for p0 in range(0, max(numPairs, 1), step):
+        t0 = time.perf_counter()
+        p1 = min(p0 + step, numPairs)
+        pos.update({d: 0 for d in vD})
+        visit(tuple(int(v) for v in root), None, 0, 0, p0, p1)
+        recordTile('latticeCoeff', p1 - p0, time.perf_counter() - t0, (p1 - p0) * (26 + (min(levels, maxD) + 3) * itemsize))
+    coeffs = []
+    for d, (iCombi, F, untied, numObs) in counts.items():
+        if iCombi:
+            dCoeffs = coeffDicts(d, np.array(F), np.array(untied, dtype = np.int64), np.array(numObs, dtype = np.int64))
+            if permutations > 0:
+                addPermutations(d, iCombi, dCoeffs, final, inocula, permutations, seed)
+            coeffs.extend(zip([d] * len(iCombi), iCombi, dCoeffs))
+
+    return coeffs
+
+
+def evalItems(items, final, inocula = None, signCache = None, vD = None, cacheBudget = 512, permutations = 0, seed = 0, timings = None, tiePairs = None):
+    """
+    - :input:`items` (list). ('block', d, combos) blocks of combinations of one dimension and/or ('root', iCombi) sub-lattices (see :func:`latticeCoeff`).
+    - :input:`final` (np.array). Dataset (t_max).
+    - :input:`inocula` (np.array). Inocula (t_0) used to select observations (default: None -> 'All').
+    - :input:`signCache` (dict). Pairwise sign cache (see :func:`pairSignCache`).
+    - :input:`vD` (list). Dimensions we want to test (only used by sub-lattices).
+    - :input:`cacheBudget` (float). Memory budget (MB) of each sub-lattice walk.
+    - :input:`permutations` (int). Maximum number of permutations of the permutation test (default: 0 -> No test).
+    - :input:`seed` (int). Seed of the permutation test (default: 0).
+    - :input:`timings` (dict). Number of combinations and compute time (s) of each dimension, updated in place ({d: [combinations, time]}) (default: None).
+    - :input:`tiePairs` (np.array). Number of tied pairs of each variable, if `final` holds dense ranks (default: None).
+    - :output:`coeffs` (list). (d, iCombi, coeff) of each combination computed.
+
+    """
+    coeffs = []
+    for item in items:
+        t0 = time.perf_counter()
+        if item[0] == 'block':
+            _, d, combos = item
+            iCombis = [tuple(int(v) for v in iCombi) for iCombi in combos]
+            itemCoeffs = list(zip([d] * len(combos), iCombis, blockCoeff(d, combos, final, inocula, signCache, permutations, seed, tiePairs)))
+        else:
+            itemCoeffs = latticeCoeff(item[1], vD, final, inocula, signCache, cacheBudget, permutations, seed)
+        if timings is not None and itemCoeffs:
+            # Time of sub-lattices is split among dimensions by number of combinations
+            t = (time.perf_counter() - t0) / len(itemCoeffs)
+            for r in itemCoeffs:
+                timing = timings.setdefault(r[0], [0, 0.0])
+                timing[0] += 1
+                timing[1] += t
+        coeffs.extend(itemCoeffs)
+
+    return coeffs
+
+
+_shared = {}                # Worker-side views of the arrays in shared memory
+
+def shareArrays(arrays):
+    """
+    - :input:`arrays` (dict). Arrays to place in shared memory.
+    - :output:`blocks` (list). Shared memory blocks (to be closed and unlinked by the caller).
+    - :output:`specs` (dict). (name, shape, dtype) of each array, used by :func:`attachArrays`.
+
+    """
+    blocks = []
+    specs = {}
+    for key, a in arrays.items():
+        a = np.ascontiguousarray(a)
+        shm = shared_memory.SharedMemory(create = True, size = max(a.nbytes, 1))
+        np.ndarray(a.shape, dtype = a.dtype, buffer = shm.buf)[...] = a
+        blocks.append(shm)
+        specs[key] = (shm.name, a.shape, a.dtype.str)
+
+    return blocks, specs
+
+
+def mapArrays(specs, info):
+    """
+    - :input:`specs` (dict). Output of :func:`shareArrays`.
+    - :input:`info` (dict). Other (small) objects needed by the workers.
+    - :output:`shared` (dict). Views of the shared arrays (and their shared memory blocks) and `info`.
+
+    """
+    shared = dict(info)
+    for key, (name, shape, dtype) in specs.items():
+        shm = shared_memory.SharedMemory(name = name)
+        shared['_shm_' + key] = shm
+        shared[key] = np.ndarray(shape, dtype = np.dtype(dtype), buffer = shm.buf)
+
+    return shared
+
+
+def attachArrays(specs, info):
+    """
+    - :input:`specs` (dict). Output of :func:`shareArrays`.
+    - :input:`info` (dict). Other (small) objects needed by the workers.
+
+    Process pool initializer: maps the shared arrays once per worker.
+
+    """
+    _shared.clear()
+    _shared.update(mapArrays(specs, info))
+
+
+def chunkCoeffs(shared, items):
+    """
+    - :input:`shared` (dict). Dataset mapped by :func:`mapArrays` (the cached row masks are kept in it).
+    - :input:`items` (list). Combinations and/or sub-lattices (see :func:`evalItems`).
+    - :output:`coeffs` (list). Output of :func:`evalItems`.
+    - :output:`timings` (dict). Number of combinations and compute time of each dimension (see :func:`evalItems`), and the tiles of the pairwise kernels (`tiles`, see :func:`monitor.takeTiles`).
+
+    """
+    setMemoryCap(shared.get('memCap', 0))
+    enableMonitor(shared.get('profile', False), False)
+    signCache = None
+    if 'signs' in shared:
+        signCache = {key: shared[key] for key in ('numObs', 'numPairs', 'signs', 'ties', 'present', 'pairs') if key in shared}
+        if 'present' in signCache:
+            signCache.update(groups = shared.setdefault('groups', OrderedDict()), groupBudget = shared['cacheBudget'])
+
+    timings = {}
+    coeffs = evalItems(items, shared['final'], shared.get('inocula'), signCache, shared['vD'], shared['cacheBudget'], shared['permutations'], shared['seed'], timings, shared.get('tiePairs'))
+    tiles = takeTiles()
+    if tiles:
+        timings['tiles'] = tiles
+
+    return coeffs, timings
+
+
+def combChunk(items):
+    """
+    - :input:`items` (list). Combinations and/or sub-lattices (see :func:`evalItems`).
+    - :output:`coeffs`, `timings`. Output of :func:`chunkCoeffs`.
+
+    Process pool worker: works on the dataset mapped by :func:`attachArrays`.
+
+    """
+    return chunkCoeffs(_shared, items)
+
+
+_datasets = OrderedDict()  # Worker-side datasets of a batch run (see `batchChunk`)
+
+def batchChunk(task):
+    """
+    - :input:`task` (tuple). (key, specs, info, items): dataset (shared memory, see :func:`shareArrays`) and its combinations and/or sub-lattices.
+    - :output:`coeffs`, `timings`. Output of :func:`chunkCoeffs`.
+
+    Process pool worker of :func:`nOENbatch`: each dataset is mapped once per
+    worker (the 8 most recently used are kept).
+
+    """
+    key, specs, info, items = task
+    if key not in _datasets:
+        _datasets[key] = mapArrays(specs, info)
+        while len(_datasets) > 8:
+            _, old = _datasets.popitem(last = False)
+            blocks = [old.pop(k) for k in list(old) if k.startswith('_shm_')]
+            old.clear()
+            for shm in blocks:
+                shm.close()
+    _datasets.move_to_end(key)
+
+    return chunkCoeffs(_datasets[key], items)
+
+
+def blockItems(tasks, blockSize):
+    """
+    - :input:`tasks` (list). (d, iCombi) of each combination, grouped by dimension.
+    - :input:`blockSize` (int). Maximum number of combinations per block.
+    - :output:`items` (list). ('block', d, combos) blocks of combinations of the same dimension.
+
+    """
+    items = []
+    i0 = 0
+    while i0 < len(tasks):
+        d = tasks[i0][0]
+        i1 = i0 + 1
+        while i1 < len(tasks) and i1 - i0 < blockSize and tasks[i1][0] == d:
+            i1 += 1
+        items.append(('block', d, np.array([iCombi for _, iCombi in tasks[i0:i1]])))
+        i0 = i1
+
+    return items
+
+
+def prepareRun(dDict, Dim = 0, infoInocula = False, workers = 1, lattice = False, cacheBudget = 512, blockSize = 256, permutations = 0, seed = 0,
+               checkpoint = None, resume = False, approxPairs = 0, approxTol = 0):
     """
     - :input:`dDict` (dict). Dictionary with dataset and information.
-    - :input:`Dim` (list). List with dimensions we want to test (default: 0 -> 'All').
-    - :input:`infoInocula` (bool). Boolen to indicate if dataset include information at time 0 (i.e., inocula).
-    
+    - :output:`run` (dict). Dataset (ranks), pairwise sign cache, combinations to test (`tasks`), combinations already done (`done`), work items and their cost (`items`, `weights`) and settings of the run.
+
+    Other inputs: see :func:`nOEN`. The requested settings are kept in
+    `run['settings']` (see :func:`finishRun`).
+
     """
-    print('\n>> Running nOEN...')
-    # Access data
+    settings = {'workers': int(workers), 'lattice': bool(lattice), 'cacheBudget': float(cacheBudget), 'blockSize': int(blockSize), 'permutations': int(permutations),
+                'seed': int(seed), 'approxPairs': int(approxPairs), 'approxTol': float(approxTol)}
+    # Access data (rank-compressed dataset, see `getData.rankData`)
     numVar = dDict['data']['numVar']
-    varNames = dDict['data']['varNames']
+    with stage('ranks'):
+        final, tiePairs = dataRanks(dDict['data'])
+    inocula = None
+    if infoInocula:
+        inocula = dDict['data']['inocula']
+        if inocula.size == 0:
+            message('Error 404: Inocula or time-zero data not found.')
+            sys.exit()
     
     if Dim == 0:
         vD = np.arange(2, numVar+1)
     else:
         vD = Dim
-    for d in vD:
-        D_field = 'D' + str(d)
-        combi = dDict['comb'][D_field]
-        nCombi = combi.shape[0]
-        for c in range(0, nCombi):
-            iVar = list(dDict['coeff'][D_field].keys())[c]
-            iCombi = combi[c] - 1       # Python arrays starts with position 0, not 1
-            nameK3_comb = "_".join(varNames[iCombi])
-            data = dDict['data']['final'][:, iCombi]
-            if infoInocula:
-                # Select those observations with all variables in inocula
-                dataInocula = dDict['data']['inocula'][:, iCombi]
-                if dataInocula.size == 0:
-                    print('Error 404: Inocula or time-zero data not found.')
-                    sys.exit()
-                data = data[np.all(dataInocula, axis = 1), :]
-            numObs = data.shape[0]
-            if numObs < 2:
-                print('!UserWarning: Not enough number of observations in ' + iVar +' dataset (D=' + str(d) +')')
+    vD = [int(d) for d in vD]
+    # Approximate mode: sample of observation pairs for D > 2 (see `sampledCoeff`)
+    numSample = sampleSize(approxPairs, approxTol)
+    sample = None
+    if 0 < numSample < math.comb(final.shape[0], 2) and any(d > 2 for d in vD):
+        sample = (numSample, int(seed))
+        message(' > Approximate mode (D > 2): ' + str(numSample) + ' of ' + str(math.comb(final.shape[0], 2)) + ' observation pairs sampled.')
+        if lattice:
+            message(' > Lattice mode is not used in approximate mode.')
+            lattice = False
+    # Pairwise signs and ties (shared by all combinations with D > 2; D = 2 uses Knight's algorithm)
+    # (kept in `dDict['cache']` and reused by later calls with the same dataset)
+    signCache = None
+    numPairs = math.comb(final.shape[0], 2) if sample is None else numSample
+    cacheMB = numPairs / 8 * final.shape[1] * (2 if inocula is None else 3) / 2**20
+    if MEMORY['capMB'] > 0 and cacheMB > MEMORY['capMB'] / 2 and any(d > 2 for d in vD):
+        # Pairs of each combination compared in tiles (see `orthantCount`)
+        message(' > Pairwise sign cache (' + str(round(cacheMB, 1)) + ' MB) exceeds half of the memory cap: observation pairs are compared in tiles of each combination.')
+        if lattice:
+            message(' > Lattice mode is not used without the pairwise sign cache.')
+            lattice = False
+        if sample is not None:
+            message(' > Approximate mode is not used without the pairwise sign cache.')
+            sample = None
+    elif lattice or any(d > 2 for d in vD):
+        cached = dDict.get('cache', {})
+        if cached.get('final') is final and cached.get('inocula') is inocula and cached.get('sample') == sample:
+            signCache = cached['signCache']
+            if inocula is not None and sample is None:
+                signCache['groupBudget'] = cacheBudget
+        else:
+            with stage('signCache'):
+                signCache = pairSignCache(final, inocula, tiePairs, None if sample is None else samplePairs(final.shape[0], numSample, seed))
+                if inocula is not None and sample is None:
+                    signCache.update(groups = OrderedDict(), groupBudget = cacheBudget)
+            dDict['cache'] = {'final': final, 'inocula': inocula, 'sample': sample, 'signCache': signCache}
+    run = {'vD': vD, 'final': final, 'tiePairs': tiePairs, 'inocula': inocula, 'infoInocula': bool(infoInocula), 'signCache': signCache,
+           'cacheBudget': cacheBudget, 'permutations': permutations, 'seed': seed, 'checkpoint': checkpoint, 'runInfo': None, 'part': 0, 'settings': settings}
+    # Combinations to test
+    with stage('enumeration'):
+        tasks = []
+        for d in vD:
+            for iCombi in iterComb(dDict, d):
+                tasks.append((d, iCombi - 1))           # Python arrays starts with position 0, not 1
+        # Combinations completed by a previous run
+        done = []
+        if checkpoint is not None:
+            run['runInfo'] = {'numVar': int(numVar), 'vD': vD, 'infoInocula': bool(infoInocula), 'permutations': int(permutations), 'seed': int(seed),
+                              'approxPairs': 0 if sample is None else numSample,
+                              'data': hashlib.sha256(final.tobytes() + (b'' if inocula is None else inocula.tobytes())).hexdigest()}
+            if resume:
+                done, run['part'] = loadCheckpoint(checkpoint, run['runInfo'])
             else:
-                iota, iota_pval, deltas, d_pval, symbolMatrix_up, symbolMatrix_down = multivarcorr(d, data, numObs)
-                dDict['coeff'][D_field][nameK3_comb]['numObs'] = numObs
-                dDict['coeff'][D_field][nameK3_comb]['coeffInfo']['signs1'] = symbolMatrix_up
-                dDict['coeff'][D_field][nameK3_comb]['coeffInfo']['signs2'] = symbolMatrix_down
-                dDict['coeff'][D_field][nameK3_comb]['coeffInfo']['deltas'] = np.around(deltas, decimals = 4)
-                dDict['coeff'][D_field][nameK3_comb]['coeffInfo']['d_pval'] = np.around(d_pval, decimals = 6)
-                dDict['coeff'][D_field][nameK3_comb]['coeffInfo']['iota'] = np.around(iota, decimals = 4)
-                dDict['coeff'][D_field][nameK3_comb]['coeffInfo']['iota_pval'] = np.around(iota_pval, decimals = 6)
-                dDict['data']['results'] = True
-    print('>> nOEN done.')
+                clearCheckpoint(checkpoint)
+            if done:
+                message(' > Resuming: ' + str(len(done)) + ' of ' + str(len(tasks)) + ' combinations already done.')
+                doneKeys = {(d, iCombi) for d, iCombi, r in done}
+                pending = [(d, iCombi) for d, iCombi in tasks if (d, tuple(int(v) for v in iCombi)) not in doneKeys]
+        if not done:
+            pending = tasks
+        if lattice and not done:
+            # Sub-lattices rooted at combinations of `r` variables (r > 1 to balance the work among workers)
+            r = 1 if workers <= 1 else min(max(vD), max(1, math.ceil(math.log2(4*workers))))
+            items = blockItems([(d, iCombi) for d, iCombi in tasks if d < r], blockSize)
+            items += [('root', root) for root in combinations(range(numVar), r)]
+        else:
+            items = blockItems(pending, blockSize)
+        weights = [item[1] * len(item[2]) if item[0] == 'block' else 2**(numVar - 1 - item[1][-1]) for item in items]
+    run.update(tasks = tasks, done = done, items = items, weights = weights)
+
+    return run
+
+
+def runArrays(run):
+    """
+    - :input:`run` (dict). Output of :func:`prepareRun`.
+    - :output:`arrays` (dict). Arrays shipped to the workers through shared memory (see :func:`shareArrays`).
+    - :output:`info` (dict). Other (small) objects needed by the workers.
+
+    """
+    arrays = {'final': run['final'], 'tiePairs': run['tiePairs']}
+    info = {key: run[key] for key in ('vD', 'cacheBudget', 'permutations', 'seed')}
+    info.update(memCap = MEMORY['capMB'], profile = monitorEnabled())
+    if run['inocula'] is not None:
+        arrays['inocula'] = run['inocula']
+    signCache = run['signCache']
+    if signCache is not None:
+        arrays.update({key: signCache[key] for key in ('signs', 'ties', 'present', 'pairs') if key in signCache})
+        info.update({'numObs': signCache['numObs'], 'numPairs': signCache['numPairs']})
+
+    return arrays, info
+
+
+def finishRun(dDict, run, coeffs):
+    """
+    - :input:`dDict` (dict). Dictionary with dataset and information (updated in place).
+    - :input:`run` (dict). Output of :func:`prepareRun`.
+    - :input:`coeffs` (list). (d, iCombi, coeff) of the combinations computed.
+
+    The settings of the run are kept per dimension in `dDict['data']['runSettings']`
+    (used by :func:`appendObservations` to compute dimensions again).
+
+    """
+    coeffs = {(d, iCombi): r for d, iCombi, r in run['done'] + coeffs}
+    # Merge results (same order as serial run)
+    numApprox = {}
+    for d, iCombi in run['tasks']:
+        r = coeffs[(d, tuple(int(v) for v in iCombi))]
+        mergeCoeff(dDict, d, iCombi, r)
+        if r is not None and 'numSampled' in r['coeffInfo']:
+            numApprox[d] = numApprox.get(d, 0) + 1
+    for d, n in numApprox.items():
+        message(' > D' + str(d) + ': ' + str(n) + ' of ' + str(sum(1 for dT, _ in run['tasks'] if dT == d)) + ' combinations approximated (others computed exactly).')
+    for d in run['vD']:
+        dDict['data'].setdefault('infoInocula', {})['D' + str(d)] = run['infoInocula']
+        dDict['data'].setdefault('runSettings', {})['D' + str(d)] = dict(run['settings'])
+
+
+def nOEN(dDict, Dim = 0, infoInocula = False, workers = 1, lattice = False, cacheBudget = 512, blockSize = 256, permutations = 0, seed = 0,
+         checkpoint = None, checkpointEvery = 300, resume = False, approxPairs = 0, approxTol = 0):
+    """
+    - :input:`dDict` (dict). Dictionary with dataset and information.
+    - :input:`Dim` (list). List with dimensions we want to test (default: 0 -> 'All').
+    - :input:`infoInocula` (bool). Boolen to indicate if dataset include information at time 0 (i.e., inocula).
+    - :input:`workers` (int). Number of worker processes (default: 1 -> serial run).
+    - :input:`lattice` (bool). Derive the orthant codes of each combination from its parent combination (see :func:`latticeCoeff`) (default: False).
+    - :input:`cacheBudget` (float). Memory budget (MB) per process for cached parent codes in lattice mode and for cached row masks with inocula (see :func:`maskCache`) (default: 512).
+    - :input:`blockSize` (int). Number of combinations of the same dimension computed in one vectorized call (default: 256).
+    - :input:`permutations` (int). Maximum number of permutations for empirical p-values (see :func:`permutationTest`) (default: 0 -> Only asymptotic p-values).
+    - :input:`seed` (int). Seed of the permutation test (default: 0).
+    - :input:`checkpoint` (str). Name of file of the checkpoints (see :func:`getData.saveCheckpoint`) (default: None -> No checkpoints).
+    - :input:`checkpointEvery` (float). Minimum time (s) between two checkpoints (default: 300).
+    - :input:`resume` (bool). Skip the combinations saved in checkpoints of a previous run with the same dataset and settings (default: False).
+    - :input:`approxPairs` (int). Approximate mode for D > 2: maximum number of observation pairs sampled (see :func:`sampledCoeff`) (default: 0 -> Exact).
+    - :input:`approxTol` (float). Approximate mode for D > 2: half-width of the 95% confidence intervals aimed at (see :func:`sampleSize`) (default: 0 -> Only `approxPairs`).
+
+    The combinations completed since the last checkpoint are saved every
+    `checkpointEvery` seconds (and at the end of the computation).
     
+    """
+    message('\n>> Running nOEN...')
+    run = prepareRun(dDict, Dim, infoInocula, workers, lattice, cacheBudget, blockSize, permutations, seed, checkpoint, resume, approxPairs, approxTol)
+    items = run['items']
+    # Periodic checkpoints of the combinations completed since the last one
+    unsaved = []
+    lastSave = time.perf_counter()
+    def saveUnsaved(force = False):
+        nonlocal lastSave
+        if checkpoint is None or not unsaved or (not force and time.perf_counter() - lastSave < checkpointEvery):
+            return
+        saveCheckpoint(checkpoint, run['runInfo'], list(unsaved), run['part'])
+        run['part'] += 1
+        unsaved.clear()
+        lastSave = time.perf_counter()
+    startProgress(len(run['tasks']), 'nOEN')
+    advanceProgress(len(run['done']))
+    with stage('compute'):
+        coeffs = []
+        if workers > 1 and len(items) > 1:
+            # Shard combinations in chunks of similar cost and ship the dataset once through shared memory
+            arrays, info = runArrays(run)
+            bounds = balancedChunks(np.array(run['weights']), 4*workers)
+            blocks, specs = shareArrays(arrays)
+            try:
+                with ProcessPoolExecutor(max_workers = workers, initializer = attachArrays, initargs = (specs, info)) as executor:
+                    for chunk, timings in executor.map(combChunk, [items[i0:i1] for i0, i1 in bounds]):
+                        coeffs.extend(chunk)
+                        unsaved.extend(chunk)
+                        saveUnsaved()
+                        recordDim(timings)
+                        advanceProgress(len(chunk), 'D' + str(chunk[-1][0]) if chunk else None)
+            finally:
+                for shm in blocks:
+                    shm.close()
+                    shm.unlink()
+        else:
+            for item in items:
+                timings = {}
+                chunk = evalItems([item], run['final'], run['inocula'], run['signCache'], run['vD'], cacheBudget, permutations, seed, timings, run['tiePairs'])
+                coeffs.extend(chunk)
+                unsaved.extend(chunk)
+                saveUnsaved()
+                recordDim(timings)
+                advanceProgress(len(chunk), 'D' + str(item[1]) if item[0] == 'block' else 'lattice')
+        saveUnsaved(force = True)
+    endProgress()
+    finishRun(dDict, run, coeffs)
+    message('>> nOEN done.')
+    
+    return dDict
+
+
+def nOENbatch(dDicts, Dim = 0, infoInocula = False, workers = 1, lattice = False, cacheBudget = 512, blockSize = 256, permutations = 0, seed = 0, onDone = None,
+              executor = None, approxPairs = 0, approxTol = 0, checkpoints = None, checkpointEvery = 300, resume = False):
+    """
+    - :input:`dDicts` (dict). Dictionaries with dataset and information of each dataset ({name: dDict}).
+    - :input:`onDone` (function). Called with (name, dDict) as soon as all combinations of a dataset are done, e.g., to save and write its results (default: None).
+    - :input:`executor` (ProcessPoolExecutor). Process pool kept by the caller (e.g., the nOEN server), not shut down at the end (default: None -> New pool of `workers` processes).
+    - :input:`checkpoints` (dict). Name of file of the checkpoints of each dataset ({name: checkpoint}, see :func:`getData.saveCheckpoint`) (default: None -> No checkpoints).
+    - :output:`dDicts` (dict). Dictionaries with dataset and nOEN outcomes.
+
+    Other inputs: see :func:`nOEN`. The combinations of all datasets run on
+    one process pool. The chunks of the datasets are interleaved (round
+    robin), so every dataset moves forward at the same pace and the pool is
+    kept busy until the last chunk. Each dataset is shipped once through
+    shared memory and mapped once per worker (see :func:`batchChunk`). Each
+    dataset has its own checkpoints, saved as in :func:`nOEN`, so `resume`
+    skips the combinations already done of every dataset.
+
+    """
+    message('\n>> Running nOEN (' + str(len(dDicts)) + ' datasets)...')
+    checkpoints = {} if checkpoints is None else checkpoints
+    runs = {}
+    for name, dDict in dDicts.items():
+        runs[name] = prepareRun(dDict, Dim, infoInocula, workers, lattice, cacheBudget, blockSize, permutations, seed, checkpoints.get(name), resume,
+                                approxPairs = approxPairs, approxTol = approxTol)
+    startProgress(sum(len(run['tasks']) for run in runs.values()), 'nOEN batch')
+    advanceProgress(sum(len(run['done']) for run in runs.values()))
+    coeffs = {name: [] for name in runs}
+    # Periodic checkpoints of the combinations of each dataset completed since its last one
+    unsaved = {name: [] for name in runs}
+    lastSave = {name: time.perf_counter() for name in runs}
+
+    def saveUnsaved(name, chunk, force = False):
+        if checkpoints.get(name) is None:
+            return
+        unsaved[name].extend(chunk)
+        if not unsaved[name] or (not force and time.perf_counter() - lastSave[name] < checkpointEvery):
+            return
+        run = runs[name]
+        saveCheckpoint(checkpoints[name], run['runInfo'], list(unsaved[name]), run['part'])
+        run['part'] += 1
+        unsaved[name].clear()
+        lastSave[name] = time.perf_counter()
+
+    def finish(name):
+        saveUnsaved(name, [], force = True)
+        finishRun(dDicts[name], runs[name], coeffs.pop(name))
+        message(' > `' + name + '` done.')
+        if onDone is not None:
+            onDone(name, dDicts[name])
+
+    with stage('compute'):
+        if workers <= 1:
+            for name, run in runs.items():
+                for item in run['items']:
+                    timings = {}
+                    chunk = evalItems([item], run['final'], run['inocula'], run['signCache'], run['vD'], cacheBudget, permutations, seed, timings, run['tiePairs'])
+                    coeffs[name].extend(chunk)
+                    saveUnsaved(name, chunk)
+                    recordDim(timings)
+                    advanceProgress(len(chunk), name)
+                finish(name)
+        else:
+            shared = {}
+            queues = {}
+            for name, run in runs.items():
+                arrays, info = runArrays(run)
+                shared[name], specs = shareArrays(arrays)
+                queues[name] = [(specs['final'][0], specs, info, run['items'][i0:i1]) for i0, i1 in balancedChunks(np.array(run['weights']), 4*workers)] if run['items'] else []
+            # Round robin over datasets
+            order = []
+            while any(queues.values()):
+                for name in runs:
+                    if queues[name]:
+                        order.append((name, queues[name].pop(0)))
+            pending = {name: 0 for name in runs}
+            for name, _ in order:
+                pending[name] += 1
+            try:
+                for name in [name for name, n in pending.items() if n == 0]:
+                    finish(name)
+                with contextlib.nullcontext(executor) if executor is not None else ProcessPoolExecutor(max_workers = workers) as pool:
+                    futures = {pool.submit(batchChunk, task): name for name, task in order}
+                    for future in as_completed(futures):
+                        name = futures[future]
+                        chunk, timings = future.result()
+                        coeffs[name].extend(chunk)
+                        saveUnsaved(name, chunk)
+                        recordDim(timings)
+                        advanceProgress(len(chunk), name)
+                        pending[name] -= 1
+                        if pending[name] == 0:
+                            for shm in shared.pop(name):
+                                shm.close()
+                                shm.unlink()
+                            finish(name)
+            finally:
+                for blocks in shared.values():
+                    for shm in blocks:
+                        shm.close()
+                        shm.unlink()
+    endProgress()
+    message('>> nOEN done.')
+
+    return dDicts
+
+
+def appendObservations(dDict, inocula, final, blockSize = 4096):
+    """
+    - :input:`dDict` (dict). Dictionary with dataset and nOEN outcomes (e.g., opened results store).
+    - :input:`inocula` (np.array). Inocula (t_0): previous observations followed by the new ones.
+    - :input:`final` (np.array). Dataset (t_max): previous observations followed by the new ones.
+    - :input:`blockSize` (int). Number of combinations updated in one vectorized call (default: 4096).
+    - :output:`dDict` (dict). Dictionary with the updated dataset and nOEN outcomes.
+
+    The orthant counts of each combination (in `dDict['coeff']` or in the
+    results store) are updated with the pairs of the new observations only
+    (see :func:`appendCounts`), and the coefficients and p-values are
+    computed again from the updated counts (same outcomes as a run from
+    scratch). Dimensions without orthant counts (or with approximate
+    coefficients) are computed from scratch with the settings of their
+    previous run (`dDict['data']['runSettings']`, see :func:`finishRun`).
+    Permutation p-values are computed again with the `permutations` and
+    `seed` of the previous run (same outcomes as a run from scratch); they
+    are removed if these settings were not saved.
+
+    """
+    message('\n>> Appending observations...')
+    numVar = dDict['data']['numVar']
+    prevFinal = dDict['data']['final']
+    prevInocula = dDict['data']['inocula']
+    numOld = prevFinal.shape[0]
+    if final.shape[1] != numVar or final.shape[0] < numOld or not np.array_equal(final[:numOld], prevFinal, equal_nan = True) or \
+       (prevInocula.size > 0 and (inocula.shape[0] < numOld or not np.array_equal(inocula[:numOld], prevInocula, equal_nan = True))):
+        message('Error: Previous observations were modified (new observations must be added at the end). Run nOEN from scratch.')
+        sys.exit()
+    numNew = final.shape[0] - numOld
+    if numNew == 0:
+        message(' > No new observations.')
+        return dDict
+    dDict['data']['final'] = final
+    dDict['data']['inocula'] = inocula
+    ranks, _ = dataRanks(dDict['data'])
+    infoInocula = dDict['data'].get('infoInocula', {})
+    runSettings = dDict['data'].get('runSettings', {})
+    varNames = dDict['data']['varNames']
+    rerun = {}
+    for D_field in sorted(set(dDict['coeff']) | set(dDict.get('store', {})), key = lambda D_field: int(D_field[1:])):
+        d = int(D_field[1:])
+        N = int(2**d/2)
+        flag = infoInocula.get(D_field, False)
+        # Orthant counts of the previous observations (in memory or saved)
+        dCoeff = dDict['coeff'].get(D_field)
+        if dCoeff is not None:
+            infos = [e['coeffInfo'] for e in dCoeff.values() if not isinstance(e['numObs'], list)]
+            hasCounts = all('F' in r and not r.get('numSampled', 0) for r in infos)
+            hasPerm = any('numPerm' in r for r in infos)
+        else:
+            cols = dDict['store'][D_field]
+            hasCounts = 'F' in cols and not ('numSampled' in cols and np.any(cols['numSampled']))
+            hasPerm = 'numPerm' in cols
+        settings = runSettings.get(D_field, {})
+        if not hasCounts:
+            rerun.setdefault((flag, tuple(sorted(settings.items()))), []).append(d)
+            continue
+        permutations = settings.get('permutations', 0)
+        if hasPerm and permutations == 0:
+            message(' > Settings of the permutation test of ' + D_field + ' not saved: permutation p-values removed.')
+        with stage('append'):
+            numComb = math.comb(numVar, d)
+            for start in range(0, numComb, blockSize):
+                combos = np.array(list(combIter(numVar, d, start, start + blockSize))) - 1
+                dF, dUntied = appendCounts(d, final, combos, numOld, inocula if flag else None)
+                if dCoeff is not None:
+                    # Combinations without outcomes (less than 2 previous observations): no previous pairs
+                    prev = [dCoeff.get("_".join(varNames[iCombi])) for iCombi in combos]
+                    prev = [e['coeffInfo'] if e is not None and not isinstance(e['numObs'], list) else {'F': np.zeros(N, dtype = np.int64), 'untied': 0} for e in prev]
+                    F = np.array([r['F'] for r in prev], dtype = np.int64) + dF
+                    untied = np.array([r['untied'] for r in prev], dtype = np.int64) + dUntied
+                else:
+                    F = np.asarray(cols['F'][start:start + len(combos)]) + dF
+                    untied = np.asarray(cols['untied'][start:start + len(combos)]) + dUntied
+                if flag:
+                    numObs = np.count_nonzero(np.all(inocula[:, combos], axis = 2), axis = 0)
+                else:
+                    numObs = np.full(len(combos), final.shape[0], dtype = np.int64)
+                coeffs = coeffDicts(d, F, untied, numObs)
+                if permutations > 0:
+                    addPermutations(d, combos, coeffs, ranks, inocula if flag else None, permutations, settings.get('seed', 0))
+                for iCombi, r in zip(combos, coeffs):
+                    mergeCoeff(dDict, d, iCombi, r)
+        message(' > ' + D_field + ': ' + str(numNew) + ' new observation(s) appended.')
+    for (flag, settings), vD in rerun.items():
+        message(' > Orthant counts of ' + ', '.join('D' + str(d) for d in vD) + ' not saved (or approximate): computed from scratch.')
+        nOEN(dDict, vD, flag, **dict(settings))
+    message('>> Appending done.')
+
     return dDict
 
 
@@ -0,0 +1,59 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 by Eloi Martinez-Rabert.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+
+"""
+Shared fixtures of the nOEN tests (run with `python -m pytest` from the repository folder).
+
+- :func:`synthFiles` writes a synthetic dataset (CSV) and uses temporary `Data` and `Results` folders.
+
+"""
+
+import os
+import sys
+
+import numpy as np
+import pandas as pd
+import pytest
+
+# nOEN modules use flat imports (`from getData import ...`)
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'src', 'nOEN'))
+
+from getData import usePaths
+
+
+def synthDataset(numObs, numVar, seed = 0):
+    """
+    - :input:`numObs` (int). Number of observations.
+    - :input:`numVar` (int). Number of variables.
+    - :input:`seed` (int). Seed of the random generator (default: 0).
+    - :output:`di`, `df` (pd.DataFrame). Inocula (t_0, with absent species) and final abundances (t_max, with ties).
+
+    """
+    rng = np.random.default_rng(seed)
+    z = rng.standard_normal((numObs, 1))
+    final = np.round(z + rng.standard_normal((numObs, numVar)), 1)
+    inocula = (rng.random((numObs, numVar)) < 0.85).astype(int)
+    names = ['S' + str(i) for i in range(numVar)]
+
+    return pd.DataFrame(inocula, columns = names), pd.DataFrame(final, columns = names)
+
+
+@pytest.fixture
+def synthFiles(tmp_path):
+    """
+    - :output:`write` (function). Writes `fileName.csv` and `fileName_t_0.csv` with the first `numObs` rows of a synthetic dataset.
+
+    """
+    for folder in ('Data', 'Results'):
+        os.makedirs(tmp_path / folder)
+
+    def write(fileName, numObs, numVar = 5, totalObs = None, seed = 0):
+        di, df = synthDataset(numObs if totalObs is None else totalObs, numVar, seed)
+        df.iloc[:numObs].to_csv(tmp_path / 'Data' / (fileName + '.csv'), index = False)
+        di.iloc[:numObs].to_csv(tmp_path / 'Data' / (fileName + '_t_0.csv'), index = False)
+
+    with usePaths(str(tmp_path / 'Data') + os.sep, str(tmp_path / 'Results') + os.sep):
+        yield write
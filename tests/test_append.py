@@ -0,0 +1,63 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 by Eloi Martinez-Rabert.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+
+"""
+Tests of :func:`stats.appendObservations` (in memory and with the results store).
+
+"""
+
+import numpy as np
+import pytest
+
+from getData import loadData, readData, saveStore, openStore
+from stats import nOEN, appendObservations
+
+
+def assertSameCoeffs(dictA, dictB, vD):
+    """
+    - :input:`dictA`, `dictB` (dict). Dictionaries with nOEN outcomes (same combinations).
+    - :input:`vD` (list). Dimensions compared.
+
+    """
+    for d in vD:
+        coeffA, coeffB = dictA['coeff']['D' + str(d)], dictB['coeff']['D' + str(d)]
+        assert coeffA.keys() == coeffB.keys()
+        for name, entry in coeffB.items():
+            a, b = coeffA[name]['coeffInfo'], entry['coeffInfo']
+            assert coeffA[name]['numObs'] == entry['numObs'], name
+            assert a.keys() == b.keys(), name
+            for key in b:
+                assert np.array_equal(np.asarray(a[key], dtype = float), np.asarray(b[key], dtype = float), equal_nan = True), (name, key)
+
+
+@pytest.mark.parametrize('infoInocula', [False, True])
+@pytest.mark.parametrize('store', [False, True])
+def test_appendAfterPermutations(synthFiles, infoInocula, store):
+    vD = [2, 3]
+    synthFiles('prev', 40, totalObs = 46)
+    synthFiles('full', 46)
+    prev = nOEN(loadData('prev', save = False), vD, infoInocula, permutations = 200, seed = 3)
+    full = nOEN(loadData('full', save = False), vD, infoInocula, permutations = 200, seed = 3)
+    if store:
+        saveStore(prev, 'prev')
+        prev = openStore('prev')
+    inocula, final, _ = readData('full')
+    appended = appendObservations(prev, inocula, final)
+    # Coefficients and permutation p-values of the new observations (as a run from scratch)
+    assertSameCoeffs(appended, full, vD)
+    assert all('numPerm' in e['coeffInfo'] for e in appended['coeff']['D2'].values())
+
+
+def test_appendWithoutPermutationSettings(synthFiles):
+    synthFiles('prev', 40, totalObs = 46)
+    synthFiles('full', 46)
+    prev = nOEN(loadData('prev', save = False), [2], permutations = 200, seed = 3)
+    del prev['data']['runSettings']
+    inocula, final, _ = readData('full')
+    appended = appendObservations(prev, inocula, final)
+    full = nOEN(loadData('full', save = False), [2])
+    # Stale permutation p-values are removed
+    assertSameCoeffs(appended, full, [2])
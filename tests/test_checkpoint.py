@@ -0,0 +1,49 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 by Eloi Martinez-Rabert.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+
+"""
+Tests of the checkpoints of batch runs (:func:`session.analyseBatch`, `-resume` with several datasets).
+
+"""
+
+import glob
+import os
+
+import pytest
+
+import stats
+from getData import PATHS
+from session import Session, analyseBatch
+from test_append import assertSameCoeffs
+
+
+@pytest.mark.parametrize('workers', [1, 2])
+def test_resumeBatch(synthFiles, monkeypatch, workers):
+    vD = [2, 3]
+    for i, name in enumerate(('a', 'b')):
+        synthFiles(name, 30, seed = i)
+    reference = analyseBatch([Session('a'), Session('b')], vD, permutations = 50, seed = 1)
+    # Interrupted run: checkpoints of `a` complete, half of the checkpoints of `b` lost
+    analyseBatch([Session('a'), Session('b')], vD, permutations = 50, seed = 1, checkpoint = True, checkpointEvery = 0)
+    for name in ('a', 'b'):
+        assert glob.glob(PATHS['results'] + name + '_checkpoint' + os.sep + 'part_*.pkl')
+    parts = sorted(glob.glob(PATHS['results'] + 'b_checkpoint' + os.sep + 'part_*.pkl'))
+    for part in parts[len(parts)//2:]:
+        os.remove(part)
+    computed = []
+    evalItems = stats.evalItems
+
+    def countItems(items, *args):
+        computed.extend(items)
+        return evalItems(items, *args)
+
+    monkeypatch.setattr(stats, 'evalItems', countItems)
+    resumed = analyseBatch([Session('a'), Session('b')], vD, workers = workers, permutations = 50, seed = 1, resume = True)
+    # Only the combinations of the lost checkpoints are computed again (in this process for workers = 1)
+    if workers == 1:
+        assert 0 < len(computed) < sum(len(session.dict['coeff']['D' + str(d)]) for session in resumed for d in vD) / 2
+    for session, ref in zip(resumed, reference):
+        assertSameCoeffs(session.dict, ref.dict, vD)
@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 by Eloi Martinez-Rabert.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+
+"""
+Parity of the D = 2 kernels (Knight's algorithm, :func:`stats.kendallCount`) with the O(n²) pairwise loop of the first release of nOEN.
+
+"""
+
+import math
+from itertools import combinations
+
+import numpy as np
+import pytest
+from scipy.stats import norm
+
+from getData import dataRanks
+from stats import multivarcorr, multivarcorr_batch, kendallCount
+
+
+def baselinePairwise(dataset):
+    """
+    - :input:`dataset` (np.array). Observations (rows) x 2 variables (columns).
+    - :output:`iota`, `iota_pval`, `deltas`, `d_pval`. Coefficients and p-values of the first release of `stats.multivarcorr` (D = 2).
+
+    Pairs tied in any variable are discarded; pairs with a missing value (NaN)
+    are not tied and are counted in the negative side of that variable.
+
+    """
+    numObs = dataset.shape[0]
+    binomial = math.comb(numObs, 2)
+    binomial_untied = binomial
+    paired_Oh = np.array([[[1, 1], [0, 1]], [[0, 0], [1, 0]]])
+    F = np.zeros(2, dtype = int)
+    for jj in range(1, numObs):
+        for ii in range(0, jj):
+            diff = dataset[jj, :] - dataset[ii, :]
+            # Tied data detection
+            if not all(diff):
+                binomial_untied -= 1
+                continue
+            for i in range(2):
+                F[i] += int(np.all(paired_Oh[0, i] == (diff > 0)) or np.all(paired_Oh[1, i] == (diff > 0)))
+    deltas = F / (binomial if binomial_untied == 0 else binomial_untied)
+    var = (2 * (2 * numObs + 5)) / (9 * numObs * (numObs - 1))
+    iota = deltas[0] - deltas[1]
+
+    return (iota, 2 * norm.cdf(-abs(iota / math.sqrt(var))), deltas, 2 * norm.cdf(-abs(deltas / math.sqrt(var))))
+
+
+def synthData(kind, numObs = 60, numVar = 4, seed = 0):
+    """
+    - :input:`kind` (str). 'untied', 'tied' (few distinct values), 'oneTied' (one constant variable) or 'missing' (tied, with NaN).
+    - :output:`data` (np.array). Observations x variables.
+
+    """
+    rng = np.random.default_rng(seed)
+    data = rng.standard_normal((numObs, 1)) + rng.standard_normal((numObs, numVar))
+    if kind != 'untied':
+        data = np.round(data)
+    if kind == 'oneTied':
+        data[:, 0] = 1.0
+    if kind == 'missing':
+        data[rng.random(data.shape) < 0.1] = np.nan
+
+    return data
+
+
+KINDS = ['untied', 'tied', 'oneTied', 'missing']
+
+
+def assertSameOutcomes(outcomes, reference):
+    for value, ref in zip(outcomes, reference):
+        assert np.allclose(value, ref, rtol = 0, atol = 1e-12, equal_nan = True)
+
+
+@pytest.mark.parametrize('kind', KINDS)
+def test_multivarcorrParity(kind):
+    data = synthData(kind)
+    for iCombi in combinations(range(data.shape[1]), 2):
+        iData = data[:, iCombi]
+        iota, iota_pval, deltas, d_pval, _, _ = multivarcorr(2, iData, iData.shape[0])
+        assertSameOutcomes((iota, iota_pval, deltas, d_pval), baselinePairwise(iData))
+
+
+@pytest.mark.parametrize('kind', ['untied', 'tied', 'oneTied'])
+def test_kendallCountParity(kind):
+    data = synthData(kind)
+    for iCombi in combinations(range(data.shape[1]), 2):
+        F, numUntied = kendallCount(data[:, iCombi])
+        _, _, deltas, _ = baselinePairwise(data[:, iCombi])
+        assert np.allclose(F / (math.comb(data.shape[0], 2) if numUntied == 0 else numUntied), deltas, rtol = 0, atol = 1e-12)
+
+
+@pytest.mark.parametrize('kind', KINDS)
+@pytest.mark.parametrize('useInocula', [False, True])
+def test_batchRanksParity(kind, useInocula):
+    data = synthData(kind)
+    inocula = (np.random.default_rng(1).random(data.shape) < 0.8).astype(int) if useInocula else None
+    # Dense ranks and tied pairs of each variable, as in a nOEN run
+    ranks, tiePairs = dataRanks({'final': data})
+    combos = np.array(list(combinations(range(data.shape[1]), 2)))
+    iota, iota_pval, deltas, d_pval, _, _, numObs = multivarcorr_batch(2, ranks, combos, inocula, tiePairs = tiePairs)
+    for c, iCombi in enumerate(combos):
+        iData = data[:, iCombi] if inocula is None else data[np.all(inocula[:, iCombi] != 0, axis = 1)][:, iCombi]
+        assert numObs[c] == iData.shape[0]
+        assertSameOutcomes((iota[c], iota_pval[c], deltas[c], d_pval[c]), baselinePairwise(iData))
@@ -0,0 +1,47 @@
+# -*- coding: utf-8 -*-
+# Copyright 2023 by Eloi Martinez-Rabert.  All rights reserved.
+# This code is part of the Python-dna distribution and governed by its
+# license.  Please see the LICENSE.txt file that should have been included
+# as part of this package.
+
+"""
+Tests of the memory cap of nOEN runs (see :func:`stats.setMemoryCap`).
+
+"""
+
+import tracemalloc
+
+import numpy as np
+import pytest
+
+from getData import loadData
+from stats import nOEN, setMemoryCap
+from test_append import assertSameCoeffs
+
+
+@pytest.fixture
+def memoryCap():
+    """
+    - :output:`setCap` (function). Sets the memory cap (MB) of the test; no cap afterwards.
+
+    """
+    yield setMemoryCap
+    setMemoryCap(0)
+
+
+@pytest.mark.parametrize('lattice', [False, True])
+def test_peakMemoryUnderCap(synthFiles, memoryCap, lattice):
+    capMB = 8
+    synthFiles('big', 1500)
+    ref = nOEN(loadData('big', save = False), [2, 3, 4])
+    memoryCap(capMB)
+    dDict = loadData('big', save = False)
+    tracemalloc.start()
+    try:
+        dDict = nOEN(dDict, [2, 3, 4], lattice = lattice)
+        peakMB = tracemalloc.get_traced_memory()[1] / 2**20
+    finally:
+        tracemalloc.stop()
+    assert peakMB < capMB
+    # Same outcomes as without cap
+    assertSameCoeffs(dDict, ref, [2, 3, 4])